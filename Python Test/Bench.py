@@ -0,0 +1,169 @@
+"""
+Dispenser benchmark suite (headless, no Kivy / GPIO).
+  alarm-fire latency   real-clock scheduler, actual vs scheduled fire time
+  pipeline             a simulated year of alarms → moves → popups → PIR
+  motor move time      per move, from the simulated stepper
+  memory per job       tracemalloc over 10k scheduled alarms
+  UI-thread blocking   time the popup side of an alarm holds its thread
+  dose-log query       missed doses for one slot over 90 days
+  coalescing           alarms a minute apart → one popup; a merged session
+                       snoozed comes back as one pass; snooze storm
+Each line is checked against BUDGET; anything over prints REGRESSION.
+
+usage: python Bench.py
+"""
+import os, random, statistics, tempfile, threading, time, tracemalloc
+
+import dose_log, sim
+from alarm_scheduler import AlarmScheduler, DAYS
+
+BUDGET = {
+    "fire_p99_ms":   5.0,
+    "move_max_ms":   250.0,
+    "job_bytes":     2048,
+    "ui_block_ms":   2.0,
+    "year_wall_s":   5.0,
+    "query_ms":      20.0,
+    "snooze_jobs":   14,
+}
+
+results = []
+
+def check(name, value, key, unit):
+    bad = value > BUDGET[key]
+    results.append(bad)
+    print(f"{name:28} {value:10.2f} {unit:3}  (budget {BUDGET[key]:g})"
+          f"{'  REGRESSION' if bad else ''}")
+
+def pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(p / 100 * len(xs)))]
+
+def bench_fire_latency(n=40, spread=2.0):
+    sched = AlarmScheduler()
+    sched.start()
+    late, done = [], threading.Event()
+    t0 = time.time()
+    for _ in range(n):
+        due = t0 + 0.1 + random.random() * spread
+        sched.once(due, lambda d=due: (late.append(time.time() - d),
+                                       len(late) == n and done.set()))
+    done.wait(spread + 2)
+    sched.stop()
+    check("alarm fire latency p50", pct(late, 50) * 1000, "fire_p99_ms", "ms")
+    check("alarm fire latency p99", pct(late, 99) * 1000, "fire_p99_ms", "ms")
+
+def week_plan(box):
+    for day in DAYS:
+        for period, at in (("Morning", "08:00"), ("Evening", "20:00")):
+            disp = "08:00 AM" if period == "Morning" else "08:00 PM"
+            box.alarms.every(day, at, box.trigger_alarm, day, disp, period)
+
+def bench_pipeline(days=365):
+    log = dose_log.DoseLog(os.path.join(tempfile.mkdtemp(), "doses.log"))
+    box, popups = sim.build(log=log)
+    week_plan(box)
+    t0 = time.perf_counter()
+    box.alarms.run_until(box.alarms.clock.time() + days * 86400)
+    wall = time.perf_counter() - t0
+    open_ = sum(1 for p in popups if p.closed_at is None)
+    print(f"{'pipeline':28} {len(popups)} alarms, {len(box.motor.backend.moves)} moves, "
+          f"{open_} popups left open")
+    hub = box.motion
+    print(f"{'PIR edges / events / kept':28} {hub.raw_edges} / {hub.events} / "
+          f"{len(hub.reactions)}  (shown→motion avg "
+          f"{statistics.mean(r.shown_to_motion_s for r in hub.reactions):.1f} s)")
+    check(f"{days} virtual days wall time", wall, "year_wall_s", "s")
+    moves = [m[3] * 1000 for m in box.motor.backend.moves]
+    print(f"{'motor move time avg':28} {statistics.mean(moves):10.2f} ms")
+    check("motor move time max", max(moves), "move_max_ms", "ms")
+    now = box.alarms.clock.time()
+    t = time.perf_counter()
+    missed = log.missed(slot=5, days=90, now=now)
+    check(f"dose-log query ({len(log)} recs)", (time.perf_counter() - t) * 1000, "query_ms", "ms")
+    assert not missed and sum(1 for _ in log.doses(now=now)) == len(popups)
+    log.close()
+
+def bench_memory(n=10000):
+    sched = AlarmScheduler()
+    tracemalloc.start()
+    base = tracemalloc.take_snapshot()
+    for i in range(n):
+        day = DAYS[i % 7]
+        sched.every(day, "%02d:%02d" % (i % 24, i % 60), print, day, "x", "Morning")
+    used = sum(s.size_diff for s in tracemalloc.take_snapshot().compare_to(base, "filename"))
+    tracemalloc.stop()
+    check("memory per scheduled job", used / n, "job_bytes", "B")
+
+def bench_ui_block(n=200):
+    """Popup side of each alarm (show + alert on + dismiss), wall clock."""
+    box, popups = sim.build(react_s=None)
+    show = box.show
+    block = []
+    def timed_show(session):
+        t = time.perf_counter()
+        show(session)
+        popups[-1].stop()
+        block.append(time.perf_counter() - t)
+    box.show = timed_show
+    for i in range(n):
+        box.trigger_alarm(DAYS[i % 7], "08:00 AM", "Morning")
+    check("UI-thread block per alarm", max(block) * 1000, "ui_block_ms", "ms")
+
+def bench_coalesce(weeks=4, snoozes=2000):
+    """Two doses a minute apart every day, then the same popup snoozed
+    over and over: job count must stay bounded."""
+    box, popups = sim.build()
+    for day in DAYS:
+        box.alarms.every(day, "08:00", box.trigger_alarm, day, "08:00 AM", "Morning")
+        box.alarms.every(day, "08:01", box.trigger_alarm, day, "08:01 AM", "Evening")
+    box.alarms.run_until(box.alarms.clock.time() + weeks * 7 * 86400)
+    plays = sum(1 for e in box.sound.log if e[1] == "play")
+    print(f"{'coalescing':28} {weeks * 14} alarms → {len(popups)} popups, "
+          f"{plays} audio starts")
+    assert len(popups) == plays == weeks * 7
+    assert all(sorted(p.session.slots) == [2 * i, 2 * i + 1]
+               for p in popups for i in [p.session.slots[0] // 2])
+
+    box, popups = sim.build(react_s=None)                   # snooze a merged session
+    visits, visit = [], box.motor.visit
+    box.motor.visit = lambda slots, *a, **kw: (visits.append(sorted(slots)), visit(slots, *a, **kw))[1]
+    box.trigger_alarm("Monday", "08:00 AM", "Morning")
+    box.trigger_alarm("Monday", "08:01 AM", "Evening")
+    popups[-1].snooze()
+    box.alarms.run_until(box.alarms.clock.time() + 301)
+    assert visits == [[2], [3], [2, 3]] and len(popups) == 2, visits
+    popups[-1].snooze()
+    box.trigger_alarm("Monday", "08:00 AM", "Morning")     # slot 2 back early
+    popups[-1].stop()
+    box.alarms.run_until(box.alarms.clock.time() + 301)
+    assert visits[3:] == [[2], [3]] and len(box.snoozes) == 0, visits
+
+    box, popups = sim.build(react_s=None)                   # old popup's Stop lands late
+    box.trigger_alarm("Monday", "08:00 AM", "Morning")
+    old = popups[-1]
+    box.snooze(old.session)                                 # ran, its Stop still queued
+    box.trigger_alarm("Tuesday", "08:00 AM", "Morning")
+    old.stop()
+    assert box.session is popups[-1].session and box.led.is_lit and box.sound.playing
+    assert box.snooze(old.session) is None
+
+    box, popups = sim.build(react_s=None)
+    week_plan(box)
+    base = len(box.alarms.jobs())
+    box.trigger_alarm("Monday", "08:00 AM", "Morning")
+    box.trigger_alarm("Monday", "08:01 AM", "Evening")
+    peak = 0
+    for _ in range(snoozes):
+        popups[-1].snooze()
+        peak = max(peak, len(box.alarms.jobs()) - base)
+        box.alarms.run_until(box.alarms.clock.time() + 301)
+    check(f"extra jobs after {snoozes} snoozes", peak, "snooze_jobs", "")
+
+if __name__ == '__main__':
+    bench_fire_latency()
+    bench_pipeline()
+    bench_memory()
+    bench_ui_block()
+    bench_coalesce()
+    print("FAIL" if any(results) else "all within budget")
@@ -0,0 +1,165 @@
+"""
+Fleet sync load test.
+Spawns `fleet.py serve` as its own process, connects N simulated devices
+from one asyncio loop (each with a SimClock AlarmScheduler and the
+trigger_alarm day/period → slot mapping from GUI Dev.py), then measures:
+  1. connect time
+  2. full week push (14 alarms/device) until every device has applied it
+  3. one-alarm delta per device
+  4. one virtual week of firing on every device
+Before that, one device on its own: a malformed delta changes nothing,
+and pushed alarms and their version come back from its ScheduleStore
+after a restart, so a reboot needs no resync (a manager restart does).
+
+usage: python FleetLoadTest.py [devices=10000]
+"""
+import asyncio, os, resource, subprocess, sys, tempfile, time
+from datetime import datetime
+
+import fleet, schedule_store
+from alarm_scheduler import AlarmScheduler, SimClock, DAYS
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+WEEK = 7 * 86400
+RAMP = 250                                          # devices connecting at once
+START = datetime(2025, 1, 5).timestamp()            # a Sunday
+
+class SimDevice(fleet.FleetDevice):
+    """Headless stand-in for one PillSchedulerApp."""
+    def __init__(self, i):
+        super().__init__(f"dev{i:05}", AlarmScheduler(SimClock(START)), self.trigger)
+        self.slots = []
+
+    def trigger(self, day, disp_time, period):     # same mapping as trigger_alarm
+        self.slots.append(DAYS.index(day) * 2 + (0 if period == "Morning" else 1))
+
+def check_device(tmp):
+    st = schedule_store.ScheduleStore(os.path.join(tmp, "alarms.db"))
+    dev = fleet.FleetDevice("dev", AlarmScheduler(SimClock(START)), print, store=st)
+    dev.apply({"e": "m1", "v": 1, "full": True, "del": [],
+               "set": [[i, d, "08:00", None, [DAYS[d], "08:00", "Morning"]]
+                       for i, d in enumerate(range(7))]})
+    for bad in ({"v": 2, "set": [[0, 1, "09:00", None, []]]},          # no "del"
+                {"v": 2, "del": [], "set": [[0, 1, "09:00"]]},          # short entry
+                {"v": 2, "del": [], "set": [[0, 1, "25:00", None, []]]}):
+        try:
+            dev.apply(bad)
+        except (KeyError, TypeError, ValueError):
+            pass
+        else:
+            raise AssertionError(f"accepted {bad}")
+    assert dev.v == 1 and len(dev.jobs) == 7 and dev.jobs[0].at == (8, 0)
+    dev.apply({"e": "m1", "v": 2, "del": [6], "set": [[0, 0, "09:00", None, ["Sunday", "09:00", "Morning"]]]})
+    st.close()
+    st = schedule_store.ScheduleStore(os.path.join(tmp, "alarms.db"))   # reboot
+    dev = fleet.FleetDevice("dev", AlarmScheduler(SimClock(START)), print, store=st)
+    assert sorted(dev.jobs) == [0, 1, 2, 3, 4, 5] and dev.jobs[0].at == (9, 0)
+    assert (dev.e, dev.v) == ("m1", 2)                                  # no resync needed
+    assert st.load_into(AlarmScheduler(SimClock(START)), print)[0] == []
+    st.close()
+    print("device    bad deltas rejected, pushed alarms and version restored from the store")
+
+async def check_resume(tmp):
+    """A rebooted device resumes from its saved version; a restarted
+    manager (new epoch) sends it a full sync."""
+    addr = os.path.join(tmp, "resume.sock")
+
+    async def boot(mgr):                                # one device run, until in step
+        st = schedule_store.ScheduleStore(os.path.join(tmp, "resume.db"))
+        dev = fleet.FleetDevice("dev", AlarmScheduler(SimClock(START)), print, store=st)
+        task = asyncio.ensure_future(dev.run(addr))
+        await wait_for([dev], lambda d: (d.e, d.v) == (mgr.epoch, mgr.devs["dev"].version))
+        await asyncio.sleep(0.05)                       # room for an unwanted resync
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        st.close()
+        assert len(dev.jobs) == 14
+        return dev.applied
+
+    applied = []
+    for _ in range(2):                                  # manager, then a restarted one
+        mgr = fleet.FleetManager(flush_s=0.01)
+        await mgr.serve(addr)
+        for op in week_ops("dev"):
+            mgr.set_alarm(op["device"], op["id"], op["day"], op["at"], args=op["args"])
+        applied += [await boot(mgr), await boot(mgr)]   # first boot, then a reboot
+        await asyncio.sleep(0.05)
+        await mgr.close()
+    assert applied == [1, 0, 1, 0], applied
+    print("device    reboot resumes from its saved version, manager restart resyncs")
+
+async def ping(addr):
+    while True:
+        try:
+            return await fleet.admin(addr, [])
+        except OSError:
+            await asyncio.sleep(0.05)
+
+async def wait_for(devs, cond, timeout=120):
+    t0 = time.perf_counter()
+    while not all(cond(d) for d in devs):
+        if time.perf_counter() - t0 > timeout:
+            raise TimeoutError(f"{sum(map(cond, devs))}/{len(devs)} devices done")
+        await asyncio.sleep(0.01)
+    return time.perf_counter() - t0
+
+def week_ops(dev_id):
+    for d, day in enumerate(DAYS):
+        for p, (period, at) in enumerate((("Morning", "08:00"), ("Evening", "20:00"))):
+            yield {"op": "set", "device": dev_id, "id": d * 2 + p, "day": d, "at": at,
+                   "args": [day, at, period]}
+
+async def main(addr):
+    devs = [SimDevice(i) for i in range(N)]
+
+    t0 = time.perf_counter()
+    conns = []
+    for i in range(0, N, RAMP):                     # ramp up like a real fleet boot
+        conns += [asyncio.ensure_future(d.run(addr)) for d in devs[i:i + RAMP]]
+        while (await ping(addr))["connected"] < len(conns):
+            await asyncio.sleep(0.02)
+    print(f"connect   {N} devices           {time.perf_counter()-t0:7.2f} s")
+
+    t0 = time.perf_counter()
+    await fleet.admin(addr, (op for d in devs for op in week_ops(d.device_id)))
+    await wait_for(devs, lambda d: len(d.jobs) == 14)
+    print(f"push      {N*14} alarms            {time.perf_counter()-t0:7.2f} s")
+
+    t0 = time.perf_counter()
+    await fleet.admin(addr, ({"op": "set", "device": d.device_id, "id": 0, "day": 0,
+                              "at": "09:00", "args": ["Sunday", "09:00", "Morning"]}
+                             for d in devs))
+    await wait_for(devs, lambda d: d.jobs[0].at == (9, 0))
+    print(f"delta     1 alarm/device          {time.perf_counter()-t0:7.2f} s")
+
+    t0 = time.perf_counter()
+    for d in devs:
+        d.sched.run_until(START + WEEK)
+    bad = [d.device_id for d in devs if sorted(d.slots) != list(range(14))]
+    print(f"simulate  1 week on every device  {time.perf_counter()-t0:7.2f} s"
+          f"   {'OK' if not bad else f'{len(bad)} devices wrong'}")
+
+    for c in conns:
+        c.cancel()
+
+if __name__ == "__main__":
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    if N + 64 > hard:
+        sys.exit(f"need ~{N} file descriptors, limit is {hard}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        check_device(tmp)
+        asyncio.run(check_resume(tmp))
+        addr = os.path.join(tmp, "fleet.sock")
+        here = os.path.dirname(os.path.abspath(__file__))
+        mgr = subprocess.Popen([sys.executable, os.path.join(here, "fleet.py"), "serve", addr],
+                               preexec_fn=lambda: resource.setrlimit(
+                                   resource.RLIMIT_NOFILE, (hard, hard)))
+        try:
+            while not os.path.exists(addr):
+                time.sleep(0.05)
+            asyncio.run(main(addr))
+        finally:
+            mgr.terminate()
+            mgr.wait()
@@ -5,117 +5,160 @@ GUI pill-box with 14 slots • LED/Audio alarm • stepper motor
 + Settings → Debug  (tests LED / Audio / manual slot select)
 """
 
+import startup                          # first: everything below is timed
+boot = startup.StartupProfiler()
+
 from kivy.app import App
-from kivy.uix.screenmanager import ScreenManager, Screen
+from kivy.uix.screenmanager import Screen
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.gridlayout import GridLayout
-from kivy.uix.label import Label
-from kivy.uix.button import Button
 from kivy.uix.popup import Popup
 from kivy.clock import Clock
-from kivy.graphics import Color, Rectangle
-
-import schedule, threading, os, time
-from datetime import datetime, timedelta
-
-# ───────── optional hardware ─────────
-try:
-    from gpiozero import LED, DigitalOutputDevice, MotionSensor
-    led = LED(14)                       # BCM 14
-    pir = MotionSensor(4)
-    DIR_PIN, STEP_PIN = 21, 20          # BCM pins
-    dir_pin  = DigitalOutputDevice(DIR_PIN)
-    step_pin = DigitalOutputDevice(STEP_PIN)
-    HW = True
-except Exception:
-    led = None; pir = None; HW = False
-
-try:
-    import pygame
-    pygame.mixer.init()
-    ALARM_FILE = "sd-pill-dispenser/Python Test/Good place.mp3"            # put an MP3/WAV here
-except Exception:
-    pygame = None
-
-# ───────── 14-slot pattern (sum = 200 steps) ─────────
-STEPS_PER_SLOT = [14,14,14,15,15,14,14,14,14,14,15,15,14,14]
-current_slot   = 0   # 0 = Sunday-Morning
-
-def move_steps(n, forward=True, delay=0.002):
-    """Pulse STEP pin n times."""
-    if not HW:
-        print(f"[sim] {n} steps {'fwd' if forward else 'rev'}")
-        time.sleep(n * delay * 2)
-        return
-    dir_pin.value = 1 if forward else 0
-    for _ in range(n):
-        step_pin.on(); time.sleep(delay)
-        step_pin.off(); time.sleep(delay)
+from kivy.metrics import sp
+
+import os, socket, time
+from datetime import datetime
+
+from alarm_scheduler import AlarmScheduler, DAYS
+from dispenser import Dispenser
+import schedule_store, fleet, sensors, dose_log, escalation, metrics, timesync
+from ui_async import run_io, run_bg, FrameMonitor
+from idle import IdleManager
+import theme
+from theme import Title, Text, CachedLabel, CachedButton, FlashPanel
+import stepper, audio, motion, calibration, leds
+
+boot.mark("imports")
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# ───────── optional hardware (opened by open_hardware, off the UI thread) ─────────
+LED_PIN, PIR_PIN  = 14, 4           # BCM
+DIR_PIN, STEP_PIN = 21, 20          # BCM pins
+EN_PIN = None                       # driver EN (active low) if wired, e.g. 16
+PRN_PINS = None                     # two-carousel model: as-needed (DIR, STEP, EN), e.g. (19, 26, None)
+led = pir = None
+
+ALARM_FILE = os.path.join(HERE, "Good place.mp3")    # put an MP3/WAV here
+sound = audio.AlarmAudio(lazy=True) # no-op if pygame / mixer missing
+
+# ───────── 14-slot carousel ─────────
+# saved step table; home/slot mark sensors are attached with the hardware
+calib = calibration.Calibrator()
+
+# one worker owns the motor + position (0 = Sunday-Morning); all calls
+# below only queue a command and return a Future (held until the
+# stepper backend is open)
+motor = motion.MotionController(None, calib=calib)
+if PRN_PINS:
+    motor.add(motion.Carousel("prn"))   # moved with goto(slot, "prn") / goto_many
 
 def rotate_to_slot(target:int):
-    """Rotate forward to reach target slot (0-13)."""
-    global current_slot
-    diff = (target - current_slot) % 14
-    for i in range(diff):
-        seg = (current_slot + i) % 14
-        move_steps(STEPS_PER_SLOT[seg], True)
-    current_slot = target
-    print("[motor] at slot", current_slot)
+    """Queue one accel/cruise/decel move to target slot (0-13)."""
+    return motor.goto(target)
 
 def reset_motor():
-    rotate_to_slot(0)
-
-# ── add global jog flag ─────────────────────────────────────────────
-_jog_event = threading.Event()   # cleared => stop
-
-def _jog_motor(forward: bool):
-    """Spin continuously until _jog_event is cleared."""
-    while not _jog_event.is_set():
-        move_steps(1, forward, delay=0.002)   # 1 step at a time, ~500 Hz max
+    return motor.home()             # closed loop if a home sensor is fitted
 
 
 # ───────── LED / audio helpers ─────────
+lights = None                       # leds.LedEngine, started by open_hardware
+
 def audio_on():
-    if pygame and os.path.exists(ALARM_FILE):
-        pygame.mixer.music.load(ALARM_FILE)
-        pygame.mixer.music.play(-1)
+    sound.play(ALARM_FILE)          # loops; ignored if already sounding
 
 def audio_off():
-    if pygame and pygame.mixer.get_init():
-        pygame.mixer.music.stop()
+    sound.stop()
 
 # ───────── alarm trigger ─────────
-days = ["Sunday","Monday","Tuesday","Wednesday","Thursday","Friday","Saturday"]
-
-def trigger_alarm(day, disp_time, period):
-    slot = days.index(day) * 2 + (0 if period == "Morning" else 1)
-    threading.Thread(target=rotate_to_slot, args=(slot,), daemon=True).start()
-    Clock.schedule_once(lambda dt: AlarmPopup(day, disp_time).open(), 0)
+days = DAYS
+alarms = AlarmScheduler()           # heap + condition, no 1 Hz polling
+clock_svc = timesync.TimeService(alarms)    # wall-clock steps, NTP + RTC sync
+store = doses = None                # SQLite + dose log, opened by _arm_alarms (I/O worker)
+FLEET_ADDR = os.environ.get("PILLBOX_FLEET")    # socket path or host:port; unset = standalone
+METRICS_ADDR = os.environ.get("PILLBOX_METRICS", f"127.0.0.1:{metrics.PORT}")   # "off" = none
+
+# alarm → carousel → popup pipeline (Kivy-free, see sim.py for headless runs)
+box = Dispenser(alarms, motor, sound, ALARM_FILE,
+                show=lambda session:
+                    Clock.schedule_once(lambda dt: (idle.wake(), AlarmPopup(session).open()), 0))
+
+# unanswered alarm → louder → repeat → caregiver; sinks from
+# PILLBOX_WEBHOOK / PILLBOX_SMTP + PILLBOX_MAIL_TO / PILLBOX_MQTT
+notifier = escalation.Notifier(escalation.sinks_from_env(os.environ))
+box.escalate = escalation.Escalator(alarms, sound, ALARM_FILE, notifier, run=run_io)
+
+trigger_alarm = box.trigger_alarm      # jobs must point at it to be merged
+
+# screen / mixer / driver power-down between alarms
+idle = IdleManager(alarms, sound, motor, busy=lambda: box.session is not None)
+
+def open_hardware():
+    """gpiozero pins, stepper backend, mark sensors, PIR and mixer.
+    Runs once on the I/O worker from on_start, before alarms are armed."""
+    global led, pir, lights
+    t0 = time.perf_counter()
+    enable = None
+    try:
+        from gpiozero import PWMLED, DigitalOutputDevice, MotionSensor
+        led = PWMLED(LED_PIN)
+        pir = MotionSensor(PIR_PIN)
+        dir_pin  = DigitalOutputDevice(DIR_PIN)
+        step_pin = DigitalOutputDevice(STEP_PIN)
+        enable   = (DigitalOutputDevice(EN_PIN, active_high=False, initial_value=True)
+                    if EN_PIN is not None else None)
+        hw = True
+    except Exception:
+        led = None; pir = None; hw = False
+    if hw:
+        calib.home, calib.slots = calibration.open_sensors()
+    motor.enable = enable
+    motor.set_backend(stepper.open_backend(DIR_PIN, STEP_PIN, dir_pin, step_pin) if hw
+                      else stepper.SimBackend())
+    if PRN_PINS:
+        open_carousel("prn", *PRN_PINS, hw=hw)
+    lights = leds.LedEngine(led, pwm=True, default=leds.ESCALATE)   # own timer thread
+    box.led    = lights if led else None
+    box.escalate.led = box.led
+    box.motion = sensors.MotionHub(pir) if pir else None    # debounced PIR events
+    sound.reopen()
+    sound.preload(ALARM_FILE)       # decode once, off the UI thread
+    boot.note("hardware", time.perf_counter() - t0)
+
+def open_carousel(name, dir_gpio, step_gpio, en_gpio=None, hw=True):
+    car = motor.carousels[name]
+    if hw:
+        from gpiozero import DigitalOutputDevice
+        car.enable = (DigitalOutputDevice(en_gpio, active_high=False, initial_value=True)
+                      if en_gpio is not None else None)
+        backend = stepper.open_backend(dir_gpio, step_gpio, DigitalOutputDevice(dir_gpio),
+                                       DigitalOutputDevice(step_gpio),
+                                       getattr(motor.backend, "pi", None))
+    else:
+        backend = stepper.SimBackend()
+    motor.set_backend(backend, name)
 
 # ───────── Alarm popup ─────────
+FLASH_BG = (.12, .12, .32, 1)
+
 class AlarmPopup(Popup):
-    def __init__(self, day, when, **kw):
+    def __init__(self, session, **kw):
         kw.setdefault("auto_dismiss", False)
         super().__init__(**kw)
+        metrics.POPUP_LATE.observe(max(0.0, alarms.clock.time() - session.opened))
         self.title      = "⏰  Medicine Reminder  ⏰"
         self.size_hint  = (.8, .5)
         self.flash_on   = False
 
         # layout
-        root = BoxLayout(orientation="vertical", padding=10, spacing=10)
-        with root.canvas.before:
-            self.bg = Color(.05, .05, .20, 1)
-            self.rect = Rectangle(size=root.size, pos=root.pos)
-        root.bind(size=self._upd_rect, pos=self._upd_rect)
-
-        self.msg = Label(text=f"[b]Time to take your medicine[/b]\n{day}  {when}",
-                         markup=True, font_size="20sp",
-                         halign="center", color=(1,1,1,1))
+        root = self.panel = FlashPanel(orientation="vertical", padding=10, spacing=10)
+
+        self.session = session
+        self.msg = Text(text=self._text(), markup=True, halign="center")
         root.add_widget(self.msg)
 
         row = BoxLayout(size_hint=(1,.3), spacing=10)
-        snooze = Button(text="Snooze 5 min", font_size="18sp")
-        stop   = Button(text="Stop",        font_size="18sp")
+        snooze = CachedButton(text="Snooze 5 min", font_size="18sp", role="plain")
+        stop   = CachedButton(text="Stop",        font_size="18sp", role="plain")
         snooze.bind(on_press=self._snooze)
         stop  .bind(on_press=self._stop)
         row.add_widget(snooze)
@@ -123,65 +166,55 @@ class AlarmPopup(Popup):
         root.add_widget(row)
 
         self.content = root
+        session.changed = lambda: Clock.schedule_once(self._refresh)   # dose merged in
 
         # start flashing & hardware
         self.ev = Clock.schedule_interval(self._flash, 0.7)
         self._start_hardware()
 
-        if pir:
-            pir.when_motion = self._pir_stop
+        # own PIR subscription per popup, drained on the Kivy thread
+        self._pir = None
+        if box.motion:
+            self.shown_t = box.motion.clock()
+            self._pir = box.motion.subscribe(self._pir_stop,
+                                             post=lambda f: Clock.schedule_once(f))
+
+    def _text(self):
+        return "[b]Time to take your medicine[/b]\n" + "\n".join(self.session.lines())
 
-    # drawing helpers
-    def _upd_rect(self, inst, val):
-        self.rect.size = inst.size
-        self.rect.pos  = inst.pos
+    def _refresh(self, _dt):
+        self.msg.text = self._text()
 
     def _flash(self, _dt):
         self.flash_on = not self.flash_on
-        self.bg.rgba  = (.12,.12,.32,1) if self.flash_on else (.05,.05,.20,1)
+        self.panel.bg = FLASH_BG if self.flash_on else theme.BG
         self.msg.opacity = 0.6 if self.flash_on else 1
-        if led:
-            led.on() if self.flash_on else led.off()
 
+    # device I/O never runs on the Kivy thread
     def _start_hardware(self):
-        if ALARM_FILE:
-            try:
-                pygame.mixer.music.load(ALARM_FILE)
-                pygame.mixer.music.play(-1)        # loop until Stop/Snooze
-            except Exception as e:
-                print("Audio error:", e)
-        if led: led.on()
-        audio_on()
-
-    def _stop_hardware(self):
-        if pygame and pygame.mixer.get_init():
-            pygame.mixer.music.stop()
-        if led: led.off()
-        audio_off()
+        run_io(box.alert_on, self.session)  # LED + audio until Stop/Snooze
+
+    def _stop_hardware(self, how):
+        run_io(box.alert_off, self.session, how)    # only ends this popup's session
 
     # button callbacks
     def _snooze(self, *_):
-        nxt = datetime.now() + timedelta(minutes=5)
-        schedule.every().day.at(nxt.strftime("%H:%M")).do(
-            trigger_alarm,
-            nxt.strftime("%A"),
-            nxt.strftime("%I:%M %p"),
-            "Evening" if nxt.hour >= 12 else "Morning"
-        )
-        self._stop()
+        run_io(box.snooze, self.session)    # scheduler + SQLite write
+        self._stop(how=None)
 
-    def _stop(self, *_):
+    def _stop(self, *_, how="stop"):
         if self.ev.is_triggered:
             self.ev.cancel()
-        self._stop_hardware()
-        if pir:
-            pir.when_motion = None          # disarm PIR callback
+        self._stop_hardware(how)
+        if self._pir:
+            self._pir.close()               # disarm this popup's PIR feed
+            self._pir = None
         self.dismiss()
 
-    # ---- NEW helper called by PIR ----
-    def _pir_stop(self):
-        # run in the Kivy thread
-        Clock.schedule_once(lambda dt: self._stop())
+    # ---- PIR event, already on the Kivy thread ----
+    def _pir_stop(self, ev):
+        self._stop(how="pir")
+        box.motion.record_reaction(self.shown_t, ev)
 
 # ───────── Home screen ─────────
 class HomeScreen(Screen):
@@ -190,58 +223,46 @@ class HomeScreen(Screen):
         self.day_idx = 0
 
         root = BoxLayout(orientation="vertical", padding=10, spacing=10)
-        with root.canvas.before:
-            Color(.05,.05,.20,1)
-            self.rect = Rectangle(size=root.size, pos=root.pos)
-        root.bind(size=self._upd_rect, pos=self._upd_rect)
-
-        root.add_widget(Label(text="Pill Container Scheduler",
-                              font_size="24sp", color=(1,1,1,1), size_hint=(1,.15)))
+        root.add_widget(Title(text="Pill Container Scheduler", size_hint=(1,.15)))
 
-        self.clock = Label(font_size="18sp", color=(1,1,1,1), size_hint=(1,.1))
+        self.clock = Text(font_size="18sp", size_hint=(1,.1))
         root.add_widget(self.clock)
-        Clock.schedule_interval(lambda dt: self._update_clock(), 1)
+        idle.interval(lambda dt: self._update_clock(), 1)   # paused while idle
 
         # day nav
         nav = BoxLayout(size_hint=(1,.15))
-        left = Button(text="<", background_color=(.2,.4,.8,1))
-        right= Button(text=">", background_color=(.2,.4,.8,1))
+        left = CachedButton(text="<")
+        right= CachedButton(text=">")
         left .bind(on_press=lambda *_: self._change_day(-1))
         right.bind(on_press=lambda *_: self._change_day( 1))
-        self.day_lab = Label(text=days[self.day_idx], font_size="20sp", color=(1,1,1,1))
+        self.day_lab = CachedLabel(text=days[self.day_idx])
         nav.add_widget(left); nav.add_widget(self.day_lab); nav.add_widget(right)
         root.add_widget(nav)
 
         # morning / evening buttons
         tod = BoxLayout(size_hint=(1,.2), spacing=10)
         for period in ("Morning", "Evening"):
-            tod.add_widget(Button(text=period,
-                                  background_color=(.1,.6,.8,1),
-                                  on_press=lambda inst,p=period:self._goto_time(p)))
+            tod.add_widget(CachedButton(text=period, role="period",
+                                   on_press=lambda inst,p=period:self._goto_time(p)))
         root.add_widget(tod)
 
         # bottom row
         row = BoxLayout(size_hint=(1,.15), spacing=10)
-        row.add_widget(Button(text="Test Alarm",
-                              background_color=(.3,.7,.9,1),
-                              on_press=lambda *_:
-                                  trigger_alarm(self.day_lab.text,
-                                                datetime.now().strftime("%I:%M %p"),
-                                                "Evening" if datetime.now().hour>=12 else "Morning")))
-        row.add_widget(Button(text="Reset Motor",
-                              background_color=(.3,.5,.9,1),
-                              on_press=lambda *_:
-                                  threading.Thread(target=reset_motor, daemon=True).start()))
-        row.add_widget(Button(text="Settings",
-                              background_color=(.2,.5,.7,1),
-                              on_press=lambda *_: setattr(self.manager,"current","settings")))
+        row.add_widget(CachedButton(text="Test Alarm", role="action",
+                               on_press=lambda *_: self._test_alarm()))
+        row.add_widget(CachedButton(text="Reset Motor", role="motor",
+                               on_press=lambda *_:
+                                   reset_motor()))
+        row.add_widget(CachedButton(text="Settings", role="menu",
+                               on_press=lambda *_: setattr(self.manager,"current","settings")))
         root.add_widget(row)
 
         self.add_widget(root)
 
-    def _upd_rect(self, inst, val):
-        self.rect.size = inst.size
-        self.rect.pos  = inst.pos
+    def _test_alarm(self):
+        now = datetime.now()
+        run_io(trigger_alarm, self.day_lab.text, now.strftime("%I:%M %p"),     # scheduler lock,
+               "Evening" if now.hour >= 12 else "Morning")                     # dose log, SQLite
 
     def _update_clock(self):
         self.clock.text = datetime.now().strftime("%I:%M:%S %p")
@@ -262,19 +283,15 @@ class TimeScreen(Screen):
         self.day = self.period = ""
 
         root = BoxLayout(orientation="vertical", padding=10, spacing=10)
-        with root.canvas.before:
-            Color(.05,.05,.20,1)
-            self.rect = Rectangle(size=root.size, pos=root.pos)
-        root.bind(size=self._upd_rect, pos=self._upd_rect)
 
-        self.info = Label(font_size="20sp", color=(1,1,1,1), size_hint=(1,.15))
+        self.info = Text(size_hint=(1,.15))
         root.add_widget(self.info)
 
-        # time pick grid
+        # time pick grid (digits and arrows come from the texture cache)
         grid = GridLayout(cols=3, spacing=10, size_hint=(1,.4))
-        self.h  = Label(text="08", font_size="24sp", color=(1,1,1,1))
-        self.m  = Label(text="00", font_size="24sp", color=(1,1,1,1))
-        self.ap = Label(text="AM", font_size="24sp", color=(1,1,1,1))
+        self.h  = CachedLabel(text="08", font_size=sp(24))
+        self.m  = CachedLabel(text="00", font_size=sp(24))
+        self.ap = CachedLabel(text="AM", font_size=sp(24))
 
         arrows = [("▲", self._ch_h,  1),
                   ("▲", self._ch_m,  1),
@@ -283,7 +300,7 @@ class TimeScreen(Screen):
                   ("▼", self._ch_m, -1),
                   ("▼", self._ch_ap,-1)]
         for idx, (sym, fn, step) in enumerate(arrows):
-            btn = Button(text=sym, font_size="24sp", background_color=(.2,.4,.8,1))
+            btn = CachedButton(text=sym, font_size=sp(24))
             btn.bind(on_press=lambda inst,f=fn,s=step: f(s))
             grid.add_widget(btn)
             if idx == 2:
@@ -292,18 +309,14 @@ class TimeScreen(Screen):
 
         # nav
         nav = BoxLayout(size_hint=(1,.15), spacing=10)
-        nav.add_widget(Button(text="Back", background_color=(.2,.4,.8,1),
-                              on_press=lambda *_: setattr(self.manager,"current","home")))
-        nav.add_widget(Button(text="OK",   background_color=(.3,.7,.9,1),
-                              on_press=self._save))
+        nav.add_widget(CachedButton(text="Back",
+                               on_press=lambda *_: setattr(self.manager,"current","home")))
+        nav.add_widget(CachedButton(text="OK", role="action",
+                               on_press=self._save))
         root.add_widget(nav)
 
         self.add_widget(root)
 
-    def _upd_rect(self, inst, val):
-        self.rect.size = inst.size
-        self.rect.pos  = inst.pos
-
     def set_day_period(self, day, period):
         self.day, self.period = day, period
         self.info.text = f"{day} — {period}"
@@ -328,9 +341,8 @@ class TimeScreen(Screen):
         hr_24 = hr_12 % 12 + (12 if self.ap.text == "PM" else 0)
         t24   = f"{hr_24:02}:{self.m.text}"
         disp  = f"{self.h.text}:{self.m.text} {self.ap.text}"
-        getattr(schedule.every(), self.day.lower()).at(t24).do(
-            trigger_alarm, self.day, disp, self.period
-        )
+        job = alarms.every(self.day, t24, trigger_alarm, self.day, disp, self.period)
+        run_io(lambda: store.add_job(job))  # store looked up on the worker
         self.manager.current = "home"
 
 # ───────── Debug screens ─────────
@@ -341,37 +353,36 @@ class DebugScreen(Screen):
         self.prev_slot = None
 
         root = BoxLayout(orientation="vertical", padding=10, spacing=10)
-        with root.canvas.before:
-            Color(.05,.05,.20,1); self.rect = Rectangle(size=root.size, pos=root.pos)
-        root.bind(size=self._upd_rect, pos=self._upd_rect)
-
-        root.add_widget(Label(text="Debug Menu", font_size="24sp", color=(1,1,1,1)))
+        root.add_widget(Title(text="Debug Menu"))
 
         # LED row
         led_row = BoxLayout(size_hint=(1,.15), spacing=10)
-        led_row.add_widget(Button(text="LED ON",  background_color=(.0,.6,.2,1),
-                                  on_press=lambda *_: (led.on() if led else None)))
-        led_row.add_widget(Button(text="LED OFF", background_color=(.6,.1,.1,1),
-                                  on_press=lambda *_: (led.off() if led else None)))
+        led_row.add_widget(CachedButton(text="LED ON",  role="on",
+                                   on_press=lambda *_: led and run_io(led.on)))
+        led_row.add_widget(CachedButton(text="LED OFF", role="off",
+                                   on_press=lambda *_: led and run_io(led.off)))
         root.add_widget(led_row)
 
         # audio row
         aud_row = BoxLayout(size_hint=(1,.15), spacing=10)
-        aud_row.add_widget(Button(text="Audio ON",  background_color=(.1,.6,.8,1),
-                                  on_press=lambda *_: audio_on()))
-        aud_row.add_widget(Button(text="Audio OFF", background_color=(.6,.1,.3,1),
-                                  on_press=lambda *_: audio_off()))
+        aud_row.add_widget(CachedButton(text="Audio ON",  role="period",
+                                   on_press=lambda *_: run_io(audio_on)))
+        aud_row.add_widget(CachedButton(text="Audio OFF", role="mute",
+                                   on_press=lambda *_: run_io(audio_off)))
         root.add_widget(aud_row)
 
-        # slot select
-        root.add_widget(Button(text="Manual Slot Select",
-                               background_color=(.3,.7,.9,1), size_hint=(1,.15),
-                               on_press=lambda *_: setattr(self.manager,"current","slots")))
+        # slot select / calibration
+        cal_row = BoxLayout(size_hint=(1,.15), spacing=10)
+        cal_row.add_widget(CachedButton(text="Manual Slot Select", role="action",
+                                   on_press=lambda *_: setattr(self.manager,"current","slots")))
+        cal_row.add_widget(CachedButton(text="Calibrate", role="tool",
+                                   on_press=lambda *_: motor.calibrate()))
+        root.add_widget(cal_row)
         
         # motor jog
         jog_box = BoxLayout(size_hint=(1,.15), spacing=10)
-        left_btn  = Button(text="◀ Hold", background_color=(.4,.4,.9,1))
-        right_btn = Button(text="Hold ▶", background_color=(.4,.4,.9,1))
+        left_btn  = CachedButton(text="◀ Hold", role="jog")
+        right_btn = CachedButton(text="Hold ▶", role="jog")
 
         # start jog on press, stop on release
         left_btn.bind(
@@ -388,30 +399,23 @@ class DebugScreen(Screen):
 
 
         # back
-        root.add_widget(Button(text="Back", background_color=(.2,.4,.8,1), size_hint=(1,.15),
-                               on_press=lambda *_: self._leave()))
+        root.add_widget(CachedButton(text="Back", size_hint=(1,.15),
+                                on_press=lambda *_: self._leave()))
         self.add_widget(root)
     
     # ── motor jog helpers ───────────────────────────────────────────
     def _start_jog(self, forward: bool):
-        _jog_event.clear()
-        threading.Thread(target=_jog_motor, args=(forward,), daemon=True).start()
+        motor.jog(forward)
 
     def _stop_jog(self):
-        _jog_event.set()
-
-
-    def _upd_rect(self, inst, val):
-        self.rect.size = inst.size
-        self.rect.pos  = inst.pos
+        motor.stop_jog()
 
     def on_pre_enter(self):
-        self.prev_slot = current_slot
+        self.prev_slot = motor.current_slot
 
     def _leave(self):
-        if self.prev_slot is not None and self.prev_slot != current_slot:
-            threading.Thread(target=rotate_to_slot,
-                             args=(self.prev_slot,), daemon=True).start()
+        if self.prev_slot is not None:
+            rotate_to_slot(self.prev_slot)      # no-op if already there
         self.manager.current = "home"
 
 class SlotPickerScreen(Screen):
@@ -419,68 +423,117 @@ class SlotPickerScreen(Screen):
     def __init__(self, **kw):
         super().__init__(**kw)
         root = GridLayout(cols=4, padding=10, spacing=10)
-        with root.canvas.before:
-            Color(.05,.05,.20,1); self.rect = Rectangle(size=root.size, pos=root.pos)
-        root.bind(size=self._upd_rect, pos=self._upd_rect)
 
         for i in range(14):
-            root.add_widget(Button(text=str(i),
-                                   background_color=(.3,.7,.9,1),
-                                   on_press=lambda inst,slot=i:
-                                       threading.Thread(target=rotate_to_slot,
-                                                        args=(slot,), daemon=True).start()))
-        root.add_widget(Button(text="Back", background_color=(.2,.4,.8,1),
-                               on_press=lambda *_: setattr(self.manager,"current","debug")))
+            root.add_widget(CachedButton(text=str(i), role="action",
+                                         on_press=lambda inst,slot=i: rotate_to_slot(slot)))
+        root.add_widget(CachedButton(text="Back",
+                                on_press=lambda *_: setattr(self.manager,"current","debug")))
         self.add_widget(root)
 
-    def _upd_rect(self, inst, val):
-        self.rect.size = inst.size
-        self.rect.pos  = inst.pos
-
 # ───────── Settings screen ─────────
 class SettingsScreen(Screen):
     def __init__(self, **kw):
         super().__init__(**kw)
         root = BoxLayout(orientation="vertical", padding=10, spacing=10)
-        with root.canvas.before:
-            Color(.05,.05,.20,1); self.rect = Rectangle(size=root.size, pos=root.pos)
-        root.bind(size=self._upd_rect, pos=self._upd_rect)
-
-        root.add_widget(Label(text="Settings", font_size="24sp", color=(1,1,1,1)))
-        root.add_widget(Button(text="Sync Pi RTC",
-                               background_color=(.3,.7,.9,1),
-                               on_press=lambda *_: os.system("sudo timedatectl set-ntp true")))
-        root.add_widget(Button(text="Debug",
-                               background_color=(.6,.5,.1,1),
-                               on_press=lambda *_: setattr(self.manager,"current","debug")))
-        root.add_widget(Button(text="Back",
-                               background_color=(.2,.4,.8,1),
-                               on_press=lambda *_: setattr(self.manager,"current","home")))
+
+        root.add_widget(Title(text="Settings"))
+        self.sync_btn = CachedButton(text="Sync Pi RTC", role="action",
+                                on_press=lambda *_: self._sync_rtc())
+        root.add_widget(self.sync_btn)
+        root.add_widget(CachedButton(text="Debug", role="tool",
+                                on_press=lambda *_: setattr(self.manager,"current","debug")))
+        root.add_widget(CachedButton(text="Back",
+                                on_press=lambda *_: setattr(self.manager,"current","home")))
         self.add_widget(root)
 
-    def _upd_rect(self, inst, val):
-        self.rect.size = inst.size
-        self.rect.pos  = inst.pos
+    def _sync_rtc(self):
+        self.sync_btn.text = "Syncing…"
+        run_bg(clock_svc.sync,
+               then=lambda ok: setattr(self.sync_btn, "text",
+                                       f"Synced {clock_svc.last_step:+.2f} s" if ok else "Sync failed"))
 
 # ───────── App wrapper ─────────
+frames = FrameMonitor()
+
+class LazyScreens(theme.Screens):
+    """Screens in `factories` are built the first time they are shown."""
+    def __init__(self, factories, **kw):
+        self.factories = dict(factories)
+        super().__init__(**kw)
+
+    def on_current(self, instance, value):
+        make = self.factories.pop(value, None)
+        if make is not None:
+            self.add_widget(make(name=value))
+        super().on_current(instance, value)
+
 class PillSchedulerApp(App):
     def build(self):
-        sm = ScreenManager()
+        sm = LazyScreens({"settings": SettingsScreen,
+                          "debug":    DebugScreen,
+                          "slots":    SlotPickerScreen})
         sm.add_widget(HomeScreen(name="home"))
         sm.add_widget(TimeScreen(name="time"))
-        sm.add_widget(SettingsScreen(name="settings"))
-        sm.add_widget(DebugScreen(name="debug"))
-        sm.add_widget(SlotPickerScreen(name="slots"))
+        boot.mark("widgets")
         return sm
 
     def on_start(self):
-        threading.Thread(target=self._sched_loop, daemon=True).start()
+        from kivy.core.window import Window
+        def first_frame(*_):
+            Window.unbind(on_flip=first_frame)
+            boot.mark("first frame")
+            run_io(boot.report)             # after open_hardware has noted its time
+        Window.bind(on_flip=first_frame)
+        if os.environ.get("PILLBOX_FRAMES"):    # frame-stall overlay
+            frames.start(overlay=True)
+        run_io(open_hardware)               # pins, stepper, mixer – off the critical path
+        run_io(self._arm_alarms)
+        run_bg(self._start_metrics)
+        idle.interval(lambda dt: metrics.UI_FRAME.observe(dt), 0,    # frame time,
+                      refresh=False)                                    # not while idle
+        idle.start()
+
+    def _start_metrics(self):
+        self.ring = metrics.Ring(os.path.join(HERE, "metrics.ring"))
+        self.ring.start()
+        if METRICS_ADDR != "off":
+            metrics.serve(METRICS_ADDR)
 
     @staticmethod
-    def _sched_loop():
-        while True:
-            schedule.run_pending()
-            time.sleep(1)
+    def _arm_alarms():
+        global store, doses
+        t0 = time.perf_counter()
+        store = schedule_store.ScheduleStore(os.path.join(HERE, "alarms.db"))
+        doses = dose_log.DoseLog(os.path.join(HERE, "doses.log"))
+        box.store, box.log = store, doses
+        boot.note("storage", time.perf_counter() - t0)
+        jobs, dt = store.load_into(alarms, trigger_alarm)
+        print(f"[store] {len(jobs)} alarms armed in {dt*1000:.0f} ms")
+        if dt > schedule_store.STARTUP_BUDGET_S:
+            print("[store] warning: over startup budget")
+        alarms.start()
+        clock_svc.start()
+        if FLEET_ADDR:                      # manager-pushed alarms, applied as deltas
+            fleet.FleetDevice(socket.gethostname(), alarms, trigger_alarm,
+                              store=store).start(FLEET_ADDR)
+
+    def on_stop(self):
+        if frames.frames:
+            print(frames.summary())
+        print(idle.stats.report())
+        print(clock_svc.report())
+        clock_svc.stop()
+        notifier.close()
+        if getattr(self, "ring", None):
+            self.ring.close()
+        alarms.stop()
+        if store is not None:
+            store.close()
+        if doses is not None:
+            doses.close()
+
+boot.mark("core")
 
 if __name__ == "__main__":
     PillSchedulerApp().run()
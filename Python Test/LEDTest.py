@@ -1,11 +1,14 @@
-from gpiozero import LED
+from gpiozero import PWMLED
 from time import sleep
 
-led = LED(14)
+import leds
 
-while True:
-    led.on()
-    sleep(1.5)
+lights = leds.LedEngine(PWMLED(14), pwm=True)
 
-    led.off()
-    sleep(1.5)
\ No newline at end of file
+for name in ("BLINK", "BREATHE", "ESCALATE"):
+    print(name)
+    lights.play(getattr(leds, name))
+    sleep(10)               # the pattern keeps time on its own thread
+
+lights.off()
+sleep(0.1)
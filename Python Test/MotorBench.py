@@ -0,0 +1,90 @@
+"""
+Slot-to-slot latency on a simulated motor, all 14×14 moves.
+Compares the old forward-only, per-slot 250 Hz moves with the planner
+(merged move, shorter direction, trapezoid profile).
+Then two carousels (AM/PM + as-needed), every pair of targets: moving
+one after the other vs goto_many (interleaved pulse train), and one
+real-time Python-edge run of a merged train checked edge by edge.
+"""
+import time
+
+import stepper, motion
+from motion import STEPS_PER_SLOT, N_SLOTS
+
+sim = stepper.SimBackend(realtime=False, verbose=False)
+
+def old_move(cur, tgt):
+    t = 0.0
+    for i in range((tgt - cur) % N_SLOTS):
+        seg = STEPS_PER_SLOT[(cur + i) % N_SLOTS]
+        t += sim.run(stepper.make_wave(seg, 250)).actual_s
+    return t
+
+def new_move(cur, tgt):
+    steps, fwd = motion.plan_move(cur, tgt)
+    return sim.run(motion.trapezoid(steps), fwd).actual_s if steps else 0.0
+
+def report(name, fn):
+    times = [fn(c, t) for c in range(N_SLOTS) for t in range(N_SLOTS) if c != t]
+    print(f"{name:8} worst {max(times)*1000:7.1f} ms   avg {sum(times)/len(times)*1000:7.1f} ms")
+
+def two_carousels():
+    ctl = motion.MotionController(sim, threaded=False, name="ampm")
+    ctl.verbose = False
+    ctl.add(motion.Carousel("prn", stepper.SimBackend(realtime=False, verbose=False)))
+    seq, par = [], []
+    for a in range(N_SLOTS):
+        for b in range(N_SLOTS):
+            for name, slot in (("ampm", a), ("prn", b)):     # from (a, b) ...
+                ctl.goto(slot, name)
+            ta, tb = (a * 5 + 3) % N_SLOTS, (b * 3 + 7) % N_SLOTS
+            wa, _ = ctl.carousels["ampm"].plan(ta)
+            wb, _ = ctl.carousels["prn"].plan(tb)
+            seq.append((sum(wa) + sum(wb)) / 1e6)
+            reps = ctl.goto_many({"ampm": ta, "prn": tb}).result()    # ... to (ta, tb)
+            par.append(max((r.actual_s for r in reps), default=0.0))
+            assert ctl.carousels["ampm"].current_slot == ta and ctl.carousels["prn"].current_slot == tb
+    print(f"{'2 x seq':8} worst {max(seq)*1000:7.1f} ms   avg {sum(seq)/len(seq)*1000:7.1f} ms")
+    print(f"{'2 x par':8} worst {max(par)*1000:7.1f} ms   avg {sum(par)/len(par)*1000:7.1f} ms")
+
+class _Pin:
+    def __init__(self, log, name):
+        self.log, self.name = log, name
+    @property
+    def value(self):
+        return 0
+    @value.setter
+    def value(self, v):
+        self.log.append((time.perf_counter(), self.name, v))
+
+def merged_edges():
+    """Real-time merged train on two Python-edge channels."""
+    log = []
+    a = stepper.SleepBackend(_Pin(log, "dirA"), _Pin(log, "A"))
+    b = stepper.SleepBackend(_Pin(log, "dirB"), _Pin(log, "B"))
+    wa, wb = motion.trapezoid(60), motion.trapezoid(25)
+    reps = stepper.run_parallel([(a, wa, True), (b, wb, False)])
+    for ch, w in (("A", wa), ("B", wb)):
+        rises = [t for t, n, v in log if n == ch and v == 1]
+        assert len(rises) == len(w)
+    r = reps[0]
+    print(f"merged   {r.steps}+{reps[1].steps} steps in {r.actual_s*1000:.1f} ms "
+          f"(longest planned {max(sum(wa), sum(wb))/1000:.1f} ms, sum {(sum(wa)+sum(wb))/1000:.1f} ms), "
+          f"edge late max {r.max_late_us:.0f} µs mean {r.mean_late_us:.0f} µs")
+
+if __name__ == '__main__':
+    print(f"{N_SLOTS}x{N_SLOTS} moves, V_START={motion.V_START} V_MAX={motion.V_MAX} "
+          f"ACCEL={motion.ACCEL} reverse={motion.ALLOW_REVERSE}")
+    report("old", old_move)
+    report("planner", new_move)
+    motion.ALLOW_REVERSE = True                         # read at plan time, not import
+    report("reverse", new_move)
+    car = motion.Carousel("c")
+    car.pos, goals = car.offsets[3], [car.offsets[2], car.offsets[4]]
+    assert car.plan(2)[1] is False
+    assert motion.plan_tour(car.pos, goals, car.total) == goals
+    motion.ALLOW_REVERSE = False
+    assert car.plan(2)[1] is True
+    assert motion.plan_tour(car.pos, goals, car.total) == goals[::-1]
+    two_carousels()
+    merged_edges()
@@ -0,0 +1,109 @@
+"""
+UI layout benchmark (Kivy, no window needed).
+Builds the app's screen manager, then walks
+  home → time → home → settings → debug → slots → debug → settings → home
+and reports per navigation: layout passes (do_layout calls), text
+renders (Label texture updates + theme texture-cache misses) and CPU
+time; then widget count, canvas instructions and memory for all screens.
+
+usage: python UIBench.py
+"""
+import functools, importlib.util, os, sys, time, tracemalloc
+
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from kivy.clock import Clock
+from kivy.uix.label import Label
+from kivy.uix.layout import Layout
+
+ROUTE = ["time", "home", "settings", "debug", "slots", "debug", "settings", "home"]
+SIZE  = (800, 480)                  # 7" Pi display
+
+counts = {"layout": 0, "text": 0}
+
+def _count(cls, name, key):
+    orig = cls.__dict__[name]
+    @functools.wraps(orig)                  # Clock triggers look methods up by name
+    def wrapped(self, *a, **kw):
+        counts[key] += 1
+        return orig(self, *a, **kw)
+    setattr(cls, name, wrapped)
+
+def _patch_layouts():
+    todo, seen = [Layout], set()
+    while todo:
+        cls = todo.pop()
+        if cls in seen:
+            continue
+        seen.add(cls)
+        if "do_layout" in cls.__dict__:
+            _count(cls, "do_layout", "layout")
+        todo += cls.__subclasses__()
+
+def _settle(sm, max_s=2.0):
+    t_end = time.perf_counter() + max_s
+    while time.perf_counter() < t_end:
+        Clock.tick()
+        if not sm.transition.is_active:
+            break
+    for _ in range(3):
+        Clock.tick()
+
+def _walk(w):
+    yield w
+    for c in w.children:
+        yield from _walk(c)
+
+def _instructions(w):
+    n = 0
+    for c in (w.canvas.before, w.canvas, w.canvas.after):
+        n += len(c.children)
+    return n
+
+def main():
+    spec = importlib.util.spec_from_file_location("gui", os.path.join(HERE, "GUI Dev.py"))
+    gui = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(gui)
+    try:
+        import theme
+        cache = theme.TEXTURES
+    except ImportError:
+        cache = None
+
+    _patch_layouts()
+    _count(Label, "texture_update", "text")
+    tracemalloc.start()
+    mem0 = tracemalloc.get_traced_memory()[0]
+    sm = gui.PillSchedulerApp().build()
+    sm.size = SIZE
+    _settle(sm)
+
+    print(f"{'navigation':18} {'layouts':>8} {'texts':>6} {'cpu ms':>8}")
+    tot_l = tot_t = 0
+    for dest in ROUTE:
+        counts["layout"] = counts["text"] = 0
+        misses = cache.renders if cache else 0
+        t = time.process_time()             # transitions take wall time by design
+        sm.current = dest
+        _settle(sm)
+        ms = (time.process_time() - t) * 1000
+        texts = counts["text"] + ((cache.renders - misses) if cache else 0)
+        tot_l += counts["layout"]; tot_t += texts
+        print(f"→ {dest:16} {counts['layout']:8} {texts:6} {ms:8.1f}")
+    print(f"{'total':18} {tot_l:8} {tot_t:6}")
+
+    widgets = [w for s in sm.screens for w in _walk(s)]
+    mem = tracemalloc.get_traced_memory()[0] - mem0
+    tracemalloc.stop()
+    print(f"{len(sm.screens)} screens, {len(widgets)} widgets, "
+          f"{sum(_instructions(w) for w in widgets) + _instructions(sm)} canvas instructions, "
+          f"{mem / 1024:.0f} KiB"
+          + (f", {len(cache)} cached textures" if cache else ""))
+    gui.alarms.stop()
+    if gui.store is not None:                # opened by _arm_alarms, which build() doesn't run
+        gui.store.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+"""
+alarm_scheduler.py
+————————
+Event-driven alarm engine for the pill-box.
+Jobs live in a min-heap keyed by next-fire time; one thread sleeps on a
+Condition until the earliest deadline and is woken early when a job is
+added or cancelled.  No 1 Hz polling.
+Deadlines are wall-clock (an alarm is for 08:00 local) but every wait is
+a monotonic timeout, so a step of the wall clock is found by comparing
+wall − monotonic on each wake (and from timesync.TimeService); only the
+alarms the step jumped over are re-keyed.
++ SimClock → run the same engine headless in virtual time
+"""
+
+import heapq, itertools, threading, time
+from datetime import datetime, timedelta
+
+import metrics
+
+JUMP_TOL_S   = 2.0          # wall − monotonic change counted as a clock step
+MISS_GRACE_S = 15 * 60      # alarm jumped over by less than this still fires
+
+DAYS = ["Sunday","Monday","Tuesday","Wednesday","Thursday","Friday","Saturday"]
+
+# ───────── clocks ─────────
+class RealClock:
+    """Wall clock; waits block on the scheduler's condition."""
+    def time(self):
+        return time.time()
+
+    def offset(self):
+        """wall − monotonic; constant until the wall clock is stepped."""
+        return time.time() - time.monotonic()
+
+class SimClock:
+    """Virtual clock, only moves when the scheduler (or you) advance it."""
+    def __init__(self, start=None):
+        self.t = time.time() if start is None else float(start)
+        self.mono = 0.0
+
+    def time(self):
+        return self.t
+
+    def offset(self):
+        return self.t - self.mono
+
+    def advance(self, seconds):
+        self.run_to(self.t + seconds)
+
+    def run_to(self, t):
+        self.mono += t - self.t
+        self.t = t
+
+    def step(self, seconds):
+        """Wall clock jumps, monotonic doesn't (NTP step, date -s)."""
+        self.t += seconds
+
+# ───────── jobs ─────────
+class Job:
+    """One alarm.  day=None → daily, at=None → one-shot at `when`."""
+    __slots__ = ("id", "fn", "args", "day", "at", "when", "next_run",
+                 "cancelled", "tag")
+
+    def __init__(self, jid, fn, args, day=None, at=None, when=None):
+        self.id, self.fn, self.args = jid, fn, args
+        self.day, self.at, self.when = day, at, when
+        self.next_run  = None
+        self.cancelled = False
+        self.tag       = None               # caller's handle, e.g. store row id
+
+    @property
+    def one_shot(self):
+        return self.at is None
+
+    def next_after(self, t):
+        """Next fire time (epoch s) strictly after t, or None when spent."""
+        if self.one_shot:
+            return self.when if self.when > t else None
+        hh, mm = self.at
+        now = datetime.fromtimestamp(t)
+        cand = now.replace(hour=hh, minute=mm, second=0, microsecond=0)
+        if self.day is not None:
+            cand += timedelta(days=(self.day - (now.weekday() + 1) % 7) % 7)
+        step = timedelta(days=1 if self.day is None else 7)
+        while cand.timestamp() <= t:
+            cand += step
+        return cand.timestamp()
+
+    def __repr__(self):
+        if self.one_shot:
+            return f"<Job {self.id} once @ {datetime.fromtimestamp(self.when):%a %H:%M}>"
+        day = "daily" if self.day is None else DAYS[self.day]
+        return f"<Job {self.id} {day} {self.at[0]:02}:{self.at[1]:02}>"
+
+def _parse_at(at):
+    hh, mm = (int(x) for x in at.split(":"))
+    if not (0 <= hh < 24 and 0 <= mm < 60):
+        raise ValueError(f"bad time {at!r}")
+    return hh, mm
+
+def _stale(t, job):
+    """Heap entry left behind by cancel() or skip()."""
+    return job.cancelled or t != job.next_run
+
+# ───────── scheduler ─────────
+class AlarmScheduler:
+    def __init__(self, clock=None):
+        self.clock  = clock or RealClock()
+        self._heap  = []                    # (next_run, seq, job)
+        self._jobs  = {}                    # id → Job
+        self._seq   = itertools.count()
+        self._cond  = threading.Condition()
+        self._thread  = None
+        self._running = False
+        self.wakeups  = 0                   # times the loop thread woke up
+        self._offset  = None                # clock.offset() at the last look
+        self.next_hooks = []                # fn(t) when a job may be the new earliest;
+                                            # called with the lock held, keep them short
+
+    # ---- registration ----
+    def make_every(self, day, at, fn, *args):
+        """Unregistered weekly/daily Job (see every); for add_many."""
+        if isinstance(day, str):
+            day = DAYS.index(day.capitalize())
+        return Job(next(self._seq), fn, args, day=day, at=_parse_at(at))
+
+    def make_once(self, when, fn, *args):
+        """Unregistered one-shot Job (see once); for add_many."""
+        if isinstance(when, datetime):
+            when = when.timestamp()
+        return Job(next(self._seq), fn, args, when=float(when))
+
+    def every(self, day, at, fn, *args):
+        """Weekly on `day` ("Monday" / 0-6 Sunday-based) or daily if None, at "HH:MM"."""
+        return self._add(self.make_every(day, at, fn, *args))
+
+    def once(self, when, fn, *args):
+        """One-shot at `when` (datetime or epoch seconds)."""
+        return self._add(self.make_once(when, fn, *args))
+
+    def add_many(self, jobs):
+        """Register a batch with one wake-up; heapify only when the batch
+        is large next to the heap, otherwise push one by one."""
+        jobs = list(jobs)
+        with self._cond:
+            now = self.clock.time()
+            bulk = len(jobs) * 4 >= len(self._heap)
+            for job in jobs:
+                job.next_run = job.next_after(now)
+                if job.next_run is None:
+                    job.next_run = now
+                self._jobs[job.id] = job
+                entry = (job.next_run, job.id, job)
+                if bulk:
+                    self._heap.append(entry)
+                else:
+                    heapq.heappush(self._heap, entry)
+            if bulk:
+                heapq.heapify(self._heap)
+            self._cond.notify()
+            if jobs:
+                self._earlier(min(job.next_run for job in jobs))
+        return jobs
+
+    def cancel(self, job):
+        with self._cond:
+            job.cancelled = True            # lazy delete, skipped when popped
+            if self._jobs.pop(job.id, None) is not None:
+                self._cond.notify()
+
+    def clear(self):
+        with self._cond:
+            for job in self._jobs.values():
+                job.cancelled = True
+            self._jobs.clear(); self._heap.clear()
+            self._cond.notify()
+
+    def skip(self, job):
+        """Drop the job's next occurrence (a one-shot is cancelled).
+        The old heap entry goes stale and is skipped when popped."""
+        with self._cond:
+            self._rekey(job, None if job.cancelled else job.next_after(job.next_run))
+            self._cond.notify()
+
+    def jobs(self):
+        with self._cond:
+            return list(self._jobs.values())
+
+    def upcoming(self, t_end):
+        """Live jobs due at or before t_end.  Walks only the top of the
+        heap: a child is never earlier than its parent."""
+        out, stack = [], [0]
+        with self._cond:
+            heap = self._heap
+            while stack:
+                i = stack.pop()
+                if i >= len(heap) or heap[i][0] > t_end:
+                    continue
+                t, _, job = heap[i]
+                if not _stale(t, job):
+                    out.append(job)
+                stack += (2 * i + 1, 2 * i + 2)
+        return sorted(out, key=lambda j: j.next_run)
+
+    def next_run(self):
+        with self._cond:
+            self._drop_cancelled()
+            return self._heap[0][0] if self._heap else None
+
+    def _add(self, job):
+        with self._cond:
+            job.next_run = job.next_after(self.clock.time())
+            if job.next_run is None:        # one-shot already in the past
+                job.next_run = self.clock.time()
+            self._jobs[job.id] = job
+            heapq.heappush(self._heap, (job.next_run, job.id, job))
+            if self._heap[0][2] is job:     # new earliest deadline → wake loop
+                self._cond.notify()
+                self._earlier(job.next_run)
+        return job
+
+    def _rekey(self, job, nxt):
+        """Move a job to `nxt` (None → spent) with one push.  Lock held."""
+        if nxt is None:
+            job.cancelled = True
+            self._jobs.pop(job.id, None)
+        else:
+            job.next_run = nxt
+            heapq.heappush(self._heap, (nxt, job.id, job))
+
+    def _earlier(self, t):
+        for hook in self.next_hooks:
+            hook(t)
+
+    def _drop_cancelled(self):
+        while self._heap and _stale(*self._heap[0][::2]):
+            heapq.heappop(self._heap)
+
+    # ---- wall-clock steps ----
+    def check_clock(self):
+        """Look for a wall-clock step now; wakes the loop if there was one.
+        Returns the step in seconds (0.0 = none)."""
+        with self._cond:
+            step = self._check_clock()
+            if step:
+                self._cond.notify()
+                if self._heap:
+                    self._earlier(self._heap[0][0])
+        return step
+
+    def _check_clock(self):
+        off = self.clock.offset()
+        step, self._offset = (0.0 if self._offset is None else off - self._offset), off
+        if abs(step) <= JUMP_TOL_S:
+            return 0.0
+        n, missed = self._stepped(step, self.clock.time())
+        print(f"[clock] wall clock stepped {step:+.1f} s: "
+              f"{n} alarms re-keyed, {missed} one-shots missed")
+        return step
+
+    def _stepped(self, step, now):
+        """Back: the replayed span has already fired, every next_run stands
+        and the loop just waits again.  Forward: an alarm the step jumped
+        over by more than MISS_GRACE_S is not fired late – a repeating job
+        moves to its first run after now − grace (so at most one catch-up),
+        a one-shot is dropped.  Jumped over by less, it fires as usual.
+        One push per affected job; the rest of the heap is not touched.
+        Lock held."""
+        metrics.CLOCK_STEP.observe(abs(step))
+        n = missed = 0
+        if step > 0:
+            for job in self.upcoming(now - MISS_GRACE_S):
+                nxt = job.next_after(now - MISS_GRACE_S)
+                self._rekey(job, nxt)
+                n += 1
+                missed += nxt is None
+        return n, missed
+
+    # ---- firing ----
+    def _pop_due(self, now):
+        """Pop every job due at `now` as (due time, job), re-arm repeating
+        ones.  Lock held."""
+        due = []
+        while self._heap:
+            t, _, job = self._heap[0]
+            if _stale(t, job):
+                heapq.heappop(self._heap); continue
+            if t > now:
+                break
+            heapq.heappop(self._heap)
+            due.append((t, job))
+            nxt = job.next_after(t)
+            if nxt is None:
+                self._jobs.pop(job.id, None)
+            else:
+                job.next_run = nxt
+                heapq.heappush(self._heap, (nxt, job.id, job))
+        return due
+
+    def _fire(self, t, job):
+        metrics.ALARM_LATE.observe(max(0.0, self.clock.time() - t))
+        metrics.ALARMS.inc()
+        try:
+            job.fn(*job.args)
+        except Exception as e:
+            metrics.ERRORS.inc("scheduler")
+            print("Scheduler error:", e)
+
+    def run_pending(self):
+        """Fire everything due right now; returns the number fired."""
+        with self._cond:
+            due = self._pop_due(self.clock.time())
+        for t, job in due:
+            self._fire(t, job)
+        return len(due)
+
+    def run_until(self, t_end):
+        """SimClock only: jump virtual time deadline-to-deadline up to t_end."""
+        fired = 0
+        while True:
+            with self._cond:
+                self._check_clock()
+                self._drop_cancelled()
+                if not self._heap or self._heap[0][0] > t_end:
+                    break
+                self.clock.run_to(max(self.clock.t, self._heap[0][0]))
+                due = self._pop_due(self.clock.t)
+            for t, job in due:
+                self._fire(t, job)
+            fired += len(due)
+        self.clock.run_to(max(self.clock.t, t_end))
+        return fired
+
+    # ---- background thread (real clock) ----
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout=1)
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while self._running:
+                    self._check_clock()
+                    self._drop_cancelled()
+                    now = self.clock.time()
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    timeout = self._heap[0][0] - now if self._heap else None
+                    self._cond.wait(timeout)
+                    self.wakeups += 1
+                if not self._running:
+                    return
+                due = self._pop_due(self.clock.time())
+            for t, job in due:
+                self._fire(t, job)
+
+# ───────── quick headless check ─────────
+if __name__ == "__main__":
+    clk = SimClock(datetime(2025, 1, 5).timestamp())    # a Sunday
+    sched = AlarmScheduler(clk)
+    fired = []
+    for d in DAYS:
+        sched.every(d, "08:00", fired.append, (d, "Morning"))
+        sched.every(d, "20:00", fired.append, (d, "Evening"))
+
+    days = 3650
+    t0 = time.perf_counter()
+    sched.run_until(clk.time() + days * 86400)
+    dt = time.perf_counter() - t0
+    print(f"{len(fired)} alarms over {days} virtual days in {dt*1000:.1f} ms "
+          f"({days/dt:,.0f} days/s)")
+    assert len(fired) == days * 2
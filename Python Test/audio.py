@@ -0,0 +1,197 @@
+"""
+audio.py
+————————
+Alarm audio with decoded sounds kept in memory.
+  • SoundCache  – pygame Sound objects keyed by (path, mtime), decoded
+                  once (preload at startup or lazily on first play);
+                  across a mixer restart only the raw samples are kept,
+                  and a Sound is rebuilt from them without decoding
+  • AlarmAudio  – plays on a reserved channel, never restarts a sound
+                  that is already playing, records start-up latency;
+                  release() closes the device while idle, the next
+                  play() reopens it
+Works as a no-op when pygame / the mixer is unavailable.
+"""
+
+import os, threading, time
+from collections import namedtuple
+
+import metrics
+
+pygame = None                       # imported by the first init_mixer()
+
+FREQ, BUFFER = 44100, 512           # small buffer → low output latency
+
+Latency = namedtuple("Latency", "path load_s start_s buffer_s total_s cached")
+
+def init_mixer():
+    """Open the mixer with a small buffer; False if there is no audio."""
+    global pygame
+    try:
+        if pygame is None:
+            import pygame               # slow on a Pi Zero: keep off import time
+        if not pygame.mixer.get_init():
+            pygame.mixer.pre_init(FREQ, -16, 2, BUFFER)
+            pygame.mixer.init()
+        return True
+    except Exception as e:
+        metrics.ERRORS.inc("audio")
+        print("Audio error:", e)
+        return False
+
+class SoundCache:
+    def __init__(self):
+        self._sounds = {}           # (abspath, mtime) → Sound
+        self._raw    = {}           # (abspath, mtime) → samples, while the mixer is closed
+        self._lock   = threading.Lock()
+
+    @staticmethod
+    def key(path):
+        path = os.path.abspath(path)
+        return path, os.path.getmtime(path)
+
+    def cached(self, path):
+        try:
+            key = self.key(path)
+        except OSError:
+            return False
+        return key in self._sounds or key in self._raw
+
+    def get(self, path):
+        """Decoded Sound for path, decoding (once) if new or changed on disk."""
+        key = self.key(path)
+        with self._lock:
+            snd = self._sounds.get(key)
+            if snd is None:
+                raw = self._raw.pop(key, None)
+                snd = (pygame.mixer.Sound(key[0]) if raw is None
+                       else pygame.mixer.Sound(buffer=raw))    # same FREQ / format
+                for old in [k for k in self._sounds if k[0] == key[0]]:
+                    del self._sounds[old]           # stale mtime
+                self._sounds[key] = snd
+            return snd
+
+    def clear(self):
+        with self._lock:
+            self._sounds.clear()
+            self._raw.clear()
+
+    def freeze(self):
+        """Before the mixer closes: keep each Sound's samples, drop the Sound."""
+        with self._lock:
+            for key, snd in self._sounds.items():
+                self._raw[key] = snd.get_raw()
+            self._sounds.clear()
+
+    def preload(self, *paths):
+        """Decode in a background thread so startup isn't held up."""
+        def work():
+            for p in paths:
+                try:
+                    self.get(p)
+                except Exception as e:
+                    metrics.ERRORS.inc("audio")
+                    print("Audio error:", e)
+        t = threading.Thread(target=work, daemon=True)
+        t.start()
+        return t
+
+class AlarmAudio:
+    """lazy=True leaves the device closed until reopen() or the first play()."""
+    def __init__(self, cache=None, lazy=False):
+        self.cache   = cache or SoundCache()
+        self.channel = None
+        self.playing = None                 # path currently sounding
+        self.latency_hooks = []             # fn(Latency) after each start
+        self.last_latency  = None
+        self.released = False
+        self.volume   = 1.0
+        self._paths   = []                  # preloaded, rebuilt on reopen
+        if lazy:
+            self.ok, self.released = False, True
+        else:
+            self._open()
+
+    def _open(self):
+        self.ok = init_mixer()
+        if self.ok:
+            pygame.mixer.set_reserved(1)    # channel 0 is ours
+            self.channel = pygame.mixer.Channel(0)
+            self.channel.set_volume(self.volume)
+
+    def release(self):
+        """Close the audio device (idle mode).  The Sounds die with it, their
+        samples are kept, so the next play() after reopening doesn't decode."""
+        if not self.ok:
+            return
+        self.stop()
+        try:
+            self.cache.freeze()
+        except Exception as e:
+            metrics.ERRORS.inc("audio")
+            print("Audio error:", e)
+            self.cache.clear()
+        try:
+            pygame.mixer.quit()
+        except Exception as e:
+            metrics.ERRORS.inc("audio")
+            print("Audio error:", e)
+        self.ok, self.channel, self.released = False, None, True
+
+    def reopen(self):
+        """Reopen after release() and rebuild the preloaded sounds."""
+        if self.released:
+            self.released = False
+            self._open()
+            if self.ok and self._paths:
+                self.cache.preload(*self._paths)
+        return self.ok
+
+    def preload(self, *paths):
+        self._paths = [p for p in paths if os.path.exists(p)]
+        if self.ok:
+            return self.cache.preload(*self._paths)
+
+    def play(self, path, loops=-1):
+        """Start `path` looping; no-op if it is already playing."""
+        if self.released:
+            self.reopen()
+        if not self.ok or not os.path.exists(path):
+            return False
+        if self.playing == path and self.channel.get_busy():
+            return True
+        t0 = time.perf_counter()
+        try:
+            cached = self.cache.cached(path)
+            snd = self.cache.get(path)
+            t1 = time.perf_counter()
+            self.channel.play(snd, loops=loops)
+            while not self.channel.get_busy() and time.perf_counter() - t1 < 0.05:
+                pass
+            t2 = time.perf_counter()
+        except Exception as e:
+            metrics.ERRORS.inc("audio")
+            print("Audio error:", e)
+            return False
+        self.playing = path
+        buf = BUFFER / FREQ
+        self._report(Latency(path, t1 - t0, t2 - t1, buf, t2 - t0 + buf, cached))
+        return True
+
+    def stop(self):
+        if self.ok and self.channel is not None:
+            self.channel.stop()
+        self.playing = None
+
+    def set_volume(self, vol):
+        self.volume = vol
+        if self.ok and self.channel is not None:
+            self.channel.set_volume(vol)
+
+    def _report(self, lat):
+        self.last_latency = lat
+        for fn in self.latency_hooks:
+            try:
+                fn(lat)
+            except Exception as e:
+                print("Audio hook error:", e)
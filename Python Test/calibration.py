@@ -0,0 +1,169 @@
+"""
+calibration.py
+————————
+Per-slot step calibration + closed-loop homing for the carousel.
+Optional mark sensors (gpiozero inputs, BCM; None = not fitted):
+  HOME_PIN – one mark at slot 0
+  SLOT_PIN – one mark per slot
+measure() walks the carousel slowly from home, finds every mark and
+stores a fractional steps-per-slot table in calibration.json.  While
+running, each pass over the home mark re-anchors the step counter, so
+missed steps never pile up and no full-revolution reset is needed.
+"""
+
+import bisect, json, os, time
+from collections import deque
+
+from motion import STEPS_PER_SLOT
+
+HOME_PIN  = None            # e.g. 5 once the home switch is fitted
+SLOT_PIN  = None            # e.g. 6 once the slot sensor is fitted
+CAL_FILE  = os.path.join(os.path.dirname(os.path.abspath(__file__)), "calibration.json")
+CAL_RATE  = 100             # steps/s while measuring or searching (10 ms/step)
+DRIFT_TOL = 1               # steps; smaller differences are edge-timing noise
+SEARCH    = 1.2             # revolutions to search for home before giving up
+
+class MarkSensor:
+    """Timestamps (perf_counter) every time a gpiozero input sees its mark."""
+    def __init__(self, dev):
+        self.dev = dev
+        self.times = deque(maxlen=512)
+        dev.when_activated = self._edge
+
+    def _edge(self):
+        self.times.append(time.perf_counter())
+
+    @property
+    def active(self):
+        return bool(self.dev.is_active)
+
+    def edges_during(self, t0, wave):
+        """Indices of the steps after which the mark was reached, for a
+        waveform started at t0 (step i starts at t0 + sum(wave[:i]))."""
+        starts, acc = [], 0.0
+        for p in wave:
+            starts.append(acc); acc += p / 1e6
+        return [max(0, bisect.bisect_right(starts, t - t0) - 1)
+                for t in list(self.times) if t0 <= t <= t0 + acc + 0.005]
+
+class Calibrator:
+    def __init__(self, home=None, slots=None, path=CAL_FILE):
+        self.home, self.slots, self.path = home, slots, path
+        self.table = self.load() or list(STEPS_PER_SLOT)
+        self.corrections = deque(maxlen=100)    # last (time, error in steps)
+        self.n_corrections = 0
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                table = json.load(f)["steps_per_slot"]
+            return table if len(table) == len(STEPS_PER_SLOT) else None
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save(self):
+        with open(self.path, "w") as f:
+            json.dump({"steps_per_slot": [round(x, 3) for x in self.table],
+                       "measured": time.strftime("%Y-%m-%d %H:%M:%S")}, f)
+
+    # ---- on-the-fly drift compensation ----
+    def correct(self, ctl, wave, forward, t0):
+        """Called after every move; re-anchor ctl.pos on the last home edge.
+        Returns True if the home mark was passed."""
+        if self.home is None:
+            return False
+        edges = self.home.edges_during(t0, wave)
+        if not edges:
+            return False
+        after = len(wave) - 1 - edges[-1]       # steps taken past the mark
+        true = (after if forward else -after) % ctl.total
+        half = ctl.total // 2
+        err = (ctl.pos - true + half) % ctl.total - half
+        if abs(err) >= DRIFT_TOL:
+            ctl.pos = true
+            self.corrections.append((time.time(), err))
+            self.n_corrections += 1
+        return True
+
+    def find_home(self, ctl):
+        """Creep forward until the home mark is seen (pos is then exact)."""
+        burst = [int(1e6 / CAL_RATE)] * 10
+        for _ in range(int(SEARCH * ctl.total / len(burst)) + 1):
+            ctl._step(burst, True)
+            if ctl.saw_home:
+                return True
+        print("[calib] home mark not found")
+        return False
+
+    # ---- measurement ----
+    def measure(self, ctl, revs=2):
+        """Slow run over revs full turns; returns the new table."""
+        if self.home is None or not self.find_home(ctl):
+            raise RuntimeError("calibration needs a working home sensor")
+        guess = ctl.total
+        wave = [int(1e6 / CAL_RATE)] * int((revs + 1) * guess * 1.1)
+        t0 = time.perf_counter()
+        ctl.backend.run(wave, True)
+        homes = self.home.edges_during(t0, wave)[:revs + 1]
+        if len(homes) < revs + 1:
+            raise RuntimeError("home mark missed during calibration")
+        per_rev = (homes[-1] - homes[0]) / revs
+
+        if self.slots is not None:
+            marks = self.slots.edges_during(t0, wave)
+            n = len(STEPS_PER_SLOT)
+            sums = [0.0] * n
+            for h0, h1 in zip(homes, homes[1:]):
+                rev = [m for m in marks if h0 - DRIFT_TOL <= m < h1 - DRIFT_TOL]
+                if len(rev) != n:
+                    raise RuntimeError(f"saw {len(rev)} slot marks in one turn, expected {n}")
+                rev.append(h1)
+                for i in range(n):
+                    sums[i] += rev[i + 1] - rev[i]
+            table = [s / revs for s in sums]
+        else:                                   # home only: scale the pattern
+            k = per_rev / sum(STEPS_PER_SLOT)
+            table = [x * k for x in STEPS_PER_SLOT]
+
+        self.table = table
+        self.save()
+        ctl.set_table(table)
+        ctl.pos = (len(wave) - 1 - homes[-1]) % ctl.total
+        print(f"[calib] {per_rev:.1f} steps/rev, table saved")
+        return table
+
+def open_sensors(home_pin=HOME_PIN, slot_pin=SLOT_PIN):
+    """(home, slots) MarkSensors for the fitted pins, None for the rest."""
+    from gpiozero import DigitalInputDevice
+    home  = MarkSensor(DigitalInputDevice(home_pin)) if home_pin is not None else None
+    slots = MarkSensor(DigitalInputDevice(slot_pin)) if slot_pin is not None else None
+    return home, slots
+
+# ───────── simulated check ─────────
+if __name__ == "__main__":
+    import random, tempfile
+    import motion, sim
+
+    def run(calibrated, moves=2000, slip=0.003):
+        car = sim.SimCarousel(slip=slip)
+        cal = None
+        if calibrated:
+            cal = Calibrator(car.home, car.slots, os.path.join(tempfile.mkdtemp(), "cal.json"))
+        ctl = motion.MotionController(car, threaded=False, calib=cal)
+        ctl.verbose = False
+        if cal:
+            ctl.calibrate()
+            print("table", [round(x, 2) for x in cal.table])
+        rnd = random.Random(7)
+        worst = 0
+        for _ in range(moves):
+            slot = rnd.randrange(motion.N_SLOTS)
+            ctl.goto(slot)
+            d = abs(car.true - car.notches[slot])
+            worst = max(worst, min(d, car.total - d))
+        print(f"{'calibrated' if calibrated else 'open loop ':10}  {moves} moves, "
+              f"{car.missed} missed steps, worst slot error {worst} steps"
+              + (f", {cal.n_corrections} corrections" if cal else ""))
+
+    run(False)
+    run(True)
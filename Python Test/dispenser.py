@@ -0,0 +1,189 @@
+"""
+dispenser.py
+————————
+Kivy-free core of the pill-box: scheduled alarm → carousel move →
+LED / audio alert → stop or snooze.  GUI Dev.py wires it to the real
+devices and AlarmPopup; sim.py wires it to simulated ones.
+"""
+
+import threading
+from datetime import datetime, timedelta
+
+from alarm_scheduler import DAYS
+import dose_log, metrics
+
+SNOOZE_MIN     = 5
+MERGE_WINDOW_S = 120        # alarms this close together share one popup
+
+def slot_for(day, period):
+    """Carousel slot for (day, "Morning"/"Evening"); 0 = Sunday-Morning."""
+    return DAYS.index(day) * 2 + (0 if period == "Morning" else 1)
+
+def doses_of(args):
+    """Alarm-job args – (day, disp_time, period) triples, one after the
+    other – as (slot, day, disp_time, period) doses."""
+    return [(slot_for(args[i], args[i + 2]),) + tuple(args[i:i + 3])
+            for i in range(0, len(args), 3)]
+
+class Session:
+    """Alarms answered together: one popup, one carousel pass, one
+    LED / audio start and stop."""
+    def __init__(self, opened):
+        self.opened  = opened
+        self.doses   = []                   # (slot, day, disp_time, period)
+        self.changed = None                 # UI hook, called when a dose joins
+
+    @property
+    def slots(self):
+        return [d[0] for d in self.doses]
+
+    def lines(self):
+        return [f"{day}  {when}" for _, day, when, _ in self.doses]
+
+class Dispenser:
+    """show(session) opens the alarm UI; it is called on the scheduler
+    thread, so a GUI must hand it over to its own thread.
+    Alarms due within `window` s of each other are merged into the open
+    Session; a snooze is one one-shot carrying every dose of the session,
+    replacing any earlier snooze of those slots, so the job count stays
+    bounded and the snoozed doses come back as one session, one pass."""
+
+    def __init__(self, alarms, motor, sound, alarm_file,
+                 led=None, motion=None, store=None, show=None, log=None,
+                 window=MERGE_WINDOW_S, escalate=None):
+        self.alarms, self.motor, self.sound = alarms, motor, sound
+        self.alarm_file = alarm_file
+        self.led, self.motion, self.store = led, motion, store     # motion: sensors.MotionHub
+        self.show = show or (lambda session: None)
+        self.log  = log                         # dose_log.DoseLog, optional
+        self.escalate = escalate                # escalation.Escalator, optional
+        self.window  = window
+        self.session = None                     # alarm currently shown
+        self.snoozes = {}                       # slot → pending snooze Job (shared)
+        self._lock   = threading.Lock()
+
+    def now(self):
+        return datetime.fromtimestamp(self.alarms.clock.time())
+
+    def _log(self, kind, slots, arg=0):
+        if self.log is not None:
+            t = self.alarms.clock.time()
+            for slot in slots:
+                self.log.append(kind, slot, t, arg)
+
+    # ---- pipeline ----
+    def trigger_alarm(self, day, disp_time, period, *more):
+        """Scheduler thread.  Joins the open session, or opens one that
+        also takes every alarm due in the next `window` s (their next run
+        is skipped).  `more`: further (day, disp_time, period) triples, as
+        a snooze carries them."""
+        doses = doses_of((day, disp_time, period) + more)
+        with self._lock:
+            s = self.session
+            if s is None:
+                s = self.session = Session(self.alarms.clock.time())
+                for job in self.alarms.upcoming(s.opened + self.window):
+                    if job.fn == self.trigger_alarm:
+                        doses += self._absorb(job)
+                new, fresh = self._join(s, doses), True
+            else:
+                new, fresh = self._join(s, doses), False
+        if new:
+            self.motor.visit(new)               # one planned pass, queued
+        if fresh:
+            metrics.SESSIONS.inc("open")
+            self.show(s)
+            if self.escalate:
+                self.escalate.start(s)
+        elif new and s.changed:
+            s.changed()
+
+    def _absorb(self, job):
+        self.alarms.skip(job)
+        if job.one_shot and self.store:
+            self.store.remove_job(job)
+        return doses_of(job.args)
+
+    def _join(self, s, doses):
+        """Add doses for slots not yet in s; returns the new slots.  Lock held."""
+        new = []
+        for dose in doses:
+            slot = dose[0]
+            if slot in s.slots:
+                continue
+            s.doses.append(dose)
+            new.append(slot)
+        self._drop_snoozes(s.slots)             # the snoozed doses are back
+        self._log(dose_log.TRIGGER, new)
+        return new
+
+    def alert_on(self, s):
+        """LED + audio for session s; returns s, or None if s is no
+        longer the open session (already answered)."""
+        with self._lock:
+            if self.session is not s:
+                return None
+        if self.led: self.led.on()
+        self.sound.play(self.alarm_file)        # loop until Stop/Snooze
+        return s
+
+    def alert_off(self, s, how=None):
+        """Ends session s; how = "stop" / "pir" logs its doses as taken.
+        A session that is no longer open (snoozed, or a Stop queued
+        behind a newer alarm) leaves the current one alone."""
+        with self._lock:
+            if self.session is not s:
+                return
+            self.session = None
+        self._quiet(s)
+        if how:
+            self._answered(s, how)
+            self._log(dose_log.PIR if how == "pir" else dose_log.STOP, s.slots)
+
+    def snooze(self, s, minutes=SNOOZE_MIN):
+        """One one-shot re-trigger for every dose of session s; returns
+        it (None if s is no longer the open session)."""
+        nxt = self.now() + timedelta(minutes=minutes)
+        with self._lock:
+            if self.session is not s:
+                return None
+            self.session = None
+            self._answered(s, "snooze")
+            self._log(dose_log.SNOOZE, s.slots, minutes)
+            self._drop_snoozes(s.slots)
+            at = nxt.strftime("%I:%M %p")
+            job = self._snooze_job(nxt.timestamp(),
+                                   [(day, at, period) for _, day, _, period in s.doses])
+        self._quiet(s)
+        return job
+
+    def _quiet(self, s):
+        if self.led: self.led.off()
+        self.sound.stop()
+        if self.escalate: self.escalate.cancel(s)
+
+    def _answered(self, s, how):
+        metrics.SESSIONS.inc(how)
+        metrics.ANSWER.observe(self.alarms.clock.time() - s.opened)
+
+    def _snooze_job(self, when, doses):
+        """Lock held."""
+        job = self.alarms.once(when, self.trigger_alarm, *(x for d in doses for x in d))
+        for dose in doses_of(job.args):
+            self.snoozes[dose[0]] = job
+        if self.store:
+            self.store.add_job(job)
+        return job
+
+    def _drop_snoozes(self, slots):
+        """Take `slots` out of their pending snoozes; a snooze that still
+        carries other slots is put back with just those.  Lock held."""
+        for old in {self.snoozes[sl] for sl in slots if sl in self.snoozes}:
+            rest = [d[1:] for d in doses_of(old.args) if d[0] not in slots]
+            for d in doses_of(old.args):
+                self.snoozes.pop(d[0], None)
+            self.alarms.cancel(old)
+            if self.store:
+                self.store.remove_job(old)
+            if rest:
+                self._snooze_job(old.when, rest)
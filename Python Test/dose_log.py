@@ -0,0 +1,203 @@
+"""
+dose_log.py
+————————
+Append-only dose-event log (alarm fired, Stop, Snooze, PIR dismiss).
+Every event is one fixed 12-byte record, little-endian:
+  t     f8  wall time (epoch s, the scheduler's clock)
+  kind  u1  TRIGGER / STOP / SNOOZE / PIR
+  slot  u1  carousel slot 0-13
+  arg   u2  snooze minutes, otherwise 0
+Records are only ever appended, and append() takes the time and writes
+under one lock, holding t at the last written value if the clock went
+back (a backward step, or a caller's older timestamp) – so the file is
+in time order and the record number is the time index: queries mmap the
+file and bisect on t,
+then unpack just the records in range – no text parsing, and a write is
+12 bytes on the SD card instead of a formatted log line.
+Exports stream CSV / JSON one record at a time for clinicians.
+
+usage: python dose_log.py            (query timing on 5 simulated years)
+"""
+
+import csv, json, mmap, os, struct, threading, time
+from collections import namedtuple
+from datetime import datetime
+
+from alarm_scheduler import DAYS
+
+REC    = struct.Struct("<dBBH")
+TRIGGER, STOP, SNOOZE, PIR = 1, 2, 3, 4
+KINDS  = {TRIGGER: "trigger", STOP: "stop", SNOOZE: "snooze", PIR: "pir"}
+GRACE_S = 3600              # an alarm still unanswered after this counts as missed
+
+Event = namedtuple("Event", "t kind slot arg")
+Dose  = namedtuple("Dose", "slot t outcome answered")    # outcome: taken / missed / open
+
+def slot_name(slot):
+    return f"{DAYS[slot // 2]} {'Morning' if slot % 2 == 0 else 'Evening'}"
+
+class DoseLog:
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, "ab", buffering=0)      # one write() per record
+        self._mm, self._size = None, -1
+        self._lock = threading.Lock()               # scheduler, I/O worker, Kivy append
+        self._last = self._last_t()
+
+    # ---- writing ----
+    def append(self, kind, slot, t=None, arg=0):
+        """Returns the t written (never before the previous record's)."""
+        with self._lock:
+            t = max(time.time() if t is None else t, self._last)
+            self.f.write(REC.pack(t, kind, slot, arg))
+            self._last = t
+        return t
+
+    def _last_t(self):
+        n = len(self)
+        if not n:
+            return float("-inf")
+        with open(self.path, "rb") as f:
+            f.seek((n - 1) * REC.size)
+            return REC.unpack(f.read(REC.size))[0]
+
+    def close(self):
+        os.fsync(self.f.fileno())
+        self.f.close()
+        if self._mm is not None:
+            self._mm.close()
+
+    # ---- reading ----
+    def __len__(self):
+        return os.fstat(self.f.fileno()).st_size // REC.size
+
+    def _map(self):
+        """mmap of the whole file, re-mapped only when it has grown."""
+        size = len(self) * REC.size
+        if size != self._size:
+            if self._mm is not None:
+                self._mm.close()
+            self._mm = None
+            if size:
+                with open(self.path, "rb") as f:
+                    self._mm = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+            self._size = size
+        return self._mm
+
+    def _index(self, mm, t):
+        """First record number with time >= t (binary search on the mmap)."""
+        lo, hi = 0, self._size // REC.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if REC.unpack_from(mm, mid * REC.size)[0] < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def events(self, t0=0.0, t1=float("inf")):
+        mm = self._map()
+        if mm is None:
+            return
+        a, b = self._index(mm, t0), self._index(mm, t1)
+        for rec in REC.iter_unpack(mm[a * REC.size:b * REC.size]):
+            yield Event(*rec)
+
+    def doses(self, t0=0.0, t1=float("inf"), slot=None, now=None):
+        """One Dose per alarm in [t0, t1).  A snoozed alarm and its
+        re-triggers are one dose; it is taken once Stop or the PIR ends it."""
+        now = time.time() if now is None else now
+        pending, snoozed = {}, set()
+        for ev in self.events(t0, t1):
+            s = ev.slot
+            if slot is not None and s != slot:
+                continue
+            if ev.kind == TRIGGER:
+                if s in pending and s not in snoozed:
+                    yield Dose(s, pending[s], "missed", None)
+                if s not in pending or s not in snoozed:
+                    pending[s] = ev.t
+                snoozed.discard(s)
+            elif ev.kind == SNOOZE:
+                snoozed.add(s)
+            elif s in pending:                      # STOP / PIR
+                yield Dose(s, pending.pop(s), "taken", ev.t)
+                snoozed.discard(s)
+        for s, t in pending.items():
+            yield Dose(s, t, "open" if now - t < GRACE_S else "missed", None)
+
+    def missed(self, slot=None, days=90, now=None):
+        now = time.time() if now is None else now
+        return [d for d in self.doses(now - days * 86400, now, slot, now)
+                if d.outcome == "missed"]
+
+    # ---- export ----
+    def export_csv(self, out, t0=0.0, t1=float("inf")):
+        w = csv.writer(out)
+        w.writerow(["time", "event", "slot", "dose", "snooze_min"])
+        n = 0
+        for ev in self.events(t0, t1):
+            w.writerow([datetime.fromtimestamp(ev.t).isoformat(timespec="seconds"),
+                        KINDS[ev.kind], ev.slot, slot_name(ev.slot), ev.arg or ""])
+            n += 1
+        return n
+
+    def export_json(self, out, t0=0.0, t1=float("inf")):
+        """A JSON array, written record by record."""
+        out.write("[")
+        n = 0
+        for ev in self.events(t0, t1):
+            out.write(("," if n else "") + "\n " + json.dumps({
+                "time": datetime.fromtimestamp(ev.t).isoformat(timespec="seconds"),
+                "event": KINDS[ev.kind], "slot": ev.slot, "dose": slot_name(ev.slot),
+                **({"snooze_min": ev.arg} if ev.arg else {})}))
+            n += 1
+        out.write("\n]\n")
+        return n
+
+# ───────── query timing ─────────
+if __name__ == "__main__":
+    import io, random, tempfile
+
+    path = os.path.join(tempfile.mkdtemp(), "doses.log")
+    log = DoseLog(path)
+    rnd = random.Random(3)
+    t = datetime(2021, 1, 3).timestamp()
+    years = 5
+    for day in range(years * 365):                  # 2 doses/day, some snoozed or missed
+        for slot, hour in ((day % 7 * 2, 8), (day % 7 * 2 + 1, 20)):
+            at = t + day * 86400 + hour * 3600
+            log.append(TRIGGER, slot, at)
+            r = rnd.random()
+            if r < 0.1:
+                log.append(SNOOZE, slot, at + 20, 5)
+                log.append(TRIGGER, slot, at + 320)
+                log.append(STOP, slot, at + 340)
+            elif r > 0.95:
+                continue                            # never answered
+            else:
+                log.append(PIR if r < 0.6 else STOP, slot, at + 30)
+    now = t + years * 365 * 86400
+    print(f"{len(log)} records, {os.path.getsize(path)} bytes")
+
+    t0 = time.perf_counter()
+    miss = log.missed(slot=5, days=90, now=now)
+    print(f"missed doses slot 5 / 90 days: {len(miss)} in {(time.perf_counter() - t0) * 1000:.2f} ms")
+    t0 = time.perf_counter()
+    miss = log.missed(days=365 * years, now=now)
+    print(f"missed doses all slots / {years} years: {len(miss)} in {(time.perf_counter() - t0) * 1000:.1f} ms")
+    buf = io.StringIO()
+    t0 = time.perf_counter()
+    n = log.export_csv(buf)
+    print(f"CSV export {n} rows in {(time.perf_counter() - t0) * 1000:.0f} ms")
+    buf = io.StringIO()
+    log.export_json(buf, now - 7 * 86400, now)
+    json.loads(buf.getvalue())
+    log.append(TRIGGER, 3, now + 60)
+    log.append(STOP, 3, now - 3600)                 # clock stepped back an hour
+    log.close()
+    log = DoseLog(path)                             # last t read back on open
+    log.append(PIR, 3, now)
+    evs = list(log.events(now, now + 61))
+    assert [(e.kind, e.t) for e in evs] == [(TRIGGER, now + 60), (STOP, now + 60), (PIR, now + 60)], evs
+    log.close()
@@ -0,0 +1,455 @@
+"""
+escalation.py
+————————
+What happens when an alarm is ignored.
+  • Escalator – runs STEPS after a session opens (louder audio when it
+                started below full volume, a fresh repeat, then notify
+                the caregiver) as one-shot jobs on
+                the AlarmScheduler; Stop / Snooze / the PIR cancel what
+                is left and put the volume back
+  • Notifier  – fans an event out to pluggable sinks on its own asyncio
+                loop thread: all sinks concurrently, each with a small
+                connection pool and retry with backoff.  notify() only
+                queues, so a slow or dead sink never holds up the alarm
+                or the Kivy thread
+Sinks speak their protocol over asyncio streams, no extra packages:
+  • WebhookSink – HTTP/1.1 POST of the event as JSON (keep-alive)
+  • SmtpSink    – SMTP to a local relay / stand-in
+  • MqttSink    – MQTT 3.1.1 QoS 0 publish to a local broker
+Addresses are "host:port" or a Unix socket path, as in fleet.py.
+
+usage: python escalation.py      (demo against local stand-in servers)
+"""
+
+import abc, asyncio, contextlib, json, socket, threading, time
+from collections import deque, namedtuple
+from datetime import datetime
+
+from fleet import open_connection
+import dose_log
+
+ALARM_VOLUME = 0.6          # start volume; the "louder" step takes it to full
+BACKOFF_S    = (0.5, 2, 8)  # waits between attempts; len = retries
+TIMEOUT_S    = 5            # per attempt, connect included
+POOL_SIZE    = 2            # connections per sink
+
+Step  = namedtuple("Step", "after action arg")      # after: s since the session opened
+STEPS = (Step(60,  "louder", 1.0),
+         Step(180, "repeat", None),
+         Step(300, "notify", None))
+
+# ───────── escalation ─────────
+class Escalator:
+    """run(fn, *args) is where device calls go (GUI: ui_async.run_io);
+    inline by default."""
+
+    def __init__(self, alarms, sound, alarm_file, notifier=None, led=None,
+                 steps=STEPS, volume=ALARM_VOLUME, device=None, run=None):
+        self.alarms, self.sound, self.alarm_file = alarms, sound, alarm_file
+        self.notifier, self.led = notifier, led
+        self.steps, self.volume = steps, volume
+        self.device  = device or socket.gethostname()
+        self.run     = run or (lambda fn, *args: fn(*args))
+        self.session = None
+        self.jobs    = []
+        self.fired   = []                   # (t, action) of the current session
+        self._lock   = threading.Lock()
+
+    def start(self, session):
+        """A new session was shown (scheduler thread)."""
+        with self._lock:
+            self._drop()
+            self.session, self.fired = session, []
+            self.jobs = [self.alarms.once(session.opened + st.after, self._step, session, st)
+                         for st in self.steps
+                         if not (st.action == "louder" and st.arg <= self.volume)]
+        self.run(self.sound.set_volume, self.volume)
+
+    def cancel(self, session=None):
+        """Session answered or snoozed (None = whichever is running)."""
+        with self._lock:
+            if self.session is None or session not in (None, self.session):
+                return
+            self._drop()
+            self.session = None
+        self.run(self.sound.set_volume, self.volume)
+
+    def _drop(self):
+        for job in self.jobs:
+            self.alarms.cancel(job)
+        self.jobs = []
+
+    def _step(self, session, step):
+        with self._lock:
+            if session is not self.session:
+                return                      # a stale job that fired anyway
+            self.fired.append((self.alarms.clock.time(), step.action))
+        if step.action == "louder":
+            self.run(self.sound.set_volume, step.arg)
+        elif step.action == "repeat":
+            self.run(self._repeat)
+        elif step.action == "notify" and self.notifier is not None:
+            self.notifier.notify(self.event(session))
+
+    def _repeat(self):
+        self.sound.stop()
+        self.sound.play(self.alarm_file)
+        if self.led is not None:
+            self.led.on()                   # pattern starts over
+
+    def event(self, session):
+        now = self.alarms.clock.time()
+        return {"device": self.device, "event": "dose_unanswered",
+                "opened": datetime.fromtimestamp(session.opened).isoformat(timespec="seconds"),
+                "waiting_s": round(now - session.opened),
+                "doses": [dose_log.slot_name(slot) for slot in session.slots]}
+
+# ───────── delivery ─────────
+class _Conn:
+    __slots__ = ("reader", "writer", "keep")
+
+    def __init__(self, reader, writer):
+        self.reader, self.writer, self.keep = reader, writer, True
+
+class Pool:
+    """Up to `size` connections to one address, reused while healthy.
+    greet(conn) runs once on every new connection (protocol handshake)."""
+
+    def __init__(self, addr, size=POOL_SIZE, greet=None):
+        self.addr, self.size, self.greet = addr, size, greet
+        self.opened = 0
+        self._idle  = []
+        self._sem   = None                  # made on the loop that uses it
+
+    @contextlib.asynccontextmanager
+    async def conn(self):
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.size)
+        async with self._sem:
+            c = None
+            while self._idle and c is None:
+                c = self._idle.pop()
+                if c.writer.is_closing() or c.reader.at_eof():
+                    c.writer.close(); c = None
+            if c is None:
+                c = _Conn(*await open_connection(self.addr))
+                self.opened += 1
+                if self.greet is not None:
+                    try:
+                        await self.greet(c)
+                    except BaseException:
+                        c.writer.close()
+                        raise
+            try:
+                yield c
+            except BaseException:
+                c.writer.close()
+                raise
+            if c.keep:
+                self._idle.append(c)
+            else:
+                c.writer.close()
+
+    def close(self):
+        for c in self._idle:
+            c.writer.close()
+        self._idle = []
+
+class Sink(abc.ABC):
+    """send(event) is one attempt; raise OSError / ValueError to retry."""
+    name = "sink"
+
+    def __init__(self, addr, pool_size=POOL_SIZE):
+        self.addr = addr
+        self.pool = Pool(addr, pool_size, self.greet)
+
+    async def greet(self, conn):
+        pass
+
+    @abc.abstractmethod
+    async def send(self, event):
+        ...
+
+class WebhookSink(Sink):
+    name = "webhook"
+
+    def __init__(self, addr, path="/", pool_size=POOL_SIZE):
+        super().__init__(addr, pool_size)
+        self.path = path
+
+    async def send(self, event):
+        body = json.dumps(event).encode()
+        host = self.addr if ":" in self.addr else "localhost"
+        async with self.pool.conn() as c:
+            c.writer.write(f"POST {self.path} HTTP/1.1\r\nHost: {host}\r\n"
+                           f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                           f"Connection: keep-alive\r\n\r\n".encode() + body)
+            await c.writer.drain()
+            status = await c.reader.readline()
+            parts = status.split()
+            if len(parts) < 2 or not parts[1].isdigit():
+                raise ValueError(f"bad HTTP status line {status[:40]!r}")
+            length = None
+            while True:
+                line = await c.reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                key, _, value = line.decode("latin-1").partition(":")
+                key = key.strip().lower()
+                if key == "content-length":
+                    length = int(value)
+                elif key == "connection" and value.strip().lower() == "close":
+                    c.keep = False
+            if length is None:
+                c.keep = False              # body runs to EOF; not worth reading
+            elif length:
+                await c.reader.readexactly(length)
+            if int(parts[1]) >= 300:
+                raise ValueError(f"HTTP {int(parts[1])}")
+
+class SmtpSink(Sink):
+    name = "smtp"
+
+    def __init__(self, addr, to, sender="pillbox@localhost", pool_size=POOL_SIZE):
+        super().__init__(addr, pool_size)
+        self.to = [to] if isinstance(to, str) else list(to)
+        self.sender = sender
+
+    @staticmethod
+    async def _reply(c, expect):
+        while True:
+            line = await c.reader.readline()
+            if len(line) < 4:
+                raise ValueError("SMTP connection closed")
+            if line[3:4] != b"-":
+                break
+        if not line.startswith(expect):
+            raise ValueError(f"SMTP {line.decode(errors='replace').strip()}")
+
+    async def _cmd(self, c, text, expect=b"250"):
+        c.writer.write(text.encode() + b"\r\n")
+        await c.writer.drain()
+        await self._reply(c, expect)
+
+    async def greet(self, c):
+        await self._reply(c, b"220")
+        await self._cmd(c, f"EHLO {socket.gethostname()}")
+
+    async def send(self, event):
+        doses = ", ".join(event["doses"])
+        lines = [f"From: {self.sender}", f"To: {', '.join(self.to)}",
+                 f"Subject: [{event['device']}] dose not taken: {doses}", "",
+                 f"Alarm opened {event['opened']}, unanswered for {event['waiting_s'] // 60} min.",
+                 f"Doses: {doses}"]
+        data = "\r\n".join("." + l if l.startswith(".") else l for l in lines)
+        async with self.pool.conn() as c:
+            await self._cmd(c, f"MAIL FROM:<{self.sender}>")
+            for rcpt in self.to:
+                await self._cmd(c, f"RCPT TO:<{rcpt}>")
+            await self._cmd(c, "DATA", b"354")
+            await self._cmd(c, data + "\r\n.")
+
+def _mqtt_str(s):
+    b = s.encode()
+    return len(b).to_bytes(2, "big") + b
+
+def _mqtt_packet(kind, body):
+    n, out = len(body), bytearray([kind])
+    while True:                             # remaining length, base-128 varint
+        byte, n = n % 128, n // 128
+        out.append(byte | (0x80 if n else 0))
+        if not n:
+            return bytes(out) + body
+
+class MqttSink(Sink):
+    name = "mqtt"
+
+    def __init__(self, addr, topic="pillbox/alerts", client_id=None, pool_size=1):
+        super().__init__(addr, pool_size)
+        self.topic = topic
+        self.client_id = client_id or f"pillbox-{socket.gethostname()}"
+
+    async def greet(self, c):
+        c.writer.write(_mqtt_packet(0x10, _mqtt_str("MQTT") + bytes([4, 0x02, 0, 0])
+                                    + _mqtt_str(self.client_id)))   # clean session, no keepalive
+        await c.writer.drain()
+        ack = await c.reader.readexactly(4)
+        if ack[0] != 0x20 or ack[3] != 0:
+            raise ValueError(f"MQTT connect refused ({ack[3]})")
+
+    async def send(self, event):
+        async with self.pool.conn() as c:
+            c.writer.write(_mqtt_packet(0x30, _mqtt_str(self.topic) + json.dumps(event).encode()))
+            await c.writer.drain()
+
+Delivery = namedtuple("Delivery", "sink ok tries seconds error")
+
+class Notifier:
+    """Owns an asyncio loop on a daemon thread, started on first use."""
+
+    def __init__(self, sinks=(), backoff=BACKOFF_S, timeout=TIMEOUT_S):
+        self.sinks, self.backoff, self.timeout = list(sinks), backoff, timeout
+        self.log   = deque(maxlen=100)      # Delivery per sink per event
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="notify",
+                                 daemon=True).start()
+        return self._loop
+
+    def notify(self, event):
+        """Any thread, returns at once.  The concurrent Future resolves to
+        one Delivery per sink."""
+        if not self.sinks:
+            return None
+        return asyncio.run_coroutine_threadsafe(self._fanout(event), self._start())
+
+    async def _fanout(self, event):
+        """A sink failing in an unexpected way doesn't stop the others."""
+        out = await asyncio.gather(*(self._deliver(s, event) for s in self.sinks),
+                                   return_exceptions=True)
+        for i, (sink, d) in enumerate(zip(self.sinks, out)):
+            if isinstance(d, BaseException):
+                print(f"Notify error: {sink.name} failed:", repr(d))
+                out[i] = Delivery(sink.name, False, 1, 0.0, repr(d))
+                self.log.append(out[i])
+        return out
+
+    async def _deliver(self, sink, event):
+        t0, err = time.perf_counter(), None
+        for tries in range(1, len(self.backoff) + 2):
+            try:
+                await asyncio.wait_for(sink.send(event), self.timeout)
+                err = None
+                break
+            except (OSError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                err = e
+            if tries <= len(self.backoff):
+                await asyncio.sleep(self.backoff[tries - 1])
+        d = Delivery(sink.name, err is None, tries, time.perf_counter() - t0,
+                     None if err is None else repr(err))
+        if err is not None:
+            print(f"Notify error: {sink.name} gave up after {tries} tries:", err)
+        self.log.append(d)
+        return d
+
+    def close(self):
+        if self._loop is None:
+            return
+        for s in self.sinks:
+            self._loop.call_soon_threadsafe(s.pool.close)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+def sinks_from_env(env):
+    """PILLBOX_WEBHOOK=host:port[/path]  PILLBOX_SMTP=host:port + PILLBOX_MAIL_TO
+    PILLBOX_MQTT=host:port[/topic] – whichever are set."""
+    out = []
+    if env.get("PILLBOX_WEBHOOK"):
+        addr, _, path = env["PILLBOX_WEBHOOK"].partition("/")
+        out.append(WebhookSink(addr, "/" + path))
+    if env.get("PILLBOX_SMTP") and env.get("PILLBOX_MAIL_TO"):
+        out.append(SmtpSink(env["PILLBOX_SMTP"], env["PILLBOX_MAIL_TO"].split(",")))
+    if env.get("PILLBOX_MQTT"):
+        addr, _, topic = env["PILLBOX_MQTT"].partition("/")
+        out.append(MqttSink(addr, topic or "pillbox/alerts"))
+    return out
+
+# ───────── demo: local stand-ins, one slow, one flaky ─────────
+if __name__ == "__main__":
+    import sim
+
+    got = {"webhook": 0, "smtp": 0, "mqtt": 0}
+    smtp_fail = [1]                         # refuse the first message
+
+    async def http(reader, writer):
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n") if not reader.at_eof() else b""
+            if not head:
+                break
+            n = int(head.lower().split(b"content-length:")[1].split(b"\r\n")[0])
+            await reader.readexactly(n)
+            await asyncio.sleep(1.5)        # slow receiver
+            got["webhook"] += 1
+            writer.write(b"HTTP/1.1 204 No Content\r\nContent-Length: 0\r\n\r\n")
+            await writer.drain()
+
+    async def smtp(reader, writer):
+        writer.write(b"220 stand-in\r\n")
+        data = False
+        async for line in reader:
+            if data:
+                if line == b".\r\n":
+                    data = False
+                    if smtp_fail[0]:
+                        smtp_fail[0] -= 1
+                        writer.write(b"451 try again\r\n")
+                    else:
+                        got["smtp"] += 1
+                        writer.write(b"250 queued\r\n")
+                continue
+            cmd = line[:4].upper()
+            writer.write(b"354 go\r\n" if cmd == b"DATA" else
+                         b"250-stand-in\r\n250 OK\r\n" if cmd == b"EHLO" else b"250 OK\r\n")
+            data = cmd == b"DATA"
+
+    async def mqtt(reader, writer):
+        while True:
+            head = await reader.read(1)
+            if not head:
+                break
+            n, shift = 0, 0
+            while True:
+                b = (await reader.readexactly(1))[0]
+                n |= (b & 0x7f) << shift; shift += 7
+                if not b & 0x80:
+                    break
+            await reader.readexactly(n)
+            if head[0] == 0x10:
+                writer.write(b"\x20\x02\x00\x00")
+            elif head[0] & 0xf0 == 0x30:
+                got["mqtt"] += 1
+
+    servers, addrs = asyncio.new_event_loop(), []
+    for handler in (http, smtp, mqtt):
+        srv = servers.run_until_complete(asyncio.start_server(handler, "127.0.0.1", 0))
+        addrs.append(f"127.0.0.1:{srv.sockets[0].getsockname()[1]}")
+    threading.Thread(target=servers.run_forever, daemon=True).start()
+
+    class BrokenSink(Sink):
+        name = "broken"
+        async def send(self, event):
+            raise RuntimeError("bug in a sink")     # not a retryable error
+
+    notifier = Notifier([WebhookSink(addrs[0], "/alert"), SmtpSink(addrs[1], "carer@localhost"),
+                         MqttSink(addrs[2]), BrokenSink(addrs[2])], backoff=(0.2, 0.5))
+    box, popups = sim.build(react_s=None)   # nobody ever answers
+    esc = box.escalate = Escalator(box.alarms, box.sound, box.alarm_file, notifier,
+                                   led=box.led, device="demo")
+    box.alarms.once(box.alarms.clock.time() + 10, box.trigger_alarm,
+                    "Sunday", "08:00 AM", "Morning")
+    t0 = time.perf_counter()
+    box.alarms.run_until(box.alarms.clock.time() + 600)
+    print(f"600 virtual s, escalation steps {[a for _, a in esc.fired]} "
+          f"in {(time.perf_counter() - t0) * 1000:.1f} ms wall (notify only queues)")
+    t0 = time.perf_counter()
+    extra = [notifier.notify(esc.event(popups[0].session)) for _ in range(3)]
+    print(f"3 more notify() calls took {(time.perf_counter() - t0) * 1e6:.0f} µs")
+    for fut in extra:
+        assert [d.ok for d in fut.result(timeout=30)][-1:] == [False]
+    while sum(got.values()) < 12 and time.perf_counter() - t0 < 30:
+        time.sleep(0.05)
+    for d in notifier.log:
+        print(f"  {d.sink:8} ok={d.ok} tries={d.tries} {d.seconds * 1000:6.0f} ms")
+    print("received", got, " connections opened",
+          {s.name: s.pool.opened for s in notifier.sinks})
+    print(f"volume now {box.sound.volume}, audio log {[(e[1]) for e in box.sound.log]}")
+    assert esc.fired[0][1] == "louder" and len(esc.fired) == len(STEPS)
+    full = Escalator(box.alarms, box.sound, box.alarm_file, volume=1.0)
+    full.start(popups[0].session)                # nothing louder to go to
+    assert len(full.jobs) == len(STEPS) - 1 and box.sound.volume == 1.0
+    full.cancel()
+    notifier.close()
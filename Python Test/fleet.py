@@ -0,0 +1,282 @@
+"""
+fleet.py
+————————
+Fleet schedule sync, newline-delimited JSON over a Unix socket or TCP.
+  • FleetManager – one asyncio loop holding the alarms of N devices;
+                   changes are batched per device for FLUSH_S and pushed
+                   as deltas (only the alarm ids that changed)
+  • FleetDevice  – device side, applies a delta to its AlarmScheduler
+                   job-by-job instead of rebuilding every job, and to the
+                   ScheduleStore if given, so pushed alarms survive a reboot
+A message that isn't valid JSON, or lacks a field, is logged and the
+connection dropped; a device applies a delta only once all of it parsed.
+
+Messages, one JSON object per line:
+  device → mgr   {"hello": "<device id>", "e": <epoch>, "v": <last applied version>}
+  mgr → device   {"e": epoch, "v": n, "full": bool, "set": [[id, day, at, when, args]...],
+                  "del": [id...]}
+  device → mgr   {"ack": n}
+  admin  → mgr   {"op": "set", "device": d, "id": a, "day": 0-6|null, "at": "HH:MM"|null,
+                  "when": epoch|null, "args": [...]}
+                 {"op": "del", "device": d, "id": a}
+                 {"op": "ping"}  → {"ok": true, "devices": n, "connected": n}
+
+Versions count from 0 each time a manager starts; "e" names that start,
+so a device's saved version is only trusted by the manager that issued it.
+
+Run a manager:  python fleet.py serve /tmp/fleet.sock   (or  serve 0.0.0.0:7400)
+"""
+
+import asyncio, json, os, sqlite3, sys, threading, uuid
+from collections import deque
+
+FLUSH_S = 0.2           # batch window for pushes
+LOG_MAX = 256           # per-device change log; older clients get a full sync
+RETRY_S = (1, 2, 5, 10) # device reconnect backoff
+BACKLOG = 1024          # pending connects; a fleet boot ramps hundreds at once
+                        # (the kernel caps it at net.core.somaxconn)
+
+# ───────── manager ─────────
+class _Dev:
+    __slots__ = ("alarms", "version", "log", "writer", "sent_v", "acked")
+
+    def __init__(self):
+        self.alarms  = {}                   # alarm id → [day, at, when, args]
+        self.version = 0
+        self.log     = deque(maxlen=LOG_MAX)    # (version, alarm id)
+        self.writer  = None
+        self.sent_v  = 0
+        self.acked   = 0
+
+    def delta(self, since):
+        """Message bringing a client at version `since` up to date, or None."""
+        if since == self.version:
+            return None
+        full = since > self.version or not self.log or since < self.log[0][0] - 1
+        if full:
+            ids = self.alarms.keys()
+        else:
+            ids = {aid for v, aid in self.log if v > since}
+        sets = [[aid] + self.alarms[aid] for aid in ids if aid in self.alarms]
+        dels = [] if full else [aid for aid in ids if aid not in self.alarms]
+        return {"v": self.version, "full": full, "set": sets, "del": dels}
+
+class FleetManager:
+    def __init__(self, flush_s=FLUSH_S):
+        self.devs    = {}
+        self.epoch   = uuid.uuid4().hex[:12]    # this start's version numbering
+        self.flush_s = flush_s
+        self._dirty  = set()
+        self._server = None
+        self._flusher = None
+
+    # ---- schedule edits ----
+    def _dev(self, device):
+        dev = self.devs.get(device)
+        if dev is None:
+            dev = self.devs[device] = _Dev()
+        return dev
+
+    def _touch(self, device, dev, aid):
+        dev.version += 1
+        dev.log.append((dev.version, aid))
+        self._dirty.add(device)
+
+    def set_alarm(self, device, aid, day=None, at=None, when=None, args=()):
+        dev = self._dev(device)
+        dev.alarms[aid] = [day, at, when, list(args)]
+        self._touch(device, dev, aid)
+
+    def del_alarm(self, device, aid):
+        dev = self._dev(device)
+        if dev.alarms.pop(aid, None) is not None:
+            self._touch(device, dev, aid)
+
+    # ---- server ----
+    async def serve(self, addr, backlog=BACKLOG):
+        """addr: filesystem path (Unix socket) or "host:port"."""
+        if ":" in addr and os.sep not in addr:
+            host, port = addr.rsplit(":", 1)
+            self._server = await asyncio.start_server(self._client, host, int(port),
+                                                      backlog=backlog)
+        else:
+            if os.path.exists(addr):
+                os.unlink(addr)
+            self._server = await asyncio.start_unix_server(self._client, addr,
+                                                           backlog=backlog)
+        self._flusher = asyncio.ensure_future(self._flush_loop())
+        return self._server
+
+    async def close(self):
+        if self._flusher:
+            self._flusher.cancel()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _client(self, reader, writer):
+        try:
+            line = await reader.readline()
+            if not line:
+                return
+            msg = json.loads(line)
+            if "hello" in msg:
+                await self._device(msg, reader, writer)
+            else:
+                await self._admin(msg, reader, writer)
+        except (ConnectionError, ValueError, KeyError, TypeError) as e:
+            print("[fleet] client error:", repr(e))
+        finally:
+            writer.close()
+
+    async def _device(self, hello, reader, writer):
+        device = hello["hello"]
+        dev = self._dev(device)
+        if hello.get("e") == self.epoch:
+            since = int(hello.get("v", 0))
+        else:                               # another start's version: full sync, unless
+            since = -1 if dev.version else 0    # there is nothing here to send yet
+        dev.writer, dev.sent_v = writer, since
+        self._dirty.add(device)             # catch up on the next flush
+        try:
+            async for line in reader:
+                msg = json.loads(line)
+                if "ack" in msg:
+                    dev.acked = msg["ack"]
+        finally:
+            if dev.writer is writer:
+                dev.writer = None
+
+    async def _admin(self, msg, reader, writer):
+        while msg is not None:
+            op = msg.get("op")
+            if op == "set":
+                self.set_alarm(msg["device"], msg["id"], msg.get("day"), msg.get("at"),
+                               msg.get("when"), msg.get("args", ()))
+            elif op == "del":
+                self.del_alarm(msg["device"], msg["id"])
+            elif op == "ping":
+                live = sum(1 for d in self.devs.values() if d.writer is not None)
+                writer.write(b'{"ok": true, "devices": %d, "connected": %d}\n'
+                             % (len(self.devs), live))
+                await writer.drain()
+            line = await reader.readline()
+            msg = json.loads(line) if line else None
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_s)
+            self.flush()
+
+    def flush(self):
+        """Push one batched delta to every connected device with changes."""
+        dirty, self._dirty = self._dirty, set()
+        for device in dirty:
+            dev = self.devs[device]
+            if dev.writer is None:
+                continue
+            msg = dev.delta(dev.sent_v)
+            if msg is None:
+                continue
+            msg["e"] = self.epoch
+            dev.writer.write(json.dumps(msg, separators=(",", ":")).encode() + b"\n")
+            dev.sent_v = dev.version
+
+# ───────── device side ─────────
+class FleetDevice:
+    """Keeps `sched` in step with the manager.  fn(*args) is the alarm
+    callback; store: schedule_store.ScheduleStore, optional – pushed alarms
+    and the version they make up are kept there, so after a reboot the
+    device is re-armed from it and only asks for what changed since."""
+
+    def __init__(self, device_id, sched, fn, store=None):
+        self.device_id = device_id
+        self.sched, self.fn, self.store = sched, fn, store
+        self.jobs = store.load_fleet(sched, fn) if store else {}    # alarm id → Job
+        self.e, self.v = store.fleet_version() if store else (None, 0)
+        self.applied = 0                    # deltas applied (for tests)
+
+    def apply(self, msg):
+        """Raises KeyError / TypeError / ValueError on a malformed delta,
+        before touching any job."""
+        sched = self.sched
+        e, v, dels, new = msg.get("e"), int(msg["v"]), list(msg["del"]), {}
+        for aid, day, at, when, args in msg["set"]:
+            new[aid] = (sched.make_once(when, self.fn, *args) if at is None
+                        else sched.make_every(day, at, self.fn, *args))
+        gone = [self.jobs.pop(aid) for aid in dels + list(new) if aid in self.jobs]
+        if msg.get("full"):
+            gone += [self.jobs.pop(aid) for aid in list(self.jobs)]
+        for job in gone:
+            sched.cancel(job)
+        self.jobs.update(new)
+        if new:
+            sched.add_many(new.values())
+        if self.store:
+            self.store.apply_fleet(gone, list(new.values()), list(new), (e, v))
+        self.e, self.v = e, v
+        self.applied += 1
+
+    async def session(self, reader, writer):
+        """One connection: hello, then apply + ack every delta until EOF."""
+        writer.write(json.dumps({"hello": self.device_id, "e": self.e, "v": self.v}).encode()
+                     + b"\n")
+        async for line in reader:
+            self.apply(json.loads(line))
+            writer.write(b'{"ack": %d}\n' % self.v)
+
+    async def run(self, addr):
+        """Stay connected, reconnecting with backoff."""
+        tries = 0
+        while True:
+            try:
+                reader, writer = await open_connection(addr)
+                tries = 0
+                try:
+                    await self.session(reader, writer)
+                finally:
+                    writer.close()
+            except (OSError, ValueError, KeyError, TypeError, sqlite3.Error) as e:
+                print("[fleet] sync error:", repr(e))
+            await asyncio.sleep(RETRY_S[min(tries, len(RETRY_S) - 1)])
+            tries += 1
+
+    def start(self, addr):
+        """Background thread with its own loop (for the GUI app)."""
+        t = threading.Thread(target=lambda: asyncio.run(self.run(addr)), daemon=True)
+        t.start()
+        return t
+
+async def open_connection(addr):
+    if ":" in addr and os.sep not in addr:
+        host, port = addr.rsplit(":", 1)
+        return await asyncio.open_connection(host, int(port))
+    return await asyncio.open_unix_connection(addr)
+
+async def admin(addr, msgs):
+    """Send admin ops (iterable of dicts) and wait for the manager's ping reply."""
+    reader, writer = await open_connection(addr)
+    for i, m in enumerate(msgs):
+        writer.write(json.dumps(m).encode() + b"\n")
+        if i % 1000 == 999:
+            await writer.drain()
+    writer.write(b'{"op": "ping"}\n')
+    await writer.drain()
+    reply = json.loads(await reader.readline())
+    writer.close()
+    return reply
+
+async def _serve_forever(addr):
+    mgr = FleetManager()
+    server = await mgr.serve(addr)
+    print("[fleet] manager on", addr)
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "serve":
+        sys.exit("usage: python fleet.py serve <socket path | host:port>")
+    try:
+        asyncio.run(_serve_forever(sys.argv[2]))
+    except KeyboardInterrupt:
+        pass
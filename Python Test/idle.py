@@ -0,0 +1,211 @@
+"""
+idle.py
+————————
+Power-aware idle mode for the touch screen.
+After IDLE_AFTER_S without a touch (and with no alarm showing) the
+IdleManager
+  • drops Kivy to IDLE_FPS and cancels its registered timers
+  • releases the audio device and the stepper driver's enable line
+and brings everything back on the next touch, on wake() (alarm popup)
+or WAKE_LEAD_S ahead of the scheduler's next alarm – re-armed whenever
+a job lands ahead of it (snooze, fleet push, regimen import).
+Kivy has no public run-time frame cap: Config's maxfps is read once into
+Clock._max_fps and then on every frame.  set_frame_cap() writes it only
+on the Kivy versions it was checked against (2.x); elsewhere idle just
+relies on its timers being cancelled.
+WakeStats reports CPU wakeups per minute in each state: context
+switches of the whole process (/proc), Kivy frames, scheduler wakeups.
+"""
+
+import glob, threading, time
+
+import kivy
+from kivy.clock import Clock
+from kivy.config import Config
+
+from ui_async import run_io
+
+IDLE_AFTER_S = 120          # no touch for this long → idle
+IDLE_FPS     = 2            # frame cap while idle (touch latency ≤ 0.5 s)
+WAKE_LEAD_S  = 30           # wake this long before the next alarm
+
+FPS_CAP_OK = kivy.__version__.split(".")[0] == "2" and hasattr(Clock, "_max_fps")
+
+def set_frame_cap(fps):
+    """True if Kivy now caps frames at fps."""
+    if not FPS_CAP_OK:
+        return False
+    Clock._max_fps = float(fps)             # read by Kivy on every frame
+    return True
+
+def _ctx_switches():
+    """Voluntary + involuntary context switches over all our threads."""
+    n = 0
+    for path in glob.glob("/proc/self/task/*/status"):
+        try:
+            with open(path) as f:
+                for line in f:
+                    if "ctxt_switches" in line:
+                        n += int(line.split()[1])
+        except OSError:
+            pass                            # thread exited meanwhile
+    return n
+
+class WakeStats:
+    """Per-state totals of wakeup counters, sampled on every state change."""
+    def __init__(self, alarms=None):
+        self.alarms = alarms
+        self.totals = {}                    # state → [seconds, ctx, frames, sched]
+        self.state  = None
+        self._mark  = None
+
+    def _sample(self):
+        return (time.monotonic(), _ctx_switches(), Clock.frames,
+                self.alarms.wakeups if self.alarms else 0)
+
+    def switch(self, state):
+        now = self._sample()
+        if self.state is not None:
+            acc = self.totals.setdefault(self.state, [0.0, 0, 0, 0])
+            for i, (a, b) in enumerate(zip(self._mark, now)):
+                acc[i] += b - a
+        self.state, self._mark = state, now
+
+    def report(self):
+        self.switch(self.state)             # fold in the current stretch
+        lines = ["wakeups / min     ctx-switch   frames   scheduler"]
+        for state, (secs, ctx, frames, sched) in sorted(self.totals.items()):
+            per = 60 / secs if secs else 0
+            lines.append(f"  {state:8} {secs / 60:6.1f} min {ctx * per:9.0f} "
+                         f"{frames * per:8.0f} {sched * per:10.1f}")
+        return "\n".join(lines)
+
+class IdleManager:
+    def __init__(self, alarms, sound=None, motor=None, busy=lambda: False,
+                 idle_after=IDLE_AFTER_S, lead=WAKE_LEAD_S):
+        self.alarms, self.sound, self.motor = alarms, sound, motor
+        self.busy = busy                    # True while an alarm is showing
+        self.idle_after, self.lead = idle_after, lead
+        self.idle   = False
+        self.timers = []                    # [fn, interval, ClockEvent | None, refresh]
+        self.stats  = WakeStats(alarms)
+        self.active_fps = Config.getint("graphics", "maxfps")
+        self._last  = time.monotonic()
+        self._check = self._alarm_ev = None
+        self._ui    = None
+        alarms.next_hooks.append(self._earlier)
+
+    # ---- timers that only run while someone is looking ----
+    def interval(self, fn, seconds, refresh=True):
+        """refresh: also call fn(0) on wake, before the first interval."""
+        t = [fn, seconds, None, refresh]
+        self.timers.append(t)
+        if not self.idle:
+            t[2] = Clock.schedule_interval(fn, seconds)
+        return t
+
+    # ---- lifecycle (Kivy thread) ----
+    def start(self):
+        from kivy.core.window import Window
+        self._ui = threading.get_ident()
+        Window.bind(on_touch_down=self._touched, on_key_down=self._touched)
+        self.stats.switch("active")
+        self._arm_check(self.idle_after)
+
+    def _touched(self, *_):
+        self._last = time.monotonic()
+        if self.idle:
+            self._wake("touch")
+        return False                        # never swallow the event
+
+    def _arm_check(self, delay):
+        if self._check is not None:
+            self._check.cancel()
+        self._check = Clock.schedule_once(self._maybe_idle, delay)
+
+    def _maybe_idle(self, _dt):
+        left = self.idle_after - (time.monotonic() - self._last)
+        if left > 0 or self.busy():
+            self._arm_check(left if left > 0 else 5)    # alarm showing: look again soon
+            return
+        self._sleep()
+
+    def _sleep(self):
+        self.idle = True
+        self.stats.switch("idle")
+        set_frame_cap(IDLE_FPS)
+        for t in self.timers:
+            if t[2] is not None:
+                t[2].cancel(); t[2] = None
+        if self.sound is not None:
+            run_io(self.sound.release)
+        if self.motor is not None:
+            self.motor.release()            # after any queued move
+        self._arm_alarm()
+        print("[idle] sleeping")
+
+    def _earlier(self, t):
+        """Scheduler hook, any thread: a job may now be the next alarm."""
+        if self.idle:
+            Clock.schedule_once(lambda dt: self._arm_alarm())
+
+    def _arm_alarm(self):
+        if self._alarm_ev is not None:
+            self._alarm_ev.cancel(); self._alarm_ev = None
+        nxt = self.alarms.next_run()
+        if self.idle and nxt is not None:
+            self._alarm_ev = Clock.schedule_once(
+                lambda dt: self._wake("alarm"),
+                max(0, nxt - self.lead - self.alarms.clock.time()))
+
+    def wake(self, why="alarm"):
+        """Any thread."""
+        if threading.get_ident() == self._ui:
+            self._wake(why)
+        else:
+            Clock.schedule_once(lambda dt: self._wake(why))
+
+    def _wake(self, why):
+        self._last = time.monotonic()
+        if not self.idle:
+            return
+        self.idle = False
+        self.stats.switch("active")
+        set_frame_cap(self.active_fps)
+        if self._alarm_ev is not None:
+            self._alarm_ev.cancel(); self._alarm_ev = None
+        for t in self.timers:
+            if t[3]:
+                t[0](0)                     # refresh now, then on schedule
+            t[2] = Clock.schedule_interval(t[0], t[1])
+        if self.sound is not None:
+            run_io(self.sound.reopen)       # re-decode before the alarm needs it
+        self._arm_check(self.idle_after)
+        print("[idle] awake:", why)
+
+# ───────── checks (no window) ─────────
+if __name__ == "__main__":
+    from alarm_scheduler import AlarmScheduler
+
+    if FPS_CAP_OK:
+        before = Clock._max_fps
+        assert set_frame_cap(IDLE_FPS) and Clock._max_fps == IDLE_FPS
+        set_frame_cap(before)
+    print(f"frame cap at run time: {'Clock._max_fps' if FPS_CAP_OK else 'not on this Kivy'}")
+
+    alarms = AlarmScheduler()
+    calls = []
+    mgr = IdleManager(alarms)
+    mgr.interval(lambda dt: calls.append(dt), 60, refresh=False)
+    mgr._sleep()
+    assert mgr._alarm_ev is None                        # nothing scheduled yet
+    alarms.once(time.time() + 3600, print)              # e.g. a fleet push while idle
+    Clock.tick()
+    ev = mgr._alarm_ev
+    assert ev is not None and 3500 < ev.timeout < 3600, ev
+    alarms.once(time.time() + 600, print)               # a snooze: earlier still
+    Clock.tick()
+    assert mgr._alarm_ev is not ev and mgr._alarm_ev.timeout < 600
+    mgr._wake("check")
+    assert calls == [] and mgr._alarm_ev is None        # no dt=0 call on wake
+    print("pre-alarm wake re-armed by jobs added while idle")
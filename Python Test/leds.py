@@ -0,0 +1,170 @@
+"""
+leds.py
+————————
+LED patterns played from a timer thread of their own, so the alert LED
+keeps its rhythm when the Kivy frame loop stalls.
+A pattern is a compact step table: segments of (level, seconds) steps,
+each repeated n times, the last one forever (n = None).  level is 0-1;
+on a plain on/off LED anything ≥ .5 is on.
+  • BLINK     – the old 0.7 s on / 0.7 s off
+  • BREATHE   – PWM fade in and out
+  • ESCALATE  – slow blink for a minute, faster for a minute, then rapid
+LedEngine.on() / off() stand in for the LED in Dispenser.  The thread
+wakes only at level changes, against deadlines counted from the start of
+the pattern (no drift), and waits without a timeout while nothing plays.
+
+usage: python leds.py            (timing check on a simulated pin)
+"""
+
+import math, threading, time
+
+TOL_MS = 20                 # timing check: worst edge error allowed
+
+def blink(on, off=None):
+    return ((1, on), (0, on if off is None else off))
+
+def breathe(period=2.0, levels=16):
+    """One fade in + out, sampled at 2·levels PWM steps."""
+    n = 2 * levels
+    return tuple((round(.5 - .5 * math.cos(2 * math.pi * i / n), 3), period / n)
+                 for i in range(n))
+
+BLINK    = ((blink(.7), None),)
+BREATHE  = ((breathe(), None),)
+ESCALATE = ((blink(.7), 43), (blink(.35), 86), (blink(.12), None))
+
+def steps(pattern):
+    """(level, seconds) for the whole pattern; equal levels in a row merged."""
+    level = dur = None
+    for table, n in pattern:
+        if n is None and len({lv for lv, _ in table}) == 1:
+            table, n = ((table[0][0], math.inf),), 1    # steady: one step, held
+        i = 0
+        while n is None or i < n:
+            for lv, s in table:
+                if lv == level:
+                    dur += s
+                    continue
+                if level is not None:
+                    yield level, dur
+                level, dur = lv, s
+            i += 1
+    if level is not None:
+        yield level, dur
+
+class LedEngine:
+    def __init__(self, pin=None, pwm=False, default=ESCALATE):
+        self.pin, self.pwm = pin, pwm       # pin: gpiozero LED / PWMLED, or anything with .value
+        self.default  = default             # what on() plays
+        self.wakeups  = 0
+        self.late_max = 0.0                 # s, worst step start after its deadline
+        self._pattern = None
+        self._gen     = 0                   # bumped by every play / stop
+        self._cond    = threading.Condition()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    # ---- any thread ----
+    def play(self, pattern):
+        with self._cond:
+            self._pattern = pattern
+            self._gen += 1
+            self._cond.notify()
+
+    def stop(self):
+        self.play(None)
+
+    def on(self):
+        self.play(self.default)
+
+    def off(self):
+        self.stop()
+
+    # ---- timer thread ----
+    def _set(self, level):
+        if self.pin is None:
+            return
+        try:
+            self.pin.value = level if self.pwm else (1 if level >= .5 else 0)
+        except Exception as e:
+            print("LED error:", e)
+
+    def _run(self):
+        gen = 0
+        while True:
+            with self._cond:
+                while self._gen == gen:
+                    self._cond.wait()
+                gen, pattern = self._gen, self._pattern
+            if pattern is None:
+                self._set(0)
+            else:
+                self._play(pattern, gen)
+
+    def _play(self, pattern, gen):
+        deadline = time.monotonic()
+        for level, secs in steps(pattern):
+            self._set(level)
+            deadline += secs
+            with self._cond:
+                while self._gen == gen:
+                    rem = deadline - time.monotonic()
+                    if rem <= 0:
+                        break
+                    self._cond.wait(min(rem, 3600))
+                if self._gen != gen:
+                    return                  # replaced or stopped
+            self.wakeups += 1
+            self.late_max = max(self.late_max, time.monotonic() - deadline)
+
+# ───────── timing check ─────────
+if __name__ == "__main__":
+    class SimPin:
+        def __init__(self):
+            self.log = []                   # (perf_counter, value)
+        @property
+        def value(self):
+            return self.log[-1][1] if self.log else 0
+        @value.setter
+        def value(self, v):
+            self.log.append((time.perf_counter(), v))
+
+    def check(name, pattern, n, stall=False):
+        pin = SimPin()
+        eng = LedEngine(pin, pwm=True)
+        plan = []
+        for i, step in enumerate(steps(pattern)):
+            if i == n:
+                break
+            plan.append(step)
+        eng.play(pattern)
+        t_end = time.perf_counter() + sum(s for _, s in plan) + .05
+        while time.perf_counter() < t_end:
+            if stall:                       # a UI thread stuck in Python code
+                sum(i * i for i in range(20000))
+            else:
+                time.sleep(.01)
+        eng.stop()
+        edges = pin.log[:len(plan)]
+        t0, at, err = edges[0][0], 0.0, []
+        for (t, v), (level, secs) in zip(edges, plan):
+            assert v == level
+            err.append(abs(t - t0 - at) * 1000)
+            at += secs
+        total = sum(s for _, s in plan)
+        print(f"{name:22} {len(plan):4} steps {total:5.2f} s  err max {max(err):5.2f} ms  "
+              f"mean {sum(err) / len(err):5.2f} ms  wakeups {eng.wakeups / total:5.1f}/s")
+        assert max(err) < TOL_MS, f"{name}: edge {max(err):.1f} ms off"
+
+    fast = ((blink(.02, .03), None),)
+    check("blink 20/30 ms", fast, 100)
+    check("  while UI stalls", fast, 100, stall=True)
+    check("breathe 1 s", ((breathe(1.0), None),), 64)
+    check("  while UI stalls", ((breathe(1.0), None),), 64, stall=True)
+    for name, p in (("BLINK", BLINK), ("ESCALATE", ESCALATE), ("BREATHE", BREATHE)):
+        t = n = 0
+        for _, s in steps(p):
+            if t >= 180:
+                break
+            t += s; n += 1
+        print(f"{name:10} {n / t * 60:6.0f} wakeups/min over the first 3 min")
+    assert list(steps(((((1, .1),), None),))) == [(1, math.inf)]
@@ -0,0 +1,300 @@
+"""
+metrics.py
+————————
+Runtime instrumentation of the hot paths, cheap enough to leave on.
+  • Histogram – fixed bucket bounds, counts pre-allocated; observe() is a
+                bisect and two adds, no allocation
+  • Counter   – optionally split by one label (e.g. how a popup ended);
+                incremented from many threads, so inc() takes a lock
+The module-level metrics below are fed by the motion worker, the alarm
+scheduler (fires, clock steps), the Dispenser, AlarmPopup and
+FrameMonitor.  Each histogram has one writer thread (motor worker,
+scheduler, Kivy) or is written under its owner's lock, so no lock of
+its own.
+  • serve()  – Prometheus text format on http://host:port/metrics
+  • Ring     – snapshot of every metric each INTERVAL_S into a fixed-size
+               file (RING_SLOTS records, oldest overwritten), readable
+               after the fact without the app running
+
+usage: python metrics.py [metrics.ring]      (observe() cost, ring dump)
+"""
+
+import bisect, json, os, struct, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+INTERVAL_S = 60             # ring snapshot period
+RING_SLOTS = 1440           # one day at INTERVAL_S = 60
+PORT       = 9105
+
+# ───────── metric types ─────────
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, bounds):
+        self.name, self.help = name, help
+        self.bounds = tuple(sorted(bounds))
+        self.counts = [0] * (len(self.bounds) + 1)      # last = above every bound
+        self.sum    = 0.0
+
+    def observe(self, v):
+        self.counts[bisect.bisect_left(self.bounds, v)] += 1
+        self.sum += v
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (inf if above all)."""
+        n, acc = self.count, 0
+        for bound, c in zip(self.bounds + (float("inf"),), self.counts):
+            acc += c
+            if n and acc >= q * n:
+                return bound
+        return 0.0
+
+    def values(self):
+        return self.counts + [self.sum]
+
+    def expose(self):
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        acc = 0
+        for bound, c in zip(self.bounds, self.counts):
+            acc += c
+            out.append(f'{self.name}_bucket{{le="{bound:g}"}} {acc}')
+        out.append(f'{self.name}_bucket{{le="+Inf"}} {acc + self.counts[-1]}')
+        out.append(f"{self.name}_sum {self.sum:.6g}")
+        out.append(f"{self.name}_count {acc + self.counts[-1]}")
+        return out
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, label=None, values=()):
+        self.name, self.help, self.label = name, help, label
+        self.counts = dict.fromkeys(values or ((None,) if label is None else ()), 0)
+        self._lock  = threading.Lock()      # scheduler, I/O worker, LED, Kivy
+
+    def inc(self, value=None, n=1):
+        """value: the label's value (None for an unlabelled counter)."""
+        with self._lock:
+            self.counts[value] = self.counts.get(value, 0) + n
+
+    def values(self):
+        return list(self.counts.values())
+
+    def expose(self):
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for v, n in self.counts.items():
+            out.append(f"{self.name} {n}" if self.label is None
+                       else f'{self.name}{{{self.label}="{v}"}} {n}')
+        return out
+
+REGISTRY = []
+
+def histogram(name, help, bounds):
+    REGISTRY.append(Histogram(name, help, bounds))
+    return REGISTRY[-1]
+
+def counter(name, help, label=None, values=()):
+    REGISTRY.append(Counter(name, help, label, values))
+    return REGISTRY[-1]
+
+def expose():
+    return "\n".join(line for m in REGISTRY for line in m.expose()) + "\n"
+
+# ───────── the pill-box's metrics ─────────
+STEP_LATE  = histogram("pillbox_step_late_us", "Worst step-edge lateness per move (us)",
+                       (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000))
+MOVE_TIME  = histogram("pillbox_move_seconds", "Carousel move duration, pulses only",
+                       (.025, .05, .1, .15, .2, .3, .5, 1, 2, 5))
+ALARM_LATE = histogram("pillbox_alarm_latency_seconds", "Alarm fired after its scheduled time",
+                       (.0005, .001, .002, .005, .01, .02, .05, .1, .5, 1))
+UI_FRAME   = histogram("pillbox_ui_frame_seconds", "Kivy frame time (UI-thread busy + wait)",
+                       (.008, .016, .033, .05, .1, .25, .5, 1))
+POPUP_LATE = histogram("pillbox_popup_latency_seconds", "Alarm session opened until its popup shows",
+                       (.01, .025, .05, .1, .25, .5, 1, 2, 5))
+ANSWER     = histogram("pillbox_alarm_answer_seconds", "Popup open until Stop / Snooze / PIR",
+                       (5, 15, 30, 60, 120, 300, 600, 1800))
+CLOCK_STEP = histogram("pillbox_clock_step_seconds", "Wall-clock steps seen by the scheduler (size)",
+                       (5, 30, 60, 300, 900, 3600, 86400, 7 * 86400))
+ALARMS     = counter("pillbox_alarms_total", "Alarm jobs fired by the scheduler")
+SESSIONS   = counter("pillbox_sessions_total", "Alarm sessions by outcome", "how",
+                     ("open", "stop", "snooze", "pir"))
+MOVES      = counter("pillbox_moves_total", "Carousel moves (a parallel move counts once)")
+ERRORS     = counter("pillbox_errors_total", "Errors caught and printed", "where",
+                     ("motor", "scheduler", "audio", "io"))
+
+# ───────── Prometheus endpoint ─────────
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = expose().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass                                # no line per scrape
+
+def serve(addr=f"127.0.0.1:{PORT}"):
+    """Start the endpoint on a daemon thread; returns the server."""
+    host, _, port = addr.rpartition(":")
+    srv = ThreadingHTTPServer((host or "127.0.0.1", int(port)), _Handler)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, name="metrics", daemon=True).start()
+    return srv
+
+# ───────── on-disk ring ─────────
+HEAD_SIZE = 4096            # JSON layout, padded
+REC_HEAD  = struct.Struct("<dQ")                    # wall time, sequence number
+
+class Ring:
+    """Fixed-size snapshot file.  The header names every value of a record;
+    a record is (t, seq) then one float per value.  Labelled counters keep
+    the label values they were declared with.  A file written with a
+    different layout is moved to <path>.old and started over."""
+
+    def __init__(self, path, slots=RING_SLOTS, registry=REGISTRY):
+        self.path, self.slots, self.registry = path, slots, registry
+        self.layout = [[m.name, m.kind, getattr(m, "bounds", None) or list(m.counts)]
+                       for m in registry]
+        self.width = sum(len(b) + (2 if k == "histogram" else 0) for _, k, b in self.layout)
+        self.rec = struct.Struct(f"<{self.width}d")
+        self.size = REC_HEAD.size + self.rec.size
+        self.seq = 0
+        self._timer  = None
+        self._lock   = threading.Lock()     # timer tick vs close()
+        self._closed = False
+        self._open()
+
+    def _header(self):
+        head = json.dumps({"slots": self.slots, "layout": self.layout}).encode()
+        if len(head) > HEAD_SIZE:
+            raise ValueError("metric layout too large for the ring header")
+        return head.ljust(HEAD_SIZE, b" ")
+
+    def _open(self):
+        head = self._header()
+        try:
+            with open(self.path, "rb") as f:
+                same = f.read(HEAD_SIZE) == head
+        except OSError:
+            same = False
+        if not same:
+            if os.path.exists(self.path):
+                os.replace(self.path, self.path + ".old")
+            with open(self.path, "wb") as f:
+                f.write(head)
+                f.truncate(HEAD_SIZE + self.slots * self.size)
+        self.f = open(self.path, "r+b", buffering=0)
+        self.seq = max((seq for _, seq, _ in read(self.path)), default=0)
+
+    def snapshot(self, t=None):
+        values = []
+        for m, (_, kind, names) in zip(self.registry, self.layout):
+            values += m.values() if kind == "histogram" else [m.counts.get(v, 0) for v in names]
+        self.seq += 1
+        self.f.seek(HEAD_SIZE + (self.seq % self.slots) * self.size)
+        self.f.write(REC_HEAD.pack(time.time() if t is None else t, self.seq)
+                     + self.rec.pack(*values))
+
+    def start(self, interval=INTERVAL_S):
+        def tick():
+            with self._lock:
+                if self._closed:
+                    return
+                try:
+                    self.snapshot()
+                except OSError as e:
+                    print("Metrics ring error:", e)
+                self.start(interval)
+        self._timer = threading.Timer(interval, tick)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def close(self):
+        """Stops the timer, waiting out a snapshot it is writing, then
+        writes the last one."""
+        with self._lock:
+            self._closed, timer = True, self._timer
+        if timer is not None:
+            timer.cancel()
+            timer.join()
+        self.snapshot()
+        self.f.close()
+
+def read(path):
+    """[(t, seq, {name: values})] oldest first; values as in the header."""
+    with open(path, "rb") as f:
+        head = json.loads(f.read(HEAD_SIZE))
+        data = f.read()
+    widths = [len(b) + (2 if kind == "histogram" else 0) for _, kind, b in head["layout"]]
+    rec = struct.Struct(f"<{sum(widths)}d")
+    out = []
+    for i in range(head["slots"]):
+        off = i * (REC_HEAD.size + rec.size)
+        if off + REC_HEAD.size + rec.size > len(data):
+            break
+        t, seq = REC_HEAD.unpack_from(data, off)
+        if not seq:
+            continue                        # never written
+        vals, j, snap = rec.unpack_from(data, off + REC_HEAD.size), 0, {}
+        for (name, _, _), w in zip(head["layout"], widths):
+            snap[name] = vals[j:j + w]; j += w
+        out.append((t, seq, snap))
+    return sorted(out, key=lambda r: r[1])
+
+# ───────── cost check / ring dump ─────────
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 1:
+        recs = read(sys.argv[1])
+        for (t0, _, a), (t1, _, b) in zip(recs, recs[1:]):
+            fired = b["pillbox_alarms_total"][0] - a["pillbox_alarms_total"][0]
+            moves = sum(b["pillbox_moves_total"]) - sum(a["pillbox_moves_total"])
+            print(f"{time.strftime('%m-%d %H:%M', time.localtime(t1))}  "
+                  f"{fired:3.0f} alarms  {moves:3.0f} moves")
+        print(f"{len(recs)} snapshots")
+        sys.exit()
+    n = 200_000
+    h = Histogram("x", "x", STEP_LATE.bounds)
+    t0 = time.perf_counter()
+    for i in range(n):
+        h.observe(i % 700)
+    per = (time.perf_counter() - t0) / n * 1e9
+    print(f"Histogram.observe  {per:6.0f} ns")
+    c = Counter("y", "y", "how")
+    t0 = time.perf_counter()
+    for i in range(n):
+        c.inc("stop")
+    print(f"Counter.inc        {(time.perf_counter() - t0) / n * 1e9:6.0f} ns")
+    c = Counter("z", "z")
+    def bump():
+        for _ in range(n // 4):
+            c.inc()
+    ts = [threading.Thread(target=bump) for _ in range(4)]
+    for t in ts: t.start()
+    for t in ts: t.join()
+    assert c.counts[None] == n // 4 * 4, c.counts
+    srv = serve("127.0.0.1:0")
+    import urllib.request
+    text = urllib.request.urlopen(f"http://127.0.0.1:{srv.server_address[1]}/metrics").read().decode()
+    print(f"/metrics           {len(text.splitlines())} lines")
+    srv.shutdown()
+    import tempfile
+    path = os.path.join(tempfile.mkdtemp(), "metrics.ring")
+    ring = Ring(path, slots=10)
+    for i in range(25):
+        ALARMS.inc()
+        ring.snapshot(1e9 + i * 60)
+    ring.start(0.001)                       # close() while the timer is writing
+    time.sleep(.05)
+    ring.close()
+    recs = read(path)
+    assert len(recs) == 10 and recs[-1][2]["pillbox_alarms_total"][0] == 25
+    print(f"ring               {os.path.getsize(path)} bytes, {len(recs)} of {recs[-1][1]} snapshots kept")
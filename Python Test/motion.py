@@ -0,0 +1,417 @@
+"""
+motion.py
+————————
+Carousel motion planning + the single motion worker.
+  • plan_move  – one merged move current → target, shorter direction
+                 when the mechanism allows reversing
+  • plan_tour  – order for visiting several slots in one pass
+  • trapezoid  – accel / cruise / decel waveform (step periods in µs)
+  • Carousel   – one carousel: its backend (pins), step table, position
+  • MotionController – one thread, bounded command queue, coalesced
+                 targets, pre-emptable jog, futures for callers; drives
+                 one or more carousels, goto_many() moves several at once
+                 (interleaved pulses, time = the longest single move)
+"""
+
+import math, threading, time
+from collections import deque
+from concurrent.futures import Future
+
+import metrics, stepper
+
+# ───────── 14-slot pattern (sum = 200 steps) ─────────
+STEPS_PER_SLOT = [14,14,14,15,15,14,14,14,14,14,15,15,14,14]
+N_SLOTS        = len(STEPS_PER_SLOT)
+
+ALLOW_REVERSE = False    # forward only, as the chute was built for; True = shortest way round
+
+# profile (steps/s, steps/s²) – V_START is below the motor's pull-in rate
+V_START = 200
+V_MAX   = 1200
+ACCEL   = 6000
+
+JOG_RATE  = 800          # steps/s while a jog button is held
+JOG_BURST = 0.05         # s of steps per jog submit (pre-emption granularity)
+QUEUE_MAX = 8            # queued commands before the oldest is dropped
+VISIT_DWELL = 1.5        # s parked at each slot of a multi-slot visit
+ENABLE_SETTLE = 0.002    # s after energising the driver before the first step
+
+def slot_offsets(table=STEPS_PER_SLOT):
+    """Absolute step position of each slot, slot 0 at 0.  A fractional
+    (calibrated) table is rounded per slot, so error never accumulates."""
+    out, acc = [], 0.0
+    for n in table:
+        out.append(int(round(acc))); acc += n
+    return out
+
+def _reverse(allow_reverse):
+    """None = ALLOW_REVERSE as it is now, so setting it at run time counts."""
+    return ALLOW_REVERSE if allow_reverse is None else allow_reverse
+
+def plan_steps(pos, goal, total, allow_reverse=None):
+    """(steps, forward) between two absolute step positions on the ring."""
+    allow_reverse = _reverse(allow_reverse)
+    fwd = (goal - pos) % total
+    rev = (pos - goal) % total
+    if allow_reverse and rev < fwd:
+        return rev, False
+    return fwd, True
+
+def plan_move(current, target, table=STEPS_PER_SLOT, allow_reverse=None):
+    """(steps, forward) for the whole move.  Slot i→i+1 costs table[i]."""
+    off = slot_offsets(table)
+    return plan_steps(off[current], off[target], sum(table), allow_reverse)
+
+def plan_tour(pos, goals, total, allow_reverse=None):
+    """Visiting order for absolute positions `goals`, fewest total steps.
+    One sweep forward, or (when reversing is allowed) one sweep backward,
+    or out one way and back the other – nothing else can be shorter on a
+    ring."""
+    allow_reverse = _reverse(allow_reverse)
+    here  = [pos] if pos in goals else []
+    fwd   = sorted(set(goals) - {pos}, key=lambda g: (g - pos) % total)
+    if not fwd:
+        return here
+    back  = fwd[::-1]
+    options = [((fwd[-1] - pos) % total, fwd)]
+    if allow_reverse:
+        options.append(((pos - back[-1]) % total, back))
+        for k in range(len(fwd) - 1):           # out to fwd[k], then back past pos
+            rest = back[:len(fwd) - k - 1]
+            options.append((2 * ((fwd[k] - pos) % total) + (pos - rest[-1]) % total,
+                            fwd[:k + 1] + rest))
+            rest = fwd[:len(fwd) - k - 1]       # back to back[k], then forward
+            options.append((2 * ((pos - back[k]) % total) + (rest[-1] - pos) % total,
+                            back[:k + 1] + rest))
+    return here + min(options, key=lambda o: o[0])[1]
+
+def trapezoid(n, v_start=V_START, v_max=V_MAX, accel=ACCEL):
+    """Step periods (µs) for n steps: v = √(v0² + 2·a·d) from both ends,
+    capped at v_max.  Short moves become a triangle."""
+    v0sq, wave = v_start * v_start, []
+    for i in range(int(n)):
+        d = min(i, n - 1 - i)                   # steps from the nearer end
+        v = min(v_max, math.sqrt(v0sq + 2 * accel * d))
+        wave.append(int(round(1e6 / v)))
+    return wave
+
+def move_time(wave):
+    """Planned duration of a waveform in seconds."""
+    return sum(wave) / 1e6
+
+# ───────── carousels ─────────
+class Carousel:
+    """One carousel: its stepper backend (own DIR/STEP pins), driver enable
+    line, step table and absolute position.  backend may be None until the
+    hardware is up.  Only the MotionController's worker moves it."""
+
+    def __init__(self, name, backend=None, table=STEPS_PER_SLOT, calib=None, enable=None):
+        self.name    = name
+        self.backend = backend
+        self.enable  = enable                # driver EN output (on = energised), optional
+        self.calib   = calib
+        self.set_table(calib.table if calib else table)
+        self.pos     = 0                     # absolute steps, 0 = slot 0
+        self.saw_home = False                # home mark seen during the last move
+
+    def set_table(self, table):
+        self.table   = list(table)
+        self.offsets = slot_offsets(self.table)
+        self.total   = int(round(sum(self.table)))
+
+    @property
+    def current_slot(self):
+        """Slot at or just behind the current position."""
+        slot = 0
+        for i, off in enumerate(self.offsets):
+            if off <= self.pos:
+                slot = i
+        return slot
+
+    @property
+    def on_slot(self):
+        return self.pos in self.offsets
+
+    def plan(self, slot):
+        """(wave, forward) from here to `slot`; empty wave if already there."""
+        steps, fwd = plan_steps(self.pos, self.offsets[slot], self.total)
+        return trapezoid(steps), fwd
+
+    def energise(self):
+        """True if the driver had to be switched on."""
+        if self.enable is not None and not self.enable.is_active:
+            self.enable.on()
+            return True
+        return False
+
+    def moved(self, wave, forward, t0):
+        self.pos = (self.pos + (len(wave) if forward else -len(wave))) % self.total
+        if self.calib is not None:
+            self.saw_home = self.calib.correct(self, wave, forward, t0)
+
+def _delegate(attr):
+    return property(lambda self: getattr(self.main, attr),
+                    lambda self, v: setattr(self.main, attr, v))
+
+# ───────── motion worker ─────────
+class _Cmd:
+    __slots__ = ("kind", "arg", "futures", "stop")
+
+    def __init__(self, kind, arg):
+        self.kind, self.arg = kind, arg
+        self.futures = [Future()]
+        self.stop = threading.Event()        # jog only
+
+class MotionController:
+    """Owns the carousel positions.  Every move goes through one worker
+    thread, so pulses never interleave and `pos` is always exact.
+    threaded=False runs each command inline (headless simulation).
+    backend may be None until set_backend(); commands queue meanwhile.
+    With a calibration.Calibrator the step table comes from it and every
+    pass over the home mark re-anchors `pos`.
+    The first carousel is `main` (the attributes below are its); add()
+    more, then address them by name in goto/visit/jog or goto_many."""
+
+    backend  = _delegate("backend")
+    enable   = _delegate("enable")
+    calib    = _delegate("calib")
+    pos      = _delegate("pos")
+    saw_home = _delegate("saw_home")
+    table    = property(lambda self: self.main.table)
+    offsets  = property(lambda self: self.main.offsets)
+    total    = property(lambda self: self.main.total)
+    current_slot = property(lambda self: self.main.current_slot)
+    on_slot  = property(lambda self: self.main.on_slot)
+
+    def __init__(self, backend, table=STEPS_PER_SLOT, maxlen=QUEUE_MAX, threaded=True,
+                 calib=None, enable=None, name="main"):
+        self.main    = Carousel(name, backend, table, calib, enable)
+        self.carousels = {name: self.main}
+        self.maxlen  = maxlen
+        self._q      = deque()
+        self._cond   = threading.Condition()
+        self._active = None
+        self.threaded = threaded
+        self.verbose  = True
+        if threaded:
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    def add(self, carousel):
+        with self._cond:
+            self.carousels[carousel.name] = carousel
+            self._cond.notify()
+        return carousel
+
+    def set_backend(self, backend, carousel=None):
+        with self._cond:
+            self._car(carousel).backend = backend
+            self._cond.notify()
+
+    def set_table(self, table):
+        self.main.set_table(table)
+
+    def _car(self, name):
+        if name is None:
+            return self.main
+        try:
+            return self.carousels[name]
+        except KeyError:
+            raise ValueError(f"no carousel {name!r}") from None
+
+    def _check(self, name, slots):
+        car = self._car(name)
+        for slot in slots:
+            if not 0 <= slot < len(car.table):
+                raise ValueError(f"slot {slot} out of range")
+        return car.name
+
+    # ---- commands (any thread) ----
+    def goto(self, slot, carousel=None):
+        """Queue a move to `slot`; back-to-back gotos merge into the last target."""
+        name = self._check(carousel, [slot])
+        with self._cond:
+            self._preempt_jogs()
+            if self._q and self._q[-1].kind == "goto" and self._q[-1].arg[0] == name:
+                last = self._q[-1]
+                last.arg = (name, slot)
+                fut = Future(); last.futures.append(fut)
+                return fut
+            return self._push(_Cmd("goto", (name, slot)))
+
+    def goto_many(self, targets):
+        """Move several carousels at once, {name: slot}.  Their pulses are
+        interleaved, so this takes as long as the longest single move.
+        The future's result is the list of MoveReports."""
+        targets = {self._check(name, [slot]): slot for name, slot in targets.items()}
+        with self._cond:
+            self._preempt_jogs()
+            return self._push(_Cmd("many", targets))
+
+    def visit(self, slots, dwell=VISIT_DWELL, carousel=None):
+        """One planned pass over several slots, parking `dwell` s at each.
+        The future's result is the visiting order."""
+        name = self._check(carousel, slots)
+        with self._cond:
+            self._preempt_jogs()
+            return self._push(_Cmd("visit", (name, list(slots), dwell)))
+
+    def release(self):
+        """De-energise the driver after the queued moves (idle mode).
+        The next move energises it again; a calibrated carousel re-anchors
+        on the home mark if it was nudged meanwhile."""
+        with self._cond:
+            return self._push(_Cmd("release", None))
+
+    def home(self):
+        """Closed-loop homing with a home sensor, plain goto(0) without."""
+        with self._cond:
+            self._preempt_jogs()
+            return self._push(_Cmd("home", None))
+
+    def calibrate(self, revs=2):
+        """Measure the step table (needs a Calibrator with a home sensor)."""
+        with self._cond:
+            return self._push(_Cmd("calibrate", revs))
+
+    def steps(self, n, forward=True, rate=None):
+        """Queue n raw steps (constant rate)."""
+        with self._cond:
+            return self._push(_Cmd("steps", (int(n), forward, rate)))
+
+    def jog(self, forward, carousel=None):
+        """Spin until stop_jog() or until another command pre-empts it."""
+        name = self._check(carousel, [])
+        with self._cond:
+            self._preempt_jogs()
+            return self._push(_Cmd("jog", (name, forward)))
+
+    def stop_jog(self):
+        with self._cond:
+            self._preempt_jogs()
+
+    def _preempt_jogs(self):
+        if self._active is not None and self._active.kind == "jog":
+            self._active.stop.set()
+        for cmd in self._q:
+            if cmd.kind == "jog":
+                cmd.stop.set()
+
+    def _push(self, cmd):
+        if not self.threaded:
+            if cmd.kind == "jog":               # nothing would ever stop it
+                cmd.stop.set()
+            self._execute(cmd)
+            return cmd.futures[0]
+        if len(self._q) >= self.maxlen:
+            for f in self._q.popleft().futures:
+                f.cancel()
+        self._q.append(cmd)
+        self._cond.notify()
+        return cmd.futures[0]
+
+    # ---- worker ----
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._q or any(c.backend is None for c in self.carousels.values()):
+                    self._cond.wait()
+                cmd = self._active = self._q.popleft()
+            self._execute(cmd)
+
+    def _execute(self, cmd):
+        live = [f for f in cmd.futures if f.set_running_or_notify_cancel()]
+        try:
+            result = self._run(cmd)
+        except Exception as e:
+            metrics.ERRORS.inc("motor")
+            print("Motor error:", e)
+            for f in live: f.set_exception(e)
+        else:
+            for f in live: f.set_result(result)
+        finally:
+            with self._cond:
+                self._active = None
+
+    def _step(self, wave, forward, car=None):
+        car = car or self.main
+        if car.energise():
+            time.sleep(ENABLE_SETTLE)
+        t0 = time.perf_counter()
+        rep = car.backend.run(wave, forward)
+        car.moved(wave, forward, t0)
+        return rep
+
+    def _step_many(self, moves):
+        """[(carousel, wave, forward)] started together."""
+        if any([car.energise() for car, _, _ in moves]):
+            time.sleep(ENABLE_SETTLE)
+        t0 = time.perf_counter()
+        reps = stepper.run_parallel([(car.backend, w, fwd) for car, w, fwd in moves])
+        for car, w, fwd in moves:
+            car.moved(w, fwd, t0)
+        return reps
+
+    @staticmethod
+    def _observe(*reps):
+        """Metrics for one move (several reports for a parallel one)."""
+        metrics.MOVES.inc()
+        metrics.MOVE_TIME.observe(max(r.actual_s for r in reps))
+        metrics.STEP_LATE.observe(max(r.max_late_us for r in reps))
+
+    def _goto(self, target, car=None):
+        wave, fwd = (car or self.main).plan(target)
+        if wave:
+            self._observe(self._step(wave, fwd, car))
+
+    def _run(self, cmd):
+        if cmd.kind == "goto":
+            with self._cond:
+                name, target = cmd.arg       # may have been coalesced until now
+            self._goto(target, self.carousels[name])
+            if self.verbose:
+                print(f"[motor] {name} at slot", target)
+            return target
+        if cmd.kind == "many":
+            moves = [(self.carousels[name], *self.carousels[name].plan(slot))
+                     for name, slot in cmd.arg.items()]
+            reps = self._step_many([m for m in moves if m[1]])
+            if reps:
+                self._observe(*reps)
+            if self.verbose:
+                print("[motor] at", ", ".join(f"{n} {s}" for n, s in cmd.arg.items()))
+            return reps
+        if cmd.kind == "visit":
+            name, slots, dwell = cmd.arg
+            car = self.carousels[name]
+            by_pos = {car.offsets[s]: s for s in slots}
+            order = [by_pos[p] for p in plan_tour(car.pos, by_pos, car.total)]
+            for i, slot in enumerate(order):
+                if i:
+                    getattr(car.backend, "pause", time.sleep)(dwell)
+                self._goto(slot, car)
+            if self.verbose:
+                print(f"[motor] {name} visited slots", order)
+            return order
+        if cmd.kind == "home":
+            if self.calib is not None and self.calib.home is not None:
+                self.calib.find_home(self)
+            self._goto(0)
+            return 0
+        if cmd.kind == "calibrate":
+            return self.calib.measure(self, cmd.arg)
+        if cmd.kind == "release":
+            for car in self.carousels.values():
+                if car.enable is not None:
+                    car.enable.off()
+            return self.pos
+        if cmd.kind == "steps":
+            n, fwd, rate = cmd.arg
+            rep = self._step([int(round(1e6 / (rate or V_START)))] * n, fwd)
+            self._observe(rep)
+            return rep
+        name, fwd = cmd.arg
+        car = self.carousels[name]
+        burst = [int(round(1e6 / JOG_RATE))] * max(1, int(JOG_RATE * JOG_BURST))
+        while not cmd.stop.is_set():
+            self._step(burst, fwd, car)
+        return car.pos
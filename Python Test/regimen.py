@@ -0,0 +1,372 @@
+"""
+regimen.py
+————————
+Bulk schedule import: pharmacy regimens → carousel alarms.
+Specs come as CSV, JSON or iCalendar (RRULE subset) and become Regimens;
+compile_plan() expands them all with NumPy array arithmetic, maps every
+occurrence to its slot (weekday × Morning/Evening, local time) and flags
+conflicts; install() registers the result with one add_many() and
+persists it in one transaction.
+  CSV / JSON keys: name, start ("YYYY-MM-DD HH:MM"), every_h (fixed
+                   interval) or times ("08:00 20:00"), days (duration),
+                   byday ("MO,WE,FR"), or an RRULE string in rrule
+  RRULE subset:    FREQ=HOURLY|DAILY|WEEKLY, INTERVAL, COUNT, UNTIL,
+                   BYDAY, BYHOUR, BYMINUTE (DTSTART from start / the VEVENT)
+A slot is one compartment: doses of the same day and period are fine if
+they fall within MERGE_WINDOW_S of each other (they share one alarm),
+otherwise they conflict.  So do doses landing in a slot that already has
+a weekly alarm at another time.
+
+usage: python regimen.py <plan.csv|.json|.ics> [alarms.db]   (compile, store)
+       python regimen.py                                    (timing check)
+"""
+
+import csv, io, json, os, re, sys, time
+from collections import namedtuple
+
+import numpy as np
+
+from alarm_scheduler import DAYS
+from dispenser import MERGE_WINDOW_S
+
+DEFAULT_DAYS = 30           # duration when a spec gives neither days, UNTIL nor COUNT
+WEEKDAYS = {"SU": 0, "MO": 1, "TU": 2, "WE": 3, "TH": 4, "FR": 5, "SA": 6}
+
+Regimen  = namedtuple("Regimen", "name start every times byday until count day_step week_step")
+# start / until: local datetime64[m]; every: minutes (fixed interval) or None;
+# times: minutes of the day; byday: Sunday-based weekdays or None
+Conflict = namedtuple("Conflict", "date period slot times regimens")
+
+# ───────── parsing ─────────
+def _dt(text):
+    """"2025-01-05 08:00", "2025-01-05T08:00", "20250105T080000" → local
+    datetime64[m]; a trailing Z means UTC and is converted to local."""
+    text = text.strip()
+    utc = text.endswith("Z")
+    text = text.rstrip("Z")
+    m = re.fullmatch(r"(\d{4})(\d\d)(\d\d)(?:T(\d\d)(\d\d)(\d\d)?)?", text)
+    if m:
+        y, mo, d, hh, mm, _ = m.groups()
+        text = f"{y}-{mo}-{d}T{hh or '00'}:{mm or '00'}"
+    t = np.datetime64(text.replace(" ", "T"), "m")
+    if utc:
+        t = _to_local(np.array([t.astype(np.int64) * 60]))[0].astype("datetime64[m]")
+    return t
+
+def _minutes(at):
+    hh, mm = (int(x) for x in at.split(":"))
+    if not (0 <= hh < 24 and 0 <= mm < 60):
+        raise ValueError(f"bad time {at!r}")
+    return hh * 60 + mm
+
+def _byday(text):
+    if not text:
+        return None
+    return tuple(sorted(WEEKDAYS[d.strip().upper()[-2:]] for d in re.split(r"[,; ]+", text) if d))
+
+def _rrule(name, start, rule):
+    parts = dict(p.split("=", 1) for p in rule.replace("RRULE:", "").strip().split(";") if p)
+    freq = parts.get("FREQ", "DAILY").upper()
+    step = int(parts.get("INTERVAL", 1))
+    until = _dt(parts["UNTIL"]) if "UNTIL" in parts else None
+    count = int(parts["COUNT"]) if "COUNT" in parts else None
+    byday = _byday(parts.get("BYDAY"))
+    if until is None and count is None:
+        until = start + np.timedelta64(DEFAULT_DAYS, "D")
+    mod = int((start - start.astype("datetime64[D]")).astype(int))
+    hours = [int(h) for h in parts["BYHOUR"].split(",")] if "BYHOUR" in parts else [mod // 60]
+    mins = [int(m) for m in parts["BYMINUTE"].split(",")] if "BYMINUTE" in parts else [mod % 60]
+    if freq == "HOURLY":
+        return Regimen(name, start, 60 * step, (), byday, until, count, 1, 1)
+    if freq == "DAILY":
+        return Regimen(name, start, None, tuple(sorted(h * 60 + m for h in hours for m in mins)),
+                       byday, until, count, step, 1)
+    if freq == "WEEKLY":
+        dow = (int(start.astype("datetime64[D]").astype(int)) + 4) % 7
+        return Regimen(name, start, None, tuple(sorted(h * 60 + m for h in hours for m in mins)),
+                       byday or (dow,), until, count, 1, step)
+    raise ValueError(f"{name}: FREQ={freq} not supported")
+
+def regimen(spec):
+    """One dict (CSV row / JSON object) → Regimen."""
+    name  = spec.get("name") or "regimen"
+    start = _dt(str(spec["start"]))
+    if spec.get("rrule"):
+        return _rrule(name, start, spec["rrule"])
+    days  = spec.get("days")
+    until = start + np.timedelta64(int(float(days) * 1440), "m") if days not in (None, "") else None
+    count = int(spec["count"]) if spec.get("count") not in (None, "") else None
+    if until is None and count is None:
+        until = start + np.timedelta64(DEFAULT_DAYS, "D")
+    byday = _byday(spec.get("byday"))
+    if spec.get("every_h") not in (None, ""):
+        every = int(round(float(spec["every_h"]) * 60))
+        if every <= 0:
+            raise ValueError(f"{name}: every_h must be > 0")
+        return Regimen(name, start, every, (), byday, until, count, 1, 1)
+    times = spec.get("times") or ""
+    if isinstance(times, str):
+        times = re.split(r"[,; ]+", times.strip())
+    times = tuple(sorted(_minutes(t) for t in times if t))
+    if not times:
+        raise ValueError(f"{name}: needs every_h, times or rrule")
+    return Regimen(name, start, None, times, byday, until, count, 1, 1)
+
+def _ics(text):
+    out = []
+    text = re.sub(r"\r?\n[ \t]", "", text)              # unfold continuation lines
+    for ev in re.split(r"BEGIN:VEVENT", text)[1:] or [text]:
+        fields = {}
+        for line in ev.splitlines():
+            key, _, value = line.partition(":")
+            fields.setdefault(key.split(";")[0].strip().upper(), value.strip())
+        if "RRULE" in fields:
+            out.append(_rrule(fields.get("SUMMARY", "regimen"), _dt(fields["DTSTART"]),
+                              fields["RRULE"]))
+    return out
+
+def load_specs(source, fmt=None):
+    """Path or text → [Regimen].  fmt: "csv" / "json" / "ics", else from
+    the extension / content."""
+    text = source
+    if fmt is None and os.path.exists(source):
+        fmt = os.path.splitext(source)[1].lstrip(".").lower()
+    if os.path.exists(source):
+        with open(source, newline="") as f:
+            text = f.read()
+    if fmt is None:
+        head = text.lstrip()[:20]
+        fmt = "json" if head[:1] in "[{" else "ics" if "BEGIN:" in head or "RRULE" in text else "csv"
+    if fmt in ("ics", "ical"):
+        return _ics(text)
+    if fmt == "json":
+        data = json.loads(text)
+        return [regimen(s) for s in (data if isinstance(data, list) else data["regimens"])]
+    return [regimen(row) for row in csv.DictReader(io.StringIO(text))]
+
+# ───────── local time, vectorised ─────────
+def _utc_offsets(t):
+    """UTC offset (s) at each epoch second in t.  localtime() once a day
+    over the range; where the offset changes, bisect to the second."""
+    if not len(t):
+        return np.zeros(0, np.int64)
+    lo, hi = int(t.min()) // 86400 * 86400 - 86400, int(t.max()) + 86400
+    edges, offs = [lo], [time.localtime(lo).tm_gmtoff]
+    for day in range(lo + 86400, hi + 86400, 86400):
+        off = time.localtime(day).tm_gmtoff
+        if off != offs[-1]:
+            a, b = day - 86400, day
+            while b - a > 1:
+                mid = (a + b) // 2
+                if time.localtime(mid).tm_gmtoff == off:
+                    b = mid
+                else:
+                    a = mid
+            edges.append(b); offs.append(off)
+    return np.array(offs, np.int64)[np.searchsorted(edges, t, side="right") - 1]
+
+def _to_epoch(local_min):
+    """Local wall-clock minutes since 1970 → epoch seconds."""
+    naive = local_min.astype(np.int64) * 60
+    return naive - _utc_offsets(naive - _utc_offsets(naive))
+
+def _to_local(epoch):
+    return (epoch + _utc_offsets(epoch)) // 60
+
+# ───────── compiling ─────────
+def _expand(r):
+    """Epoch seconds (int64) of every dose of one regimen."""
+    start = int(r.start.astype(np.int64))
+    until = None if r.until is None else int(r.until.astype(np.int64))
+    if r.every is not None:
+        n = r.count
+        if r.count is not None and r.byday is not None:     # BYDAY drops candidates
+            days = -(-r.count * 7 // len(r.byday)) + 7
+            n = max(days, -(-days * 1440 // r.every))
+        if until is not None:
+            span = -(-(until - start) // r.every)
+            n = span if n is None else min(n, span)
+        t = _to_epoch(np.array([start])) + np.arange(max(n, 0), dtype=np.int64) * r.every * 60
+        if r.byday is not None:
+            dow = (_to_local(t) // 1440 + 4) % 7
+            t = t[np.isin(dow, r.byday)]
+    else:
+        day0 = start // 1440
+        if until is None:                               # enough days for COUNT doses
+            per_week = len(r.times) * (7 if r.byday is None else len(r.byday))
+            span = (-(-r.count // per_week) + 1) * 7 * r.day_step * r.week_step
+            until = (day0 + span + 1) * 1440
+        days = np.arange(day0, -(-until // 1440) + 1, r.day_step, dtype=np.int64)
+        if r.byday is not None:
+            days = days[np.isin((days + 4) % 7, r.byday)]
+        if r.week_step > 1:
+            days = days[((days + 4) // 7 - (day0 + 4) // 7) % r.week_step == 0]
+        local = (days[:, None] * 1440 + np.array(r.times, dtype=np.int64)[None, :]).ravel()
+        local = local[(local >= start) & (local < until)]
+        t = _to_epoch(local)
+    if until is not None:
+        t = t[t < _to_epoch(np.array([until]))[0]]
+    if r.count is not None:
+        t = t[:r.count]
+    return t
+
+class Plan:
+    """All doses, sorted by time: when (epoch s), slot (0-13), local (local
+    minutes), reg (index into names); conflicts; keep (bool mask of the doses
+    install() registers)."""
+
+    def __init__(self, regimens, window=MERGE_WINDOW_S):
+        self.names = [r.name for r in regimens]
+        parts = [_expand(r) for r in regimens]
+        when = np.concatenate(parts) if parts else np.zeros(0, np.int64)
+        reg = np.repeat(np.arange(len(parts), dtype=np.int16), [len(p) for p in parts])
+        order = np.argsort(when, kind="stable")
+        self.when, self.reg = when[order], reg[order]
+        self.local = _to_local(self.when)
+        day = self.local // 1440
+        period = (self.local % 1440 >= 720).astype(np.int64)
+        self.slot = (((day + 4) % 7) * 2 + period).astype(np.int8)
+        self.window = window
+        self._key = day * 2 + period                    # one compartment fill
+        self.conflicts, self.keep = self._check()
+
+    def __len__(self):
+        return len(self.when)
+
+    def _check(self, busy=None, taken=None):
+        """Doses of one compartment more than `window` s after its first dose
+        conflict.  busy: {slot: [minute of day]} of existing weekly alarms;
+        taken: epoch s of existing one-shots – a dose within `window` of one
+        is already scheduled and is not kept again, any other dose in that
+        compartment conflicts."""
+        n = len(self.when)
+        if not n:
+            return [], np.zeros(0, bool)
+        order = np.lexsort((self.when, self._key))
+        key, when = self._key[order], self.when[order]
+        starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+        group = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, n]))
+        bad = when - when[starts][group] > self.window
+        dup = np.zeros(n, bool)
+        if taken is not None and len(taken):
+            local = _to_local(taken)
+            t_key = local // 1440 * 2 + (local % 1440 >= 720)
+            t_key, first = np.unique(t_key, return_index=True)
+            t_first = taken[first]
+            pos = np.minimum(np.searchsorted(t_key, key), len(t_key) - 1)
+            hit = t_key[pos] == key
+            near = np.abs(when - t_first[pos]) <= self.window
+            dup, bad = hit & near, bad | (hit & ~near)
+        if busy:
+            mod = self.local[order] % 1440
+            slot = self.slot[order]
+            for s, mins in busy.items():
+                on = slot == s
+                for m in mins:
+                    bad |= on & (np.abs(mod - m) * 60 > self.window)
+        bad_groups = np.unique(group[bad])
+        keep = np.empty(n, bool)
+        keep[order] = ~bad & ~dup                       # the first dose of a compartment wins
+        conflicts = []
+        for g in bad_groups:
+            idx = order[group == g]
+            local = self.local[idx]
+            conflicts.append(Conflict(
+                str(np.datetime64(int(local[0]), "m").astype("datetime64[D]")),
+                "Morning" if local[0] % 1440 < 720 else "Evening", int(self.slot[idx[0]]),
+                [f"{m // 60 % 24:02}:{m % 60:02}" for m in local % 1440],
+                sorted({self.names[i] for i in self.reg[idx]})))
+        return conflicts, keep
+
+    def against(self, alarms):
+        """Also check against the alarms already in `alarms`."""
+        busy, taken = {}, []
+        for job in alarms.jobs():
+            if job.at is None:
+                taken.append(job.when)
+                continue
+            mod = job.at[0] * 60 + job.at[1]
+            for d in (range(7) if job.day is None else (job.day,)):
+                busy.setdefault(d * 2 + (mod >= 720), []).append(mod)
+        self.conflicts, self.keep = self._check(busy, np.array(taken, np.int64))
+        return self.conflicts
+
+def compile_plan(regimens, window=MERGE_WINDOW_S):
+    return Plan(regimens, window)
+
+def install(plan, alarms, fn, store=None, force=False):
+    """Register the plan's doses as one-shot jobs calling fn(day, "hh:mm AM",
+    period), with one add_many() and one store transaction.  Conflicting
+    doses are refused unless force=True, which drops them (the first dose of
+    a compartment wins).  Doses at the same time share one job."""
+    if plan.conflicts and not force:
+        raise ValueError(f"{len(plan.conflicts)} slot conflicts, e.g. {plan.conflicts[0]}")
+    when, local = plan.when[plan.keep], plan.local[plan.keep]
+    when, first = np.unique(when, return_index=True)
+    local = local[first]
+    mod, dow = local % 1440, (local // 1440 + 4) % 7
+    labels = {int(m): f"{(m // 60) % 12 or 12:02}:{m % 60:02} {'AM' if m < 720 else 'PM'}"
+              for m in np.unique(mod)}
+    jobs = [alarms.make_once(float(t), fn, DAYS[d], labels[m], "Morning" if m < 720 else "Evening")
+            for t, d, m in zip(when.tolist(), dow.tolist(), mod.tolist())]
+    alarms.add_many(jobs)
+    if store is not None:
+        store.add_many(jobs)
+    return jobs
+
+# ───────── CLI / timing check ─────────
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        import schedule_store
+        from alarm_scheduler import AlarmScheduler
+        plan = compile_plan(load_specs(sys.argv[1]))
+        for c in plan.conflicts:
+            print("conflict:", c)
+        store = schedule_store.ScheduleStore(
+            sys.argv[2] if len(sys.argv) > 2 else os.path.join(os.path.dirname(
+                os.path.abspath(__file__)), "alarms.db"))
+        sched = AlarmScheduler()
+        store.load_into(sched, lambda *a: None)
+        plan.against(sched)
+        jobs = install(plan, sched, lambda *a: None, store, force=True)
+        print(f"{len(plan)} doses → {len(jobs)} alarms stored, {len(plan.conflicts)} conflicts dropped")
+        store.close()
+        sys.exit()
+
+    from alarm_scheduler import AlarmScheduler, SimClock
+    specs = """name,start,every_h,times,days,byday,rrule
+Amoxicillin,2025-01-05 08:00,8,,30,,
+Metformin,2025-01-05 08:00,,08:00 20:00,365,,
+Atorvastatin,2025-01-05 20:00,,20:00,365,,
+Vitamin D,2025-01-05 08:00,,,,,"FREQ=WEEKLY;BYDAY=MO,TH;BYHOUR=8;BYMINUTE=0;COUNT=104"
+Levothyroxine,2025-01-05 08:00,,,,,FREQ=DAILY;BYHOUR=8;BYMINUTE=0;UNTIL=20260105T000000
+"""
+    regs = load_specs(specs, "csv")
+    compile_plan(regs)                                  # NumPy imports some parts lazily
+    t0 = time.perf_counter()
+    plan = compile_plan(regs)
+    t1 = time.perf_counter()
+    sched = AlarmScheduler(SimClock(np.datetime64("2025-01-05T00:00").astype("datetime64[s]")
+                                    .astype(np.int64).item()))
+    plan.against(sched)
+    jobs = install(plan, sched, lambda *a: None, force=True)
+    t2 = time.perf_counter()
+    print(f"{len(regs)} regimens, {len(plan)} doses compiled in {(t1 - t0) * 1000:.1f} ms, "
+          f"{len(jobs)} alarms installed in {(t2 - t1) * 1000:.1f} ms")
+    print(f"{len(plan.conflicts)} conflicting compartments, e.g.", plan.conflicts[0])
+    assert all("Amoxicillin" in c.regimens for c in plan.conflicts)    # 8-hourly: 3 doses a day
+    assert len(_expand(regs[0])) == 90                  # every 8 h for 30 days
+    assert all(str(np.datetime64(int(m), "m"))[11:] in ("08:00", "20:00")
+               for m in _to_local(_expand(regs[1])))          # across DST changes
+    assert (plan.slot[plan.reg == 3] % 2 == 0).all() and len(_expand(regs[3])) == 104
+    ics = ("BEGIN:VCALENDAR\nBEGIN:VEVENT\nSUMMARY:Prednisone\nDTSTART;TZID=Local:20250106T080000\n"
+           "RRULE:FREQ=DAILY;INTERVAL=2;COUNT=10\nEND:VEVENT\nEND:VCALENDAR\n")
+    t = _to_local(_expand(load_specs(ics)[0]))
+    assert len(t) == 10 and set(np.diff(t // 1440)) == {2}
+    for rule in ("FREQ=HOURLY;INTERVAL=8;COUNT=10;BYDAY=MO,WE,FR",
+                 "FREQ=WEEKLY;COUNT=10;BYDAY=MO,WE,FR"):       # COUNT counts matched days
+        t = _to_local(_expand(_rrule("x", _dt("2025-01-05 08:00"), rule)))
+        assert len(t) == 10 and set((t // 1440 + 4) % 7) <= {1, 3, 5}, rule
+    from datetime import datetime, timezone
+    local = datetime(2025, 7, 5, 12, tzinfo=timezone.utc).astimezone()      # UNTIL=…Z is UTC
+    assert str(_dt("20250705T120000Z")) == local.strftime("%Y-%m-%dT%H:%M")
@@ -0,0 +1,168 @@
+"""
+schedule_store.py
+————————
+Durable alarm list (SQLite, WAL journal).
+Every add / remove is one small transaction – nothing rewrites the whole
+file – and load_into() arms the scheduler with a single bulk insert.
+"""
+
+import json, os, sqlite3, threading, time
+
+STARTUP_BUDGET_S = 0.5      # cold boot → alarms armed, warn above this
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS alarms (
+    id      INTEGER PRIMARY KEY,
+    day     INTEGER,            -- 0-6 Sunday-based, NULL = daily
+    at      TEXT,               -- "HH:MM", NULL = one-shot
+    when_ts REAL,               -- one-shot epoch seconds
+    args    TEXT NOT NULL,      -- JSON list passed to the alarm callback
+    fleet   TEXT                -- JSON fleet alarm id, NULL = set on this device
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key     TEXT PRIMARY KEY,
+    value   TEXT NOT NULL       -- JSON
+)"""
+
+class ScheduleStore:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False,
+                                  isolation_level=None)     # autocommit
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")        # WAL-safe, fewer fsyncs
+        self.db.executescript(SCHEMA)
+        cols = [r[1] for r in self.db.execute("PRAGMA table_info(alarms)")]
+        if "fleet" not in cols:                             # file from before fleet rows
+            self.db.execute("ALTER TABLE alarms ADD COLUMN fleet TEXT")
+
+    # ---- incremental writes ----
+    @staticmethod
+    def _row(job, fleet_id):
+        return (job.day, None if job.at is None else "%02d:%02d" % job.at, job.when,
+                json.dumps(list(job.args)), None if fleet_id is None else json.dumps(fleet_id))
+
+    def add_job(self, job, fleet_id=None):
+        """Persist a scheduler Job; its row id goes into job.tag."""
+        with self._lock:
+            cur = self.db.execute(
+                "INSERT INTO alarms (day, at, when_ts, args, fleet) VALUES (?,?,?,?,?)",
+                self._row(job, fleet_id))
+        job.tag = cur.lastrowid
+        return job.tag
+
+    def add_many(self, jobs):
+        """add_job for a batch, in one transaction."""
+        with self._lock:
+            self.db.execute("BEGIN")
+            try:
+                for job in jobs:
+                    job.tag = self.db.execute(
+                        "INSERT INTO alarms (day, at, when_ts, args, fleet) VALUES (?,?,?,?,?)",
+                        self._row(job, None)).lastrowid
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+            self.db.execute("COMMIT")
+        return jobs
+
+    def apply_fleet(self, gone, jobs, fleet_ids, version):
+        """One fleet delta in one transaction: drop `gone`, add `jobs`
+        under `fleet_ids`, and note the (epoch, v) it brings the device to."""
+        with self._lock:
+            self.db.execute("BEGIN")
+            try:
+                for job in gone:
+                    if job.tag is not None:
+                        self.db.execute("DELETE FROM alarms WHERE id=?", (job.tag,))
+                for job, fid in zip(jobs, fleet_ids):
+                    job.tag = self.db.execute(
+                        "INSERT INTO alarms (day, at, when_ts, args, fleet) VALUES (?,?,?,?,?)",
+                        self._row(job, fid)).lastrowid
+                self.db.execute("INSERT OR REPLACE INTO meta VALUES ('fleet_v', ?)",
+                                (json.dumps(list(version)),))
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+            self.db.execute("COMMIT")
+        for job in gone:
+            job.tag = None
+
+    def fleet_version(self):
+        """(epoch, v) of the last fleet delta applied; (None, 0) if none."""
+        with self._lock:
+            row = self.db.execute("SELECT value FROM meta WHERE key='fleet_v'").fetchone()
+        return tuple(json.loads(row[0])) if row else (None, 0)
+
+    def remove_job(self, job):
+        if job.tag is None:
+            return
+        with self._lock:
+            self.db.execute("DELETE FROM alarms WHERE id=?", (job.tag,))
+        job.tag = None
+
+    # ---- boot ----
+    def load_into(self, sched, fn, now=None):
+        """Arm `sched` with every alarm set on this device, calling fn(*args).
+        Expired one-shots are dropped.  Returns (jobs, seconds)."""
+        t0 = time.perf_counter()
+        jobs = list(self._load(sched, fn, "fleet IS NULL", now).values())
+        return jobs, time.perf_counter() - t0
+
+    def load_fleet(self, sched, fn, now=None):
+        """Arm `sched` with the fleet-pushed alarms; {fleet id: Job}."""
+        return self._load(sched, fn, "fleet IS NOT NULL", now)
+
+    def _load(self, sched, fn, where, now):
+        now = time.time() if now is None else now
+        with self._lock:
+            self.db.execute("DELETE FROM alarms WHERE at IS NULL AND when_ts <= ?", (now,))
+            rows = self.db.execute("SELECT id, day, at, when_ts, args, fleet FROM alarms "
+                                   "WHERE " + where).fetchall()
+        jobs = {}
+        for rid, day, at, when_ts, args, fid in rows:
+            args = json.loads(args)
+            job = (sched.make_once(when_ts, fn, *args) if at is None
+                   else sched.make_every(day, at, fn, *args))
+            job.tag = rid
+            jobs[rid if fid is None else json.loads(fid)] = job
+        sched.add_many(jobs.values())
+        return jobs
+
+    def count(self):
+        with self._lock:
+            return self.db.execute("SELECT COUNT(*) FROM alarms").fetchone()[0]
+
+    def compact(self):
+        """Fold the WAL back into the main file (cheap, call when idle)."""
+        with self._lock:
+            self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        self.compact()
+        self.db.close()
+
+# ───────── startup timing check ─────────
+if __name__ == "__main__":
+    import tempfile
+    from alarm_scheduler import AlarmScheduler, DAYS
+
+    n = 5000
+    with tempfile.TemporaryDirectory() as d:
+        st = ScheduleStore(os.path.join(d, "alarms.db"))
+        sched = AlarmScheduler()
+        t0 = time.perf_counter()
+        for i in range(n):
+            day = DAYS[i % 7]
+            st.add_job(sched.make_every(day, "%02d:%02d" % (i % 24, i % 60),
+                                        print, day, "08:00 AM", "Morning"))
+        print(f"{n} incremental adds in {(time.perf_counter()-t0)*1000:.0f} ms")
+        st.close()
+
+        st = ScheduleStore(os.path.join(d, "alarms.db"))
+        jobs, dt = st.load_into(AlarmScheduler(), print)
+        ok = "OK" if dt < STARTUP_BUDGET_S else "OVER BUDGET"
+        print(f"{len(jobs)} alarms armed in {dt*1000:.1f} ms "
+              f"(budget {STARTUP_BUDGET_S*1000:.0f} ms) {ok}")
+        st.close()
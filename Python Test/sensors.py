@@ -0,0 +1,106 @@
+"""
+sensors.py
+————————
+PIR event pipeline.
+MotionHub owns the MotionSensor: raw edges are debounced, stamped with a
+monotonic clock and written to a fixed ring.  Subscribers keep their own
+read cursor into the ring, so there is one writer, no lock, and no
+handler to overwrite – each popup subscribes on open and closes its
+subscription on dismiss.  A subscriber is woken at most once per
+accepted event (UI subscribers via Clock.schedule_once).
+Reaction times (alarm shown → motion → dismissed) are kept for reporting.
+"""
+
+import time
+from collections import deque, namedtuple
+
+DEBOUNCE_S = 2.0            # edges closer than this to the last event are chatter
+RING_SIZE  = 64
+
+MotionEvent = namedtuple("MotionEvent", "seq t")
+Reaction    = namedtuple("Reaction", "shown_to_motion_s motion_to_dismiss_s")
+
+class EventRing:
+    """Single-producer ring.  Readers never block the writer; a reader that
+    falls more than `size` behind skips ahead (lost events are counted)."""
+    def __init__(self, size=RING_SIZE):
+        self.buf  = [None] * size
+        self.size = size
+        self.seq  = 0                       # next sequence number to write
+
+    def push(self, ev):
+        self.buf[self.seq % self.size] = ev
+        self.seq += 1                       # publish after the slot is written
+
+    def read(self, cursor):
+        """(events, new cursor, lost) for everything after cursor."""
+        end = self.seq
+        lost = max(0, end - cursor - self.size)
+        cursor += lost
+        return [self.buf[i % self.size] for i in range(cursor, end)], end, lost
+
+class Subscription:
+    def __init__(self, hub, fn, post):
+        self.hub, self.fn, self.post = hub, fn, post
+        self.cursor  = hub.ring.seq         # only events from now on
+        self.pending = False
+        self.lost    = 0
+        self.closed  = False
+
+    def wake(self):
+        if self.pending or self.closed:
+            return                          # a drain is already on its way
+        self.pending = True
+        self.post(self.drain)
+
+    def drain(self, *_):
+        self.pending = False
+        evs, self.cursor, lost = self.hub.ring.read(self.cursor)
+        self.lost += lost
+        for ev in evs:
+            if self.closed:
+                break
+            self.fn(ev)
+
+    def close(self):
+        self.closed = True
+        self.hub.unsubscribe(self)
+
+class MotionHub:
+    def __init__(self, pir, clock=time.monotonic, debounce=DEBOUNCE_S):
+        self.pir, self.clock, self.debounce = pir, clock, debounce
+        self.ring  = EventRing()
+        self.subs  = ()                     # replaced, never mutated in place
+        self.last  = None
+        self.raw_edges = self.events = 0
+        self.reactions = deque(maxlen=500)
+        pir.when_motion = self._edge
+
+    def _edge(self):
+        """gpiozero callback thread (or the simulator)."""
+        t = self.clock()
+        self.raw_edges += 1
+        if self.last is not None and t - self.last < self.debounce:
+            return
+        self.last = t
+        self.ring.push(MotionEvent(self.ring.seq, t))
+        self.events += 1
+        for sub in self.subs:
+            sub.wake()
+
+    def subscribe(self, fn, post=None):
+        """fn(MotionEvent) for every event from now on.  post(callable)
+        decides where fn runs; default is the sensor's thread."""
+        sub = Subscription(self, fn, post or (lambda f: f()))
+        self.subs = self.subs + (sub,)
+        return sub
+
+    def unsubscribe(self, sub):
+        self.subs = tuple(s for s in self.subs if s is not sub)
+
+    def record_reaction(self, shown_t, ev, dismissed_t=None):
+        """shown_t / dismissed_t on this hub's clock."""
+        done = self.clock() if dismissed_t is None else dismissed_t
+        r = Reaction(ev.t - shown_t, done - ev.t)
+        self.reactions.append(r)
+        return r
@@ -0,0 +1,183 @@
+"""
+sim.py
+————————
+Headless pill-box on a virtual clock.
+Simulated LED / PIR / stepper / audio record what they were asked to do
+(with virtual timestamps) and build() wires them through
+dispenser.Dispenser exactly like GUI Dev.py does, with SimPopup standing
+in for AlarmPopup.  No Kivy, no GPIO, no mixer.
+
+    box, popups = sim.build()
+    box.alarms.every("Monday", "08:00", box.trigger_alarm, "Monday", "08:00 AM", "Morning")
+    box.alarms.run_until(box.alarms.clock.time() + 7 * 86400)
+"""
+
+import random
+from datetime import datetime
+
+import stepper, motion
+from alarm_scheduler import AlarmScheduler, SimClock
+from dispenser import Dispenser
+from sensors import MotionHub
+
+PIR_REACT_S = 30            # virtual seconds until someone walks up
+
+# ───────── devices ─────────
+class SimLED:
+    def __init__(self, clock):
+        self.clock, self.value, self.log = clock, 0, []     # log: (t, value)
+
+    def on(self):  self._set(1)
+    def off(self): self._set(0)
+
+    @property
+    def is_lit(self):
+        return bool(self.value)
+
+    def _set(self, v):
+        if v != self.value:
+            self.value = v
+            self.log.append((self.clock.time(), v))
+
+class SimPIR:
+    """gpiozero-style: assign when_motion, call motion() to fire it."""
+    def __init__(self, clock):
+        self.clock, self.when_motion, self.events = clock, None, []
+
+    def motion(self):
+        self.events.append(self.clock.time())
+        if self.when_motion:
+            self.when_motion()
+
+class SimStepper(stepper.SimBackend):
+    """No sleeping; logs (t, steps, forward, seconds) per move."""
+    name = "sim-virtual"
+
+    def __init__(self, clock):
+        super().__init__(realtime=False, verbose=False)
+        self.clock, self.moves = clock, []
+
+    def run(self, wave, forward=True):
+        rep = super().run(wave, forward)
+        self.moves.append((self.clock.time(), len(wave), forward, rep.actual_s))
+        return rep
+
+class SimMark:
+    """Mark sensor on a SimCarousel (calibration.MarkSensor surface)."""
+    def __init__(self, car, positions):
+        self.car, self.positions, self.edges = car, set(positions), []
+
+    @property
+    def active(self):
+        return self.car.true in self.positions
+
+    def edges_during(self, t0, wave):
+        return list(self.edges)             # recorded during the last run
+
+class SimCarousel(stepper.SimBackend):
+    """The mechanism itself: true position in steps, optional missed steps
+    (probability `slip` per step), a home mark at 0 and one mark per slot
+    at `notches` (default: evenly spaced, unlike STEPS_PER_SLOT)."""
+    name = "sim-carousel"
+
+    def __init__(self, total=200, n_slots=14, slip=0.0, notches=None, seed=1):
+        super().__init__(realtime=False, verbose=False)
+        self.total, self.slip = total, slip
+        self.notches = notches or [round(i * total / n_slots) for i in range(n_slots)]
+        self.true = self.missed = 0
+        self.rng = random.Random(seed)
+        self.home  = SimMark(self, [0])
+        self.slots = SimMark(self, self.notches)
+
+    def run(self, wave, forward=True):
+        d = 1 if forward else -1
+        self.home.edges, self.slots.edges = [], []
+        for i in range(len(wave)):
+            if self.slip and self.rng.random() < self.slip:
+                self.missed += 1
+                continue
+            self.true = (self.true + d) % self.total
+            if self.home.active:  self.home.edges.append(i)
+            if self.slots.active: self.slots.edges.append(i)
+        return super().run(wave, forward)
+
+class SimAudio:
+    """Same surface as audio.AlarmAudio."""
+    ok = True
+
+    def __init__(self, clock):
+        self.clock, self.playing, self.log = clock, None, []
+        self.latency_hooks, self.last_latency, self.volume = [], None, 1.0
+
+    def preload(self, *paths):
+        pass
+
+    def play(self, path, loops=-1):
+        if self.playing != path:
+            self.playing = path
+            self.log.append((self.clock.time(), "play", path))
+        return True
+
+    def stop(self):
+        if self.playing:
+            self.log.append((self.clock.time(), "stop", self.playing))
+        self.playing = None
+
+    def set_volume(self, vol):
+        self.volume = vol
+
+    def release(self):
+        self.stop()
+
+    def reopen(self):
+        return True
+
+# ───────── UI stand-in ─────────
+class SimPopup:
+    """AlarmPopup's lifecycle without widgets."""
+    def __init__(self, box, session):
+        self.box, self.session = box, session
+        self.opened_at = box.alarms.clock.time()
+        self.closed_at = self.how = None
+        box.alert_on(session)
+        self._pir = box.motion.subscribe(self._pir_stop) if box.motion else None
+
+    def _pir_stop(self, ev):
+        self._stop("pir")
+        self.box.motion.record_reaction(self.opened_at, ev)
+
+    def snooze(self):
+        self.box.snooze(self.session)
+        self._stop("snooze")
+
+    def stop(self):
+        self._stop("stop")
+
+    def _stop(self, how):
+        if self.closed_at is not None:
+            return
+        self.box.alert_off(self.session, how if how != "snooze" else None)
+        if self._pir:
+            self._pir.close()
+        self.closed_at, self.how = self.box.alarms.clock.time(), how
+
+def build(start=None, react_s=PIR_REACT_S, log=None):
+    """Simulated Dispenser on a SimClock.  Each popup is dismissed by the
+    PIR react_s virtual seconds after it opens (None = never); log is
+    an optional dose_log.DoseLog.
+    Returns (box, popups)."""
+    clock = SimClock(datetime(2025, 1, 5).timestamp() if start is None else start)
+    alarms = AlarmScheduler(clock)
+    motor = motion.MotionController(SimStepper(clock), threaded=False)
+    motor.verbose = False
+    popups = []
+    box = Dispenser(alarms, motor, SimAudio(clock), "alarm.wav",
+                    led=SimLED(clock), motion=MotionHub(SimPIR(clock), clock=clock.time),
+                    log=log)
+
+    def show(session):
+        popups.append(SimPopup(box, session))
+        if react_s is not None:
+            alarms.once(clock.time() + react_s, box.motion.pir.motion)
+    box.show = show
+    return box, popups
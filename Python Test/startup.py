@@ -0,0 +1,64 @@
+"""
+startup.py
+————————
+Cold-boot profile for the pill-box UI.
+Create StartupProfiler before anything heavy is imported, mark() the end
+of each phase on the critical path, note() work done off it (hardware,
+mixer).  report() prints the breakdown, appends it to startup.log and
+flags boot → first frame over BOOT_BUDGET_S.
+"""
+
+import os, time
+
+BOOT_BUDGET_S = 3.0
+LOG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "startup.log")
+
+def _process_age():
+    """Seconds since this process was started (Linux), else None."""
+    try:
+        with open("/proc/self/stat") as f:
+            start = int(f.read().rsplit(")", 1)[1].split()[19])     # field 22, clock ticks
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - start / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+class StartupProfiler:
+    def __init__(self, path=LOG_FILE):
+        self.path   = path
+        self.t0     = time.perf_counter()
+        self.before = _process_age()            # interpreter start-up, before us
+        self.marks  = []                        # (phase, perf_counter at its end)
+        self.side   = []                        # (phase, seconds) off the critical path
+
+    def mark(self, phase):
+        self.marks.append((phase, time.perf_counter()))
+
+    def note(self, phase, seconds):
+        self.side.append((phase, seconds))
+
+    def phases(self):
+        out, last = [], self.t0
+        if self.before is not None:
+            out.append(("interpreter", self.before))
+        for phase, t in self.marks:
+            out.append((phase, t - last)); last = t
+        return out
+
+    def total(self):
+        return sum(s for _, s in self.phases())
+
+    def report(self):
+        total = self.total()
+        lines = [f"boot {time.strftime('%Y-%m-%d %H:%M:%S')}  "
+                 f"{total:.2f} s to first frame (budget {BOOT_BUDGET_S:g} s)"
+                 + ("  OVER BUDGET" if total > BOOT_BUDGET_S else "")]
+        lines += [f"  {p:12} {s * 1000:8.0f} ms" for p, s in self.phases()]
+        lines += [f"  {p:12} {s * 1000:8.0f} ms  (background)" for p, s in self.side]
+        text = "\n".join(lines)
+        print(text)
+        try:
+            with open(self.path, "a") as f:
+                f.write(text + "\n")
+        except OSError as e:
+            print("Startup log error:", e)
+        return text
@@ -0,0 +1,253 @@
+"""
+stepper.py
+————————
+Step-pulse generation for the carousel stepper (STEP/DIR driver).
+A whole move is pre-computed as a waveform (one period per step, in µs)
+and handed to a backend in a single call:
+  • PigpioBackend – pigpio DMA waves, hardware timed, GIL-free
+  • SleepBackend  – pure-Python fallback, absolute deadlines + short spin
+  • SimBackend    – no GPIO, only accounts the time
+Every run returns a MoveReport so timing accuracy can be checked.
+run_parallel() starts moves on several carousels together: their
+waveforms are interleaved into one edge train (one pigpio wave / one
+Python edge loop), so the group takes as long as its longest move.
+"""
+
+import threading, time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+STEP_RATE  = 250        # steps/s  (old fixed 2 ms + 2 ms delay)
+MAX_PULSES = 2000       # steps per pigpio wave, keeps DMA CBs well in range
+SPIN_S     = 0.0005     # finish the last 0.5 ms of each wait by spinning
+
+_PI_USERS = {}          # pigpio connection a backend opened → backends using it
+_PI_LOCK  = threading.Lock()
+
+MoveReport = namedtuple("MoveReport",
+                        "steps planned_s actual_s max_late_us mean_late_us backend")
+
+def make_wave(n, rate=STEP_RATE):
+    """Constant-rate waveform: n step periods in µs."""
+    if rate <= 0:
+        raise ValueError("step rate must be > 0")
+    return [int(round(1e6 / rate))] * int(n)
+
+def merge_edges(waves):
+    """Interleave several waveforms into one edge train.
+    waves: [(mask, wave)] with the STEP bit(s) of each channel.
+    Returns [(t_us, set_mask, clear_mask)] in time order; coincident edges
+    share one entry and each channel's end is kept as an empty entry, so
+    the gaps between entries are the delays to program."""
+    edges = {}
+    for mask, wave in waves:
+        t = 0
+        for period in wave:
+            hi = period // 2
+            s, c = edges.get(t, (0, 0)); edges[t] = (s | mask, c)
+            s, c = edges.get(t + hi, (0, 0)); edges[t + hi] = (s, c | mask)
+            t += period
+        edges.setdefault(t, (0, 0))
+    return [(t, s, c) for t, (s, c) in sorted(edges.items())]
+
+# ───────── backends ─────────
+class SimBackend:
+    """No hardware.  realtime=True sleeps the planned duration like the old sim."""
+    name = "sim"
+
+    def __init__(self, realtime=True, verbose=True):
+        self.realtime, self.verbose = realtime, verbose
+
+    def run(self, wave, forward=True):
+        planned = sum(wave) / 1e6
+        if self.verbose:
+            print(f"[sim] {len(wave)} steps {'fwd' if forward else 'rev'}")
+        t0 = time.perf_counter()
+        if self.realtime and planned:
+            time.sleep(planned)
+        actual = time.perf_counter() - t0 if self.realtime else planned
+        return MoveReport(len(wave), planned, actual, 0.0, 0.0, self.name)
+
+    def pause(self, seconds):
+        if self.realtime:
+            time.sleep(seconds)
+
+    def close(self):
+        pass
+
+class SleepBackend:
+    """Pure-Python edges on gpiozero pins.  Deadlines are absolute so late
+    edges don't accumulate; the report shows how late each edge was."""
+    name = "sleep"
+
+    def __init__(self, dir_pin, step_pin):
+        self.dir_pin, self.step_pin = dir_pin, step_pin
+
+    @staticmethod
+    def _wait_until(deadline):
+        rem = deadline - time.perf_counter()
+        if rem > SPIN_S:
+            time.sleep(rem - SPIN_S)
+        while time.perf_counter() < deadline:
+            pass
+
+    def run(self, wave, forward=True):
+        self.dir_pin.value = 1 if forward else 0
+        late_max = late_sum = 0.0
+        t0 = deadline = time.perf_counter()
+        for period in wave:
+            half = period / 2e6
+            for level in (1, 0):
+                late = time.perf_counter() - deadline
+                late_max = max(late_max, late); late_sum += late
+                self.step_pin.value = level
+                deadline += half
+                self._wait_until(deadline)
+        actual = time.perf_counter() - t0
+        edges = 2 * len(wave) or 1
+        return MoveReport(len(wave), sum(wave) / 1e6, actual,
+                          late_max * 1e6, late_sum / edges * 1e6, self.name)
+
+    @classmethod
+    def run_merged(cls, moves):
+        """[(SleepBackend, wave, forward)] as one edge loop."""
+        for b, _, fwd in moves:
+            b.dir_pin.value = 1 if fwd else 0
+        pins = [b.step_pin for b, _, _ in moves]
+        train = merge_edges([(1 << i, w) for i, (_, w, _) in enumerate(moves)])
+        late_max = late_sum = 0.0
+        t0 = time.perf_counter()
+        for t, on, off in train:
+            deadline = t0 + t / 1e6
+            cls._wait_until(deadline)
+            late = time.perf_counter() - deadline
+            late_max = max(late_max, late); late_sum += late
+            for i, pin in enumerate(pins):
+                if on >> i & 1:
+                    pin.value = 1
+                elif off >> i & 1:
+                    pin.value = 0
+        actual = time.perf_counter() - t0
+        mean = late_sum / (len(train) or 1) * 1e6
+        return [MoveReport(len(w), sum(w) / 1e6, actual, late_max * 1e6, mean, cls.name + "+")
+                for _, w, _ in moves]
+
+    def close(self):
+        pass
+
+class PigpioBackend:
+    """DMA-timed waves through the pigpio daemon; one submit per chunk.
+    pi: another channel's connection to share; the connection is stopped
+    when the last backend using it closes (one passed in from elsewhere
+    is left to its owner)."""
+    name = "pigpio"
+
+    def __init__(self, dir_gpio, step_gpio, pi=None):
+        import pigpio
+        self.pigpio = pigpio
+        self.pi = pi or pigpio.pi()
+        if not self.pi.connected:
+            raise RuntimeError("pigpiod not running")
+        with _PI_LOCK:
+            if pi is None:
+                _PI_USERS[self.pi] = 1
+            elif pi in _PI_USERS:
+                _PI_USERS[pi] += 1
+        self.dir_gpio, self.step_gpio = dir_gpio, step_gpio
+        for g in (dir_gpio, step_gpio):
+            self.pi.set_mode(g, pigpio.OUTPUT)
+
+    def _pulses(self, chunk):
+        mask, pulse = 1 << self.step_gpio, self.pigpio.pulse
+        out = []
+        for period in chunk:
+            hi = period // 2
+            out.append(pulse(mask, 0, hi))
+            out.append(pulse(0, mask, period - hi))
+        return out
+
+    def _send(self, pulses, us):
+        pi = self.pi
+        pi.wave_clear()
+        pi.wave_add_generic(pulses)
+        wid = pi.wave_create()
+        pi.wave_send_once(wid)
+        time.sleep(us / 1e6)                    # DMA does the timing
+        while pi.wave_tx_busy():
+            time.sleep(0.001)
+        pi.wave_delete(wid)
+
+    def run(self, wave, forward=True):
+        self.pi.write(self.dir_gpio, 1 if forward else 0)
+        t0 = time.perf_counter()
+        for i in range(0, len(wave), MAX_PULSES):
+            chunk = wave[i:i + MAX_PULSES]
+            self._send(self._pulses(chunk), sum(chunk))
+        actual = time.perf_counter() - t0
+        planned = sum(wave) / 1e6
+        # edges are DMA-exact; report the completion overrun as lateness
+        late = max(0.0, actual - planned) * 1e6
+        return MoveReport(len(wave), planned, actual, late, 0.0, self.name)
+
+    @staticmethod
+    def run_merged(moves):
+        """[(PigpioBackend, wave, forward)] as one DMA pulse train, sent
+        through the first channel's connection (one daemon owns every GPIO
+        and only one wave can be on air)."""
+        lead = moves[0][0]
+        for b, _, fwd in moves:
+            lead.pi.write(b.dir_gpio, 1 if fwd else 0)
+        train = merge_edges([(1 << b.step_gpio, w) for b, w, _ in moves])
+        pulses = [lead.pigpio.pulse(on, off, nxt[0] - t)
+                  for (t, on, off), nxt in zip(train, train[1:])]
+        t0 = time.perf_counter()
+        for i in range(0, len(pulses), 2 * MAX_PULSES):
+            chunk = pulses[i:i + 2 * MAX_PULSES]
+            lead._send(chunk, sum(p.delay for p in chunk))
+        actual = time.perf_counter() - t0
+        late = max(0.0, actual - train[-1][0] / 1e6) * 1e6
+        return [MoveReport(len(w), sum(w) / 1e6, actual, late, 0.0, lead.name + "+")
+                for _, w, _ in moves]
+
+    def close(self):
+        pi, self.pi = self.pi, None
+        if pi is None:
+            return
+        with _PI_LOCK:
+            if pi not in _PI_USERS:
+                return
+            _PI_USERS[pi] -= 1
+            if _PI_USERS[pi]:
+                return                          # a sharing channel still needs it
+            del _PI_USERS[pi]
+        pi.wave_clear()                         # clears every wave on the daemon
+        pi.stop()
+
+def run_parallel(moves):
+    """Start [(backend, wave, forward)] on different channels together and
+    return one MoveReport per move.  pigpio or Python-edge channels are
+    interleaved into one pulse train; anything else (simulation, a mix)
+    runs one thread per channel.  Either way the group lasts as long as
+    its longest move, not the sum."""
+    moves = [m for m in moves if m[1]]
+    if len(moves) <= 1:
+        return [b.run(w, fwd) for b, w, fwd in moves]
+    kinds = {type(b) for b, _, _ in moves}
+    if kinds == {PigpioBackend}:
+        return PigpioBackend.run_merged(moves)
+    if kinds == {SleepBackend}:
+        return SleepBackend.run_merged(moves)
+    with ThreadPoolExecutor(len(moves)) as ex:
+        return list(ex.map(lambda m: m[0].run(m[1], m[2]), moves))
+
+def open_backend(dir_gpio, step_gpio, dir_pin=None, step_pin=None, pi=None):
+    """Best available backend: pigpio if the daemon is up, else Python edges
+    on the given gpiozero devices, else simulation.  Pass another channel's
+    .pi to share its daemon connection."""
+    try:
+        return PigpioBackend(dir_gpio, step_gpio, pi)
+    except Exception:
+        pass
+    if dir_pin is not None and step_pin is not None:
+        return SleepBackend(dir_pin, step_pin)
+    return SimBackend()
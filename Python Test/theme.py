@@ -0,0 +1,157 @@
+"""
+theme.py
+————————
+Shared look for the pill-box screens.
+  • Screens  – ScreenManager that draws the one background every screen
+               sits on (screens themselves draw nothing) and skips the
+               layout pass per frame of a slide transition
+  • CachedLabel / CachedButton / Title – fixed or repeating short texts
+               (captions, day names, arrows, slot numbers, clock digits)
+               are rendered once into TEXTURES and drawn as a textured
+               rectangle: no Label per widget, no per-widget text layout.
+               Button colour is picked by `role` from PALETTE.
+  • Text     – real Label for multi-line / markup / ever-changing text
+  • FlashPanel – box with its own background colour (alarm popup)
+Positions and sizes of canvas instructions are bound in KV, so no screen
+needs its own _upd_rect.
+"""
+
+from collections import OrderedDict
+
+from kivy.core.text import Label as CoreLabel
+from kivy.lang import Builder
+from kivy.metrics import sp
+from kivy.properties import (ListProperty, NumericProperty, ObjectProperty,
+                             StringProperty)
+from kivy.uix.behaviors import ButtonBehavior
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.label import Label
+from kivy.uix.screenmanager import ScreenManager
+from kivy.uix.widget import Widget
+
+BG = (.05, .05, .20, 1)
+PALETTE = {
+    "nav":    (.2, .4, .8, 1),      # back / arrows
+    "action": (.3, .7, .9, 1),      # main action on a screen
+    "period": (.1, .6, .8, 1),
+    "motor":  (.3, .5, .9, 1),
+    "menu":   (.2, .5, .7, 1),
+    "on":     (.0, .6, .2, 1),
+    "off":    (.6, .1, .1, 1),
+    "mute":   (.6, .1, .3, 1),
+    "tool":   (.6, .5, .1, 1),
+    "jog":    (.4, .4, .9, 1),
+    "plain":  (1, 1, 1, 1),         # Kivy's default grey
+}
+WHITE = (1, 1, 1, 1)
+
+# ───────── texture cache ─────────
+class TextureCache:
+    """(text, font px, colour) → rendered texture, LRU-bounded."""
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._tex = OrderedDict()
+        self.renders = 0
+
+    def get(self, text, font_size, color=WHITE):
+        key = (text, font_size, tuple(color))
+        tex = self._tex.get(key)
+        if tex is None:
+            lab = CoreLabel(text=text, font_size=font_size, color=tuple(color))
+            lab.refresh()
+            tex = self._tex[key] = lab.texture
+            self.renders += 1
+            if len(self._tex) > self.maxsize:
+                self._tex.popitem(last=False)
+        else:
+            self._tex.move_to_end(key)
+        return tex
+
+    def __len__(self):
+        return len(self._tex)
+
+TEXTURES = TextureCache()
+
+# ───────── widgets ─────────
+class Screens(ScreenManager):
+    def real_add_widget(self, screen, *args):
+        super().real_add_widget(screen, *args)
+        # FloatLayout re-lays out on every child move; screens fill the
+        # manager and have no pos_hint, so a sliding screen needs none
+        screen.unbind(pos=self._trigger_layout)
+
+class Text(Label):
+    pass
+
+class FlashPanel(BoxLayout):
+    bg = ListProperty(BG)
+
+class CachedLabel(Widget):
+    text      = StringProperty("")
+    font_size = NumericProperty(sp(20))
+    color     = ListProperty(WHITE)
+    texture   = ObjectProperty(None, allownone=True)
+    texture_size = ListProperty([0, 0])
+
+    def __init__(self, **kw):
+        super().__init__(**kw)
+        self.fbind("text", self._render)
+        self.fbind("font_size", self._render)
+        self.fbind("color", self._render)
+        self._render()
+
+    def _render(self, *_):
+        tex = TEXTURES.get(self.text, self.font_size, self.color) if self.text else None
+        self.texture = tex
+        self.texture_size = tex.size if tex else (0, 0)
+
+class CachedButton(ButtonBehavior, CachedLabel):
+    role      = StringProperty("nav")
+    font_size = NumericProperty(sp(15))     # Button's default
+
+class Title(CachedLabel):
+    font_size = NumericProperty(sp(24))
+
+Builder.load_string("""
+#:import PALETTE theme.PALETTE
+#:import BG theme.BG
+
+<Screens>:
+    canvas.before:
+        Color:
+            rgba: BG
+        Rectangle:
+            pos: self.pos
+            size: self.size
+
+<Text>:
+    font_size: "20sp"
+    color: 1, 1, 1, 1
+
+<FlashPanel>:
+    canvas.before:
+        Color:
+            rgba: self.bg
+        Rectangle:
+            pos: self.pos
+            size: self.size
+
+<CachedLabel>:
+    canvas:
+        Color:
+            rgba: 1, 1, 1, 1
+        Rectangle:
+            texture: self.texture
+            size: self.texture_size
+            pos: int(self.center_x - self.texture_size[0] / 2), int(self.center_y - self.texture_size[1] / 2)
+
+<CachedButton>:
+    canvas.before:
+        Color:
+            rgba: PALETTE.get(self.role, PALETTE["nav"])
+        BorderImage:
+            border: 16, 16, 16, 16
+            pos: self.pos
+            size: self.size
+            source: "atlas://data/images/defaulttheme/button" + ("_pressed" if self.state == "down" else "")
+""")
@@ -0,0 +1,211 @@
+"""
+timesync.py
+————————
+Wall-clock watch and RTC sync, all off the Kivy thread.
+Alarms are wall-clock times but the scheduler waits with monotonic
+timeouts, so while it sleeps towards a far deadline a step of the wall
+clock (NTP catching up after a boot without network, `date -s`, a bad
+RTC) would go unseen until that deadline.
+  • TimeService.check() – every CHECK_S asks the scheduler to compare
+                          wall − monotonic; a step re-keys only the
+                          alarms it jumped over (AlarmScheduler._stepped)
+  • TimeService.sync()  – NTP on, wait for NTPSynchronized, write the
+                          system time to the RTC; notes how far NTP moved
+                          the clock and how far the RTC had drifted
+  • report()            – steps seen, last correction, RTC drift in ppm
+DST needs nothing here: no wall time moves, Job.next_after works in
+local time.
+
+usage: python timesync.py        (simulated steps, DST, sync)
+"""
+
+import subprocess, threading, time
+from datetime import datetime
+
+import metrics
+
+CHECK_S     = 60            # step check period
+SYNC_S      = 6 * 3600      # NTP + RTC sync period
+SYNC_WAIT_S = 30            # give NTP this long to synchronise
+CMD_TIMEOUT = 10
+
+def _sh(argv):
+    r = subprocess.run(argv, capture_output=True, text=True, timeout=CMD_TIMEOUT)
+    return r.returncode, r.stdout.strip()
+
+class TimeService:
+    """sh(argv) → (returncode, stdout) runs the system commands."""
+
+    def __init__(self, alarms, sh=_sh, check_s=CHECK_S, sync_s=SYNC_S):
+        self.alarms, self.sh = alarms, sh
+        self.clock = alarms.clock
+        self.check_s, self.sync_s = check_s, sync_s
+        self.last_step = None               # s the last sync moved the wall clock
+        self.rtc_err   = None               # RTC − system before the last RTC write, s
+        self.drift_ppm = None               # rtc_err over the time since the write before
+        self._rtc_set  = None               # wall time of the last RTC write
+        self._lock   = threading.Lock()     # one sync at a time (timer + button)
+        self._stop   = threading.Event()
+        self._thread = None
+
+    # ---- thread ----
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="timesync", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        next_sync = time.monotonic()
+        while not self._stop.wait(self.check_s):
+            self.check()
+            if self.sync_s and time.monotonic() >= next_sync:
+                self.sync()
+                next_sync = time.monotonic() + self.sync_s
+
+    # ---- any thread but Kivy's ----
+    def check(self):
+        """Wall-clock step in s since the scheduler last looked (0.0 = none)."""
+        return self.alarms.check_clock()
+
+    def sync(self):
+        """Blocks up to SYNC_WAIT_S (use run_bg).  True once NTP has the
+        clock synchronised."""
+        with self._lock:
+            before = self.clock.offset()
+            try:
+                ok = self._sync()
+            except (OSError, subprocess.SubprocessError) as e:
+                metrics.ERRORS.inc("io")
+                print("Time sync error:", e)
+                ok = False
+            self.last_step = self.clock.offset() - before
+            self.check()                    # re-key now, not at the next wake
+            print(self.report())
+            return ok
+
+    def _sync(self):
+        if self.sh(["sudo", "-n", "timedatectl", "set-ntp", "true"])[0]:
+            return False
+        t_end = time.monotonic() + SYNC_WAIT_S
+        while self.sh(["timedatectl", "show", "-p", "NTPSynchronized", "--value"])[1] != "yes":
+            if time.monotonic() > t_end or self._stop.wait(1):
+                return False
+        now = self.clock.time()             # hwclock reports the RTC as of its call
+        rc, out = self.sh(["sudo", "-n", "hwclock", "--get"])
+        if rc == 0:
+            try:
+                self.rtc_err = datetime.fromisoformat(out).timestamp() - now
+            except ValueError:
+                print("Time sync error: can't read hwclock output", repr(out))
+            else:
+                if self._rtc_set is not None:
+                    self.drift_ppm = self.rtc_err / (now - self._rtc_set) * 1e6
+        if self.sh(["sudo", "-n", "hwclock", "--systohc"])[0] == 0:
+            self._rtc_set = self.clock.time()
+        return True
+
+    def report(self):
+        out = [f"{metrics.CLOCK_STEP.count} wall-clock steps"]
+        if self.last_step is not None:
+            out.append(f"last sync moved the clock {self.last_step:+.3f} s")
+        if self.rtc_err is not None:
+            out.append(f"RTC off by {self.rtc_err:+.3f} s")
+        if self.drift_ppm is not None:
+            out.append(f"RTC drift {self.drift_ppm:+.1f} ppm")
+        return "[time] " + ", ".join(out)
+
+# ───────── simulated check ─────────
+if __name__ == "__main__":
+    import heapq, os
+    os.environ["TZ"] = "Europe/Berlin"      # has DST
+    time.tzset()
+    from alarm_scheduler import AlarmScheduler, SimClock, MISS_GRACE_S
+
+    def at(*ymdhm):
+        return datetime(*ymdhm).timestamp()
+
+    # -- forward step: each job fires at most once, one push per job hit --
+    clk = SimClock(at(2025, 1, 6, 7, 0))                # Monday 07:00
+    sched = AlarmScheduler(clk)
+    fired = []
+    note = lambda name: fired.append((name, datetime.fromtimestamp(clk.time())))
+    sched.add_many(sched.make_once(at(2026, 1, 1) + i, note, "far") for i in range(10_000))
+    sched.every(None, "08:00", note, "daily 08")        # jumped over
+    sched.every(None, "20:00", note, "daily 20")        # jumped over
+    sched.every(None, "06:50", note, "daily 0650")      # jumped over, last run within grace
+    sched.every("Tuesday", "08:00", note, "tue")        # jumped over
+    sched.once(at(2025, 1, 7, 12, 0), note, "once tue") # jumped over → missed
+    sched.once(at(2025, 1, 9, 6, 55), note, "once thu") # within grace → fires
+    sched.every("Friday", "08:00", note, "fri")         # after the step, untouched
+    sched.run_until(clk.time())                         # scheduler's first look
+    heap0 = len(sched._heap)
+    clk.step(3 * 86400)                                 # NTP: it's really Thursday
+    t0 = time.perf_counter()
+    step = sched.check_clock()
+    dt = time.perf_counter() - t0
+    pushed = len(sched._heap) - heap0
+    sched.run_until(clk.time())
+    assert step == 3 * 86400
+    assert sorted(n for n, _ in fired) == ["daily 0650", "once thu"], fired
+    assert pushed == 4, pushed                          # 5 hit, one a dropped one-shot
+    t0 = time.perf_counter()
+    heapq.heapify(list(sched._heap))
+    rebuild = time.perf_counter() - t0
+    print(f"+3 d step: {pushed} of {len(sched.jobs())} jobs re-keyed in {dt*1e6:.0f} us "
+          f"(heapify alone {rebuild*1e6:.0f} us), fired once each: "
+          + ", ".join(n for n, _ in fired))
+    fired.clear()
+    sched.run_until(at(2025, 1, 10, 9, 0))
+    assert [n for n, _ in fired] == ["daily 08", "daily 20", "daily 0650", "daily 08", "fri"], fired
+
+    # -- backward step: the replayed hour does not fire again --
+    sched.run_until(at(2025, 1, 11, 8, 30))             # Saturday 08:00 fired
+    fired.clear()
+    clk.step(-3600)                                     # back to 07:30
+    sched.run_until(at(2025, 1, 11, 9, 0))
+    assert fired == [], fired
+    print("-1 h step: 08:00 fired once, not replayed")
+
+    # -- small corrections are not steps --
+    clk.step(1.5)
+    assert sched.check_clock() == 0.0
+    assert MISS_GRACE_S > 60
+
+    # -- DST: 08:00 local every day across both changes, no step seen --
+    for start in (at(2025, 3, 25), at(2025, 10, 20)):
+        clk = SimClock(start)
+        sched = AlarmScheduler(clk)
+        hours = []
+        sched.every(None, "08:00", lambda: hours.append(datetime.fromtimestamp(clk.time()).hour))
+        sched.run_until(start + 12 * 86400)
+        assert hours == [8] * 12, hours
+    print(f"DST: daily 08:00 fired at 08:00 local on all 24 days, "
+          f"{metrics.CLOCK_STEP.count} steps counted in total")
+
+    # -- sync: NTP moves the clock, RTC drift from two reads a day apart --
+    clk = SimClock(at(2025, 1, 6, 7, 0))
+    sched = AlarmScheduler(clk)
+    rtc = {"err": 0.0}
+
+    def sh(argv):
+        if argv[-1] == "true":
+            clk.step(.8)                    # NTP steps the clock on
+        elif argv[-1] == "--get":
+            return 0, datetime.fromtimestamp(clk.time() + rtc["err"]).astimezone().isoformat(" ")
+        elif argv[-1] == "--systohc":
+            rtc["err"] = 0.0
+        return 0, "yes"
+
+    svc = TimeService(sched, sh)
+    assert svc.sync() and abs(svc.last_step - .8) < 1e-6
+    clk.advance(86400)
+    rtc["err"] = -1.728                     # RTC lost 20 ppm over the day
+    assert svc.sync()
+    assert abs(svc.drift_ppm + 20) < .1, svc.drift_ppm
+    svc.sh = lambda argv: (1, "")
+    assert not svc.sync()
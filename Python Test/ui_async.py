@@ -0,0 +1,122 @@
+"""
+ui_async.py
+————————
+Keep blocking work off the Kivy thread.
+  • run_io(fn, *args, then=cb)  – device I/O (LED, mixer, SQLite) on one
+                                  serial worker, so calls keep their order
+  • run_bg(fn, *args, then=cb)  – subprocesses / slow one-offs
+  `then(result)` always runs back on the Kivy thread (Clock.schedule_once).
+  • FrameMonitor – records frames over 16 ms and which of our callbacks
+                   was on the UI thread's stack at the time; optional
+                   on-screen overlay
+"""
+
+import os, sys, threading, time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from kivy.clock import Clock
+
+import metrics
+
+_io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="hw-io")
+_bg = ThreadPoolExecutor(max_workers=2, thread_name_prefix="bg")
+
+def _submit(pool, fn, args, then):
+    def done(fut):
+        try:
+            res = fut.result()
+        except Exception as e:
+            metrics.ERRORS.inc("io")
+            print("I/O error:", e)
+            return
+        if then is not None:
+            Clock.schedule_once(lambda dt: then(res), 0)
+    fut = pool.submit(fn, *args)
+    fut.add_done_callback(done)
+    return fut
+
+def run_io(fn, *args, then=None):
+    return _submit(_io, fn, args, then)
+
+def run_bg(fn, *args, then=None):
+    return _submit(_bg, fn, args, then)
+
+# ───────── frame-time instrumentation ─────────
+class FrameMonitor:
+    """A heartbeat runs every frame on the Kivy thread.  A sampler thread
+    watches it; while a frame is overdue it samples the UI thread's stack
+    and tallies the first frame from our own source files that Kivy
+    called into – that is the callback holding the frame."""
+
+    def __init__(self, budget_ms=16.0, sample_ms=4.0, keep=200, src_dir=None):
+        self.budget  = budget_ms / 1000
+        self.sample  = sample_ms / 1000
+        self.stalls  = deque(maxlen=keep)       # (wall time, frame ms, culprit)
+        self.frames  = 0
+        self.src_dir = src_dir or os.path.dirname(os.path.abspath(__file__))
+        self._last   = None
+        self._hits   = Counter()
+        self._ui_id  = None
+        self._run    = False
+        self.label   = None
+
+    def start(self, overlay=False):
+        self._ui_id = threading.get_ident()     # call from the Kivy thread
+        self._last  = time.perf_counter()
+        self._run   = True
+        Clock.schedule_interval(self._tick, 0)
+        threading.Thread(target=self._sampler, daemon=True).start()
+        if overlay:
+            from kivy.core.window import Window
+            from kivy.uix.label import Label
+            self.label = Label(text="frames ok", font_size="11sp", size_hint=(None, None),
+                               size=(320, 20), pos=(4, 4), color=(1, 1, .4, 1))
+            Window.add_widget(self.label)
+
+    def stop(self):
+        self._run = False
+        Clock.unschedule(self._tick)
+
+    def _tick(self, _dt):
+        now = time.perf_counter()
+        frame = now - self._last
+        self._last = now
+        self.frames += 1
+        if frame > self.budget:
+            culprit = self._hits.most_common(1)[0][0] if self._hits else "?"
+            self.stalls.append((time.time(), frame * 1000, culprit))
+            if self.label is not None:
+                self.label.text = f"stalls {len(self.stalls)}  last {frame*1000:.0f} ms  {culprit}"
+        self._hits.clear()
+
+    def _sampler(self):
+        while self._run:
+            time.sleep(self.sample)
+            if time.perf_counter() - self._last > self.budget:
+                frame = sys._current_frames().get(self._ui_id)
+                if frame is not None:
+                    self._hits[self._culprit(frame)] += 1
+
+    def _ours(self, frame):
+        fn = frame.f_code.co_filename
+        return fn.startswith(self.src_dir) and fn != __file__
+
+    def _culprit(self, frame):
+        stack = []
+        while frame is not None:
+            stack.append(frame); frame = frame.f_back
+        stack.reverse()                         # outermost first: app.run() …
+        in_kivy = False
+        for f in stack:
+            if not self._ours(f):
+                in_kivy = True                  # inside Kivy's event loop
+            elif in_kivy:                       # first of ours called back by Kivy
+                return f"{os.path.basename(f.f_code.co_filename)}:{f.f_code.co_name}:{f.f_lineno}"
+        return "kivy"
+
+    def summary(self):
+        worst = sorted(self.stalls, key=lambda s: -s[1])[:5]
+        lines = [f"{self.frames} frames, {len(self.stalls)} over {self.budget*1000:.0f} ms"]
+        lines += [f"  {ms:6.1f} ms  {who}" for _, ms, who in worst]
+        return "\n".join(lines)